@@ -0,0 +1,230 @@
+import os
+import sys
+import csv
+import json
+import math
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+from algorithm.keyword_expansion import expand_to_keywords, get_model, query_embedding, MODEL_NAME
+from algorithm import scrape_reddit, traffic_counter, spike_detector, scrape_etfs, etf_selector, metrics, events
+from algorithm.inference import Workspace, NUM_KEYWORDS, parse_run_params, publish_markdown, validate_input, write_result
+
+QUERIES_FILE = os.path.join("tmp", "queries.txt")
+BETA = spike_detector.BETA
+SUMMARY_ETFS = 3
+
+
+def parse_queries(text: str):
+    """One query per line; blank lines and '#' comments are skipped. Raises ValueError naming bad lines."""
+    queries, bad = [], []
+    for n, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if validate_input(line):
+            queries.append(line)
+        else:
+            bad.append(n)
+    if bad:
+        raise ValueError(f"Invalid queries on line(s) {', '.join(map(str, bad))}")
+    if not queries:
+        raise ValueError("No queries given")
+    return queries
+
+
+def load_queries(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_queries(f.read())
+
+
+def run_batch(queries, progress=None, workspace: Workspace = None,
+              num_months: int = None, sample_per_week: int = None) -> str:
+    """
+    Batch pipeline for many queries over one shared corpus:
+    1) Expand every query's keywords
+    2) Scrape (or refresh the cached) HN sample once, `num_months` months
+       at `sample_per_week` posts per week
+    3) Count traffic for all queries in a single scan, one month partition at a time
+    4) Detect spikes for all series at once (spike_detector.detect_spikes_batch)
+    5) Rank ETFs for every query from one shared index
+    Each query is published as its own result folder; the batch folder
+    (whose run id is returned) holds summary.csv, summary.json, metrics.json
+    and an output.md table linking to them. `queries` may be a list or
+    newline-separated text.
+    """
+    def log(msg: str):
+        print(f"[batch] {msg}")
+        sys.stdout.flush()
+        if progress:
+            progress(msg)
+
+    if isinstance(queries, str):
+        queries = parse_queries(queries)
+    params = parse_run_params(num_months, sample_per_week)
+    ws = workspace or Workspace()
+    run = metrics.RunMetrics()
+    try:
+        with metrics.recording(run):
+            _run_batch(queries, log, ws, run, **params)
+    finally:
+        with open(ws.result("metrics.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(run.as_dict(), run_id=ws.run_id), f, indent=2)
+    return ws.run_id
+
+
+def _run_batch(queries, log, ws: Workspace, run: metrics.RunMetrics,
+               num_months: int, sample_per_week: int) -> None:
+    timings = {}
+
+    def timed(stage: str, fn, *args, **kwargs):
+        with run.stage(stage):
+            result = fn(*args, **kwargs)
+        timings[stage] = run.stages[stage]["wall_seconds"]
+        print(f"[batch] {stage}: {timings[stage]:.2f}s")
+        events.emit("timing", stage=stage, seconds=timings[stage])
+        return result
+
+    def expand_all():
+        return [expand_to_keywords([p.strip() for p in q.split(",")], num_keywords=NUM_KEYWORDS)
+                for q in queries]
+
+    log(f"Building Keywords for {len(queries)} queries...")
+    keyword_sets = timed("keywords", expand_all)
+
+    log("Scraping Reddit...")
+    cached = timed("scrape", scrape_reddit.refresh_cache, scrape_reddit.recent_months(num_months),
+                   sample_per_week=sample_per_week)
+    if not sum(cached.values()):
+        raise RuntimeError("No HN data fetched; check your network or API limits.")
+    run.record("scrape", rows=sum(cached.values()))
+
+    log("Counting Traffic...")
+    posts = scrape_reddit.partition_files(cached, sample_per_week=sample_per_week)
+    series, months = timed("count", traffic_counter.count_traffic_multi, posts, keyword_sets)
+    events.emit("counted", rows=sum(cached.values()), months=len(months))
+    if len(months) < 2:
+        raise RuntimeError(f"Need at least two months of data, but found {len(months)}")
+    # like a single run, a query needs hits in at least two months to be screened
+    for query, rows in zip(queries, series):
+        if len(rows) < 2:
+            log(f"Skipping {query!r}: need at least two months of data, but found {len(rows)}")
+    kept = [i for i, rows in enumerate(series) if len(rows) >= 2]
+    if not kept:
+        raise RuntimeError("No query has at least two months of data")
+    queries = [queries[i] for i in kept]
+    keyword_sets = [keyword_sets[i] for i in kept]
+    series = [series[i] for i in kept]
+
+    log("Analyze Time Series...")
+    reports = timed("spikes", detect_all, series)
+
+    log("Pulling ETFs...")
+    etf_df = timed("etf_scrape", scrape_etfs.fetch_etfs)
+    etfs = etf_selector.etf_records(etf_df.fillna("").to_dict("records"))
+    etf_index = timed("etf_index", etf_selector.index_for, etfs, model=get_model, model_name=MODEL_NAME)
+
+    def select_all():
+        for report, keywords in zip(reports, keyword_sets):
+            query_text = " ".join(k.strip() for k in keywords if k.strip())
+            query_vec = query_embedding(keywords) if etf_index.semantic is not None else None
+            report["relevant_etfs"] = ",".join(etf_index.query(query_text, query_vec=query_vec))
+    timed("etf_select", select_all)
+
+    log("Writing Reports...")
+    for report in reports:
+        report.update(num_months=num_months, sample_per_week=sample_per_week)
+    summary = timed("reports", write_reports, queries, reports, series, ws.run_id)
+    write_summary(ws, summary, timings)
+
+    log("Batch complete ✔")
+
+
+def detect_all(series):
+    """
+    Spike reports for every query's (year, month, avg_per_day) rows, running
+    detect_spikes_batch once per distinct month list (usually just one).
+    """
+    groups = defaultdict(list)
+    for i, rows in enumerate(series):
+        groups[tuple((year, month) for year, month, _ in rows)].append(i)
+    reports = [None] * len(series)
+    for members in groups.values():
+        rates = np.array([[rate for _, _, rate in series[i]] for i in members])
+        for i, report in zip(members, spike_detector.detect_spikes_batch(rates, BETA)):
+            reports[i] = report
+    return reports
+
+
+def without_nan(report: dict) -> dict:
+    """
+    The report with NaN and infinite statistics as None (null in JSON): a
+    baseline too short for a stdev leaves the threshold and z-scores NaN,
+    and one with no spread makes z-scores infinite
+    """
+    return {k: None if isinstance(v, float) and not math.isfinite(v) else v for k, v in report.items()}
+
+
+def rounded(value, digits: int):
+    return None if value is None else round(value, digits)
+
+
+def write_reports(queries, reports, series, batch_id: str):
+    """Publish one result folder per query; returns the summary rows"""
+    summary = []
+    for query, report, rows in zip(queries, reports, series):
+        query_ws = Workspace()
+        plot_path = query_ws.result("spike_plot.png")
+        dates = [datetime(year, month, 1) for year, month, _ in rows]
+        rates = [rate for _, _, rate in rows]
+        spike_detector.plot_timeseries(dates, rates, report, report["threshold"], BETA, plot_path)
+        report = without_nan(report)
+        report.update(year=rows[-1][0], month=rows[-1][1], plot_path=plot_path, batch=batch_id)
+        write_result(query_ws, query, report)
+        summary.append({
+            "query": query,
+            "recommendation": report["recommendation"],
+            "latest_rate": report["latest_rate"],
+            "threshold": rounded(report["threshold"], 4),
+            "rolling_z": rounded(report["rolling_z"], 2),
+            "relevant_etfs": ",".join(report["relevant_etfs"].split(",")[:SUMMARY_ETFS]),
+            "folder": query_ws.run_id,
+        })
+    return summary
+
+
+def write_summary(ws: Workspace, summary, timings) -> None:
+    """summary.csv / summary.json plus an output.md table, straddle candidates first"""
+    summary = sorted(summary, key=lambda r: (r["recommendation"] != "straddle", -r["latest_rate"]))
+    with open(ws.result("summary.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(summary[0]))
+        writer.writeheader()
+        writer.writerows(summary)
+    with open(ws.result("summary.json"), "w", encoding="utf-8") as f:
+        json.dump({"queries": summary, "stage_seconds": timings}, f, indent=2, allow_nan=False)
+
+    md_lines = [f"# Batch Traffic Spike Screen ({len(summary)} queries)", ""]
+    md_lines.append(f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    md_lines.append("")
+    md_lines.append("| Query | Recommendation | Latest rate | Threshold | Rolling z | ETFs |")
+    md_lines.append("|:------|:---------------|------------:|----------:|----------:|:-----|")
+    for row in summary:
+        md_lines.append(f"| [{row['query']}](/result/{row['folder']}) | {row['recommendation']} | "
+                        f"{row['latest_rate']} | {row['threshold']} | {row['rolling_z']} | {row['relevant_etfs']} |")
+    md_lines.append("")
+    md_lines.append("## Stage Timings")
+    md_lines.append("")
+    md_lines.append("| Stage            | Seconds    |")
+    md_lines.append("|:-----------------|-----------:|")
+    for stage, seconds in timings.items():
+        md_lines.append(f"| {stage} | {seconds:.2f} |")
+    publish_markdown(ws.result_dir, "\n".join(md_lines))
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else QUERIES_FILE
+    run_id = run_batch(load_queries(path))
+    print(f"[batch] summary: {os.path.join(Workspace(run_id).result_dir, 'output.md')}")
+
+if __name__ == '__main__':
+    main()
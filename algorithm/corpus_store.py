@@ -0,0 +1,98 @@
+import os
+import re
+import html
+import pandas as pd
+
+# column order of the hn_raw_posts schema
+COLUMNS = ["year", "month", "id", "created_at", "type", "title", "url", "body", "score", "num_comments"]
+COMPRESSION = "zstd"
+COMPRESSION_LEVEL = 6
+# bumped whenever stored partitions need rewriting (scrape_reddit migrates older ones in place)
+FORMAT_VERSION = 2
+
+_BLOCK_TAG = re.compile(r"<(?:p|br|/?pre|/?div|/?li)\b[^>]*>", flags=re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+
+
+def schema():
+    """
+    The compact corpus schema: small ints for year/month, integer ids and
+    epoch-second timestamps, and `type` dictionary-encoded (read back as a
+    pandas categorical). Text columns are plain strings; zstd compresses them.
+    """
+    import pyarrow as pa
+    return pa.schema([
+        ("year", pa.int16()),
+        ("month", pa.int8()),
+        ("id", pa.int64()),
+        ("created_at", pa.int64()),
+        ("type", pa.dictionary(pa.int8(), pa.string())),
+        ("title", pa.string()),
+        ("url", pa.string()),
+        ("body", pa.string()),
+        ("score", pa.int32()),
+        ("num_comments", pa.int32()),
+    ])
+
+
+def html_to_text(text) -> str:
+    """Algolia's comment/story HTML as plain text: paragraphs become newlines, tags go, entities are decoded"""
+    if not isinstance(text, str):
+        return ""
+    if "<" not in text and "&" not in text:
+        return text
+    return html.unescape(_TAG.sub("", _BLOCK_TAG.sub("\n", text)))
+
+
+def compact_posts(df):
+    """
+    Ingest-time cleanup of raw posts: bodies stripped to plain text, one row
+    per id (the last fetched wins) and the column types of schema().
+    Run it once per fetched batch; stored partitions are already compact.
+    """
+    df = df.reindex(columns=COLUMNS)
+    ids = pd.to_numeric(df["id"], errors="coerce").astype("Int64")
+    keep = ~(ids.notna() & ids.duplicated(keep="last")).to_numpy()
+    df = df[keep]
+    return pd.DataFrame({
+        "year": pd.to_numeric(df["year"]).astype("int16"),
+        "month": pd.to_numeric(df["month"]).astype("int8"),
+        "id": ids[keep],
+        "created_at": pd.to_numeric(df["created_at"], errors="coerce").astype("Int64"),
+        "type": df["type"].astype("category"),
+        "title": df["title"].fillna("").astype(str),
+        "url": df["url"].fillna("").astype(str),
+        "body": df["body"].map(html_to_text),
+        "score": pd.to_numeric(df["score"], errors="coerce").fillna(0).astype("int32"),
+        "num_comments": pd.to_numeric(df["num_comments"], errors="coerce").fillna(0).astype("int32"),
+    }).reset_index(drop=True)
+
+
+def merge_posts(old, new):
+    """Compact `new` posts appended to compact `old` ones, the newer copy of a repeated id winning"""
+    df = pd.concat([old, new], ignore_index=True)
+    return df[~(df["id"].notna() & df["id"].duplicated(keep="last")).to_numpy()].reset_index(drop=True)
+
+
+def to_table(df):
+    """A compact DataFrame as an Arrow table of schema()"""
+    import pyarrow as pa
+    return pa.Table.from_pandas(df[COLUMNS], schema=schema(), preserve_index=False)
+
+
+def write_posts(df, path: str) -> None:
+    """Write compact posts as one zstd Parquet file, atomically"""
+    import pyarrow.parquet as pq
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(to_table(df), tmp_path, compression=COMPRESSION, compression_level=COMPRESSION_LEVEL)
+    os.replace(tmp_path, path)
+
+
+def read_posts(path: str, columns=None):
+    """
+    A stored partition (optionally only `columns`) as a DataFrame. The file is
+    memory-mapped rather than read into a buffer first, and only the
+    requested columns are decompressed.
+    """
+    import pyarrow.parquet as pq
+    return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
@@ -0,0 +1,42 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+
+class TTLCache:
+    """
+    JSON values on disk, one file per key, that expire `ttl` seconds after being written.
+    The directory is created on the first write.
+    """
+
+    def __init__(self, cache_dir: str, ttl: float):
+        self.dir = cache_dir
+        self.ttl = ttl
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str):
+        """Return the cached value, or None if it is missing or expired"""
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) >= self.ttl:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, value) -> None:
+        """Write atomically; concurrent writers of one key (threads or processes) each use their own temp file"""
+        os.makedirs(self.dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
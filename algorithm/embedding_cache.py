@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import fcntl
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import List
+import numpy as np
+from algorithm import metrics
+
+CACHE_DIR = os.path.join("tmp", "embedding_cache")
+MAX_ROWS = 50000
+BATCH_SIZE = 64
+GROW_ROWS = 1024
+# how often recency from cache hits alone is written back to index.json
+INDEX_FLUSH_SECONDS = 60
+
+
+def normalize(text: str) -> str:
+    """Cache key for a string: NFKC form with whitespace collapsed"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding store for one SentenceTransformer model.
+
+    Vectors live in a memory-mapped float32 matrix (vectors.f32) and index.json
+    maps each normalized string to its row. Only strings not already cached are
+    encoded, in batches of `batch_size`, outside any lock. When more than
+    `max_rows` strings are stored, the least recently used rows are reused;
+    recency is approximate, since hits only reach index.json every
+    INDEX_FLUSH_SECONDS. An flock on the cache directory keeps concurrent
+    processes from handing out the same row twice.
+    """
+
+    def __init__(self, model, model_name: str, cache_dir: str = CACHE_DIR,
+                 max_rows: int = MAX_ROWS, batch_size: int = BATCH_SIZE):
+        self.model = model
+        self.dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.dim = model.get_sentence_embedding_dimension()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.index_path = os.path.join(self.dir, "index.json")
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.rows = {}
+        self.last_used = {}
+        self.tick = 0
+        self.touched = set()
+        self.saved_at = time.monotonic()
+        self.index_mtime = None
+        self.vectors = None
+        os.makedirs(self.dir, exist_ok=True)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "rows": len(self.rows)}
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Return a (len(texts), dim) float32 array, encoding only cache misses"""
+        keys = [normalize(t) for t in texts]
+        out = np.empty((len(keys), self.dim), dtype=np.float32)
+        with self._locked():
+            self._load_index()
+            cached = [i for i, k in enumerate(keys) if k in self.rows]
+            if cached:
+                out[cached] = self.vectors[[self.rows[keys[i]] for i in cached]]
+            self.hits += len(cached)
+            self.misses += len(keys) - len(cached)
+            metrics.count("embedding_cache_hits", len(cached))
+            metrics.count("embedding_cache_misses", len(keys) - len(cached))
+            self.tick += 1
+            for i in cached:
+                self.last_used[keys[i]] = self.tick
+                self.touched.add(keys[i])
+            if len(cached) == len(keys):
+                # hits only change recency, which is written back occasionally rather than on every call
+                if self.touched and time.monotonic() - self.saved_at >= INDEX_FLUSH_SECONDS:
+                    self._save_index()
+                return out
+            missing = list(dict.fromkeys(k for k in keys if k not in self.rows))
+        # encode without holding the locks, so other threads and processes are not queued behind the model
+        encoded = dict(zip(missing, self._encode(missing)))
+        for i, k in enumerate(keys):
+            if k in encoded:
+                out[i] = encoded[k]
+        with self._locked():
+            self._load_index()
+            self._insert({k: v for k, v in encoded.items() if k not in self.rows}, keys)
+            self._save_index()
+        return out
+
+    @contextmanager
+    def _locked(self):
+        """This process's threads and other processes take turns through here"""
+        with self.lock, open(os.path.join(self.dir, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _encode(self, texts):
+        if len(set(texts)) > self.max_rows:
+            raise ValueError(f"Cannot cache {len(set(texts))} strings with max_rows={self.max_rows}")
+        metrics.count("embedding_batches", -(-len(texts) // self.batch_size))
+        return self.model.encode(texts, batch_size=self.batch_size,
+                                 convert_to_numpy=True, show_progress_bar=False)
+
+    def _insert(self, encoded, pinned):
+        """Store encoded {key: vector} in free or least recently used rows"""
+        if not encoded:
+            return
+        free = self._allocate(len(encoded), set(pinned))
+        if len(free) < len(encoded):
+            raise ValueError(f"Cannot cache {len(set(pinned))} strings with max_rows={self.max_rows}")
+        self._ensure_capacity(max(free) + 1)
+        self.tick += 1
+        for (key, vec), row in zip(encoded.items(), free):
+            self.rows[key] = row
+            self.last_used[key] = self.tick
+            self.vectors[row] = vec
+        self.vectors.flush()
+
+    def _allocate(self, n, pinned):
+        """Pick n rows: unused ones first, then the least recently used unpinned ones"""
+        used = set(self.rows.values())
+        free = [r for r in range(len(self.rows) + n) if r not in used][:n]
+        free = [r for r in free if r < self.max_rows]
+        if len(free) < n:
+            victims = sorted((k for k in self.rows if k not in pinned), key=lambda k: self.last_used.get(k, 0))
+            for key in victims[:n - len(free)]:
+                free.append(self.rows.pop(key))
+                self.last_used.pop(key, None)
+        return free
+
+    def _ensure_capacity(self, rows):
+        current = self.vectors.shape[0] if self.vectors is not None else 0
+        if rows <= current:
+            return
+        rows = min(self.max_rows, max(rows, current + GROW_ROWS))
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(rows * self.dim * 4)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        mtime = os.stat(self.index_path).st_mtime_ns
+        if mtime != self.index_mtime:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data["dim"] != self.dim:
+                raise ValueError(f"Embedding cache at {self.dir} has dim {data['dim']}, model has {self.dim}")
+            self.rows = data["rows"]
+            self.last_used = data["last_used"]
+            self.tick = data["tick"]
+            self.index_mtime = mtime
+            # keep the recency of this process's hits that were not written back yet
+            for key in self.touched & self.rows.keys():
+                self.last_used[key] = self.tick
+        rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+        if self.vectors is None or self.vectors.shape[0] != rows:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(rows, self.dim))
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "tick": self.tick, "rows": self.rows,
+                       "last_used": self.last_used}, f)
+        os.replace(tmp_path, self.index_path)
+        self.index_mtime = os.stat(self.index_path).st_mtime_ns
+        self.touched.clear()
+        self.saved_at = time.monotonic()
+
+
+def cosine_scores(matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every row of `matrix` to `query` in one matmul"""
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    return (matrix @ query) / np.where(norms == 0, 1, norms)
@@ -2,13 +2,33 @@
 import os
 import json
 import csv
+import hashlib
+import threading
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
 REPORT_JSON    = "tmp/spike_report.json"
 ETF_CSV        = "tmp/etf_list_us_canada_final.csv"
 KEYWORDS_FILE  = "tmp/keywords.txt"
+INDEX_PATH     = "tmp/etf_index.joblib"
+EMBED_INDEX_PATH = "tmp/etf_embeddings.joblib"
 TOP_N          = 10
+# "hybrid" blends embedding and TF-IDF similarity when a model is given; "tfidf" ranks on shared words only
+ETF_RANKER     = os.environ.get("ETF_RANKER", "hybrid")
+SEMANTIC_WEIGHT = 0.7
+# keep ETF embeddings as int8 (a quarter of the memory and disk); scored SCORE_BLOCK_ROWS rows at a time
+QUANTIZE_EMBEDDINGS = bool(os.environ.get("ETF_QUANTIZE"))
+SCORE_BLOCK_ROWS = 4096
+ENCODE_BATCH_SIZE = 64
+# universes at least this large also get an inverted-file index: k-means clusters of the
+# embeddings, of which a query scores only the ANN_NPROBE closest
+ANN_MIN_ETFS   = 20000
+ANN_NPROBE     = 8
+# TF-IDF matches added to the ANN candidates, per requested result
+ANN_LEXICAL_CANDIDATES = 5
 
 def load_json(path):
     if not os.path.exists(path):
@@ -27,26 +47,28 @@ def load_keywords(path):
         kws = [line.strip() for line in f if line.strip()]
     return " ".join(kws)
 
+def etf_records(rows):
+    """Turn Name/Ticker/Sector rows (CSV dicts or DataFrame records) into ticker + text entries"""
+    etfs = []
+    for row in rows:
+        text = f"{row.get('Name') or ''} {row.get('Sector') or ''}".strip()
+        etfs.append({
+            "ticker": row.get("Ticker") or "",
+            "text": text
+        })
+    return etfs
+
 def load_etfs(path):
     if not os.path.exists(path):
         raise FileNotFoundError(f"ETF CSV not found at {path}")
-    etfs = []
     with open(path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            text = f"{row.get('Name','')} {row.get('Sector','')}".strip()
-            etfs.append({
-                "ticker": row.get("Ticker",""),
-                "text": text
-            })
-    return etfs
+        return etf_records(csv.DictReader(f))
 
-def main():
-    report = load_json(REPORT_JSON)
-
-    query_text = load_keywords(KEYWORDS_FILE)
+def select_etfs(query_text, etfs, top_n=TOP_N):
+    """Return up to top_n tickers whose text is most TF-IDF similar to query_text.
 
-    etfs = load_etfs(ETF_CSV)
+    Refits the vectorizer on every call; ETFIndex is the precomputed equivalent.
+    """
     texts = [e["text"] for e in etfs]
 
     vectorizer = TfidfVectorizer(stop_words="english")
@@ -56,10 +78,236 @@ def main():
 
     sims = cosine_similarity(query_vec, etf_vecs)[0]
 
-    top_idxs = sims.argsort()[::-1][:TOP_N]
-    top_tickers = [etfs[i]["ticker"] for i in top_idxs if sims[i] > 0]
+    top_idxs = sims.argsort()[::-1][:top_n]
+    return [etfs[i]["ticker"] for i in top_idxs if sims[i] > 0]
+
+def top_n_indices(scores, top_n):
+    """Indices of the top_n highest scores, best first, without a full sort"""
+    if len(scores) <= top_n:
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, top_n - 1)[:top_n]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+def etf_fingerprint(etfs):
+    digest = hashlib.sha1()
+    for e in etfs:
+        digest.update(f"{e['ticker']}\t{e['text']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+class ETFIndex:
+    """
+    TF-IDF vectorizer fitted once on the ETF universe plus its L2-normalized
+    document matrix, so a query costs one transform and one sparse dot product.
+    """
+
+    def __init__(self, vectorizer, matrix, tickers, fingerprint):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.tickers = tickers
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, etfs):
+        vectorizer = TfidfVectorizer(stop_words="english")
+        matrix = vectorizer.fit_transform([e["text"] for e in etfs]).tocsr()
+        return cls(vectorizer, matrix, [e["ticker"] for e in etfs], etf_fingerprint(etfs))
+
+    def save(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump({"vectorizer": self.vectorizer, "matrix": self.matrix,
+                     "tickers": self.tickers, "fingerprint": self.fingerprint}, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        # mmap_mode maps the matrix's numpy buffers instead of copying them
+        data = joblib.load(path, mmap_mode="r")
+        return cls(data["vectorizer"], data["matrix"], data["tickers"], data["fingerprint"])
+
+    def scores(self, query_text):
+        """Cosine similarity of query_text to every ETF"""
+        query_vec = self.vectorizer.transform([query_text])
+        return (self.matrix @ query_vec.T).toarray().ravel()
+
+    def query(self, query_text, top_n=TOP_N):
+        """Return up to top_n tickers with positive cosine similarity to query_text"""
+        sims = self.scores(query_text)
+        return [self.tickers[i] for i in top_n_indices(sims, top_n) if sims[i] > 0]
+
+def unit_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+def build_ivf(vectors, seed=0):
+    """k-means (about sqrt(n) clusters) over the embeddings: centroids, rows ordered by cluster, cluster offsets"""
+    n_clusters = max(1, int(np.sqrt(len(vectors))))
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, n_init=3, batch_size=4096).fit(vectors)
+    order = np.argsort(kmeans.labels_, kind="stable")
+    offsets = np.searchsorted(kmeans.labels_[order], np.arange(n_clusters + 1))
+    return {"centroids": unit_rows(kmeans.cluster_centers_), "order": order, "offsets": offsets}
+
+class EmbeddingIndex:
+    """
+    Unit-length sentence embeddings of every ETF's text, computed once per ETF
+    list and model and persisted, so a query costs one matrix-vector product.
+    With `quantize`, rows are stored as int8 with a per-row scale and
+    dequantized block by block while scoring. Large universes also carry an
+    inverted-file index (build_ivf) that narrows a query to a few clusters.
+    """
+
+    def __init__(self, vectors, scales, texts, fingerprint, model_name, ivf=None):
+        self.vectors = vectors
+        self.scales = scales
+        self.texts = texts
+        self.fingerprint = fingerprint
+        self.model_name = model_name
+        self.ivf = ivf
+
+    @classmethod
+    def build(cls, etfs, model, model_name, quantize=QUANTIZE_EMBEDDINGS, previous=None):
+        """Encode the ETF texts, reusing the vectors of any text already in `previous` (same model)"""
+        texts = [e["text"] for e in etfs]
+        known = {}
+        if previous is not None and previous.model_name == model_name:
+            known = {t: i for i, t in enumerate(previous.texts)}
+        missing = list(dict.fromkeys(t for t in texts if t not in known))
+        encoded = {}
+        if missing:
+            vectors = model.encode(missing, batch_size=ENCODE_BATCH_SIZE, convert_to_numpy=True,
+                                   show_progress_bar=False)
+            encoded = dict(zip(missing, unit_rows(vectors)))
+        dim = model.get_sentence_embedding_dimension()
+        vectors = np.zeros((len(texts), dim), dtype=np.float32)
+        reused = [i for i, t in enumerate(texts) if t not in encoded]
+        if reused:
+            vectors[reused] = previous.dense([known[texts[i]] for i in reused])
+        for i, t in enumerate(texts):
+            if t in encoded:
+                vectors[i] = encoded[t]
+        ivf = build_ivf(vectors) if len(texts) >= ANN_MIN_ETFS else None
+        scales = None
+        if quantize:
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12).astype(np.float32) / 127
+            vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+        return cls(vectors, scales, texts, etf_fingerprint(etfs), model_name, ivf)
+
+    def save(self, path=EMBED_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump({"vectors": self.vectors, "scales": self.scales, "texts": self.texts,
+                     "fingerprint": self.fingerprint, "model_name": self.model_name, "ivf": self.ivf}, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=EMBED_INDEX_PATH):
+        data = joblib.load(path, mmap_mode="r")
+        return cls(data["vectors"], data["scales"], data["texts"], data["fingerprint"],
+                   data["model_name"], data["ivf"])
+
+    def dense(self, rows):
+        """float32 vectors of `rows`"""
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+        return vectors if self.scales is None else vectors * self.scales[rows, None]
+
+    def scores(self, query_vec, rows=None):
+        """Cosine similarity of the unit-length query_vec to every ETF (or to `rows`)"""
+        if rows is not None:
+            return self.dense(rows) @ query_vec
+        if self.scales is None:
+            return np.asarray(self.vectors @ query_vec)
+        out = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(out), SCORE_BLOCK_ROWS):
+            block = slice(start, start + SCORE_BLOCK_ROWS)
+            out[block] = self.vectors[block].astype(np.float32) @ query_vec
+        return out * self.scales
+
+    def candidates(self, query_vec, nprobe=ANN_NPROBE):
+        """Rows in the `nprobe` clusters whose centroids are closest to query_vec"""
+        probe = top_n_indices(self.ivf["centroids"] @ query_vec, nprobe)
+        order, offsets = self.ivf["order"], self.ivf["offsets"]
+        return np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe])
+
+class ETFRanker:
+    """
+    Ranks ETFs for a query. Given the query's embedding and an EmbeddingIndex,
+    the score is SEMANTIC_WEIGHT * embedding similarity + the rest * TF-IDF
+    similarity, so "chip" still finds semiconductor funds while exact name
+    matches keep their edge; otherwise it falls back to TF-IDF alone.
+    """
+
+    def __init__(self, tfidf, semantic=None, weight=SEMANTIC_WEIGHT):
+        self.tfidf = tfidf
+        self.semantic = semantic
+        self.weight = weight
+        self.tickers = tfidf.tickers
+        self.fingerprint = tfidf.fingerprint
+
+    def query(self, query_text, top_n=TOP_N, query_vec=None):
+        """Return up to top_n tickers with a positive score for query_text (and query_vec)"""
+        if self.semantic is None or query_vec is None:
+            return self.tfidf.query(query_text, top_n)
+        query_vec = unit_rows(np.asarray(query_vec, dtype=np.float32))
+        lexical = self.tfidf.scores(query_text)
+        if self.semantic.ivf is None:
+            rows = np.arange(len(lexical))
+            semantic = self.semantic.scores(query_vec)
+        else:
+            rows = np.union1d(self.semantic.candidates(query_vec),
+                              top_n_indices(lexical, top_n * ANN_LEXICAL_CANDIDATES))
+            semantic = self.semantic.scores(query_vec, rows)
+        scores = self.weight * semantic + (1 - self.weight) * lexical[rows]
+        return [self.tickers[rows[i]] for i in top_n_indices(scores, top_n) if scores[i] > 0]
+
+_index_lock = threading.Lock()
+_loaded_index = None
+_loaded_embeddings = None
+
+def index_for(etfs, path=INDEX_PATH, model=None, model_name=None, embed_path=EMBED_INDEX_PATH):
+    """
+    The ETFRanker for this ETF list. Its ETFIndex (and, when a SentenceTransformer
+    `model` is given and ETF_RANKER is "hybrid", its EmbeddingIndex) is reused
+    in-process, else loaded from `path` (`embed_path`), else built and saved
+    there. A changed ETF list or model triggers a rebuild; embeddings of
+    unchanged ETF texts are reused. `model` may also be a function returning
+    the model, which is then only called (and the model loaded) when needed.
+    """
+    global _loaded_index, _loaded_embeddings
+    fingerprint = etf_fingerprint(etfs)
+    with _index_lock:
+        if _loaded_index is None or _loaded_index.fingerprint != fingerprint:
+            index = None
+            if os.path.exists(path):
+                index = ETFIndex.load(path)
+            if index is None or index.fingerprint != fingerprint:
+                index = ETFIndex.build(etfs)
+                index.save(path)
+            _loaded_index = index
+        if model is None or ETF_RANKER == "tfidf":
+            return ETFRanker(_loaded_index)
+
+        if callable(model) and not hasattr(model, "encode"):
+            model = model()
+        current = lambda e: e is not None and e.fingerprint == fingerprint and e.model_name == model_name
+        if not current(_loaded_embeddings):
+            previous = _loaded_embeddings
+            if os.path.exists(embed_path):
+                previous = EmbeddingIndex.load(embed_path)
+            if current(previous):
+                _loaded_embeddings = previous
+            else:
+                _loaded_embeddings = EmbeddingIndex.build(etfs, model, model_name, previous=previous)
+                _loaded_embeddings.save(embed_path)
+        return ETFRanker(_loaded_index, _loaded_embeddings)
+
+def main():
+    report = load_json(REPORT_JSON)
+
+    query_text = load_keywords(KEYWORDS_FILE)
+
+    etfs = load_etfs(ETF_CSV)
 
-    report["relevant_etfs"] = ",".join(top_tickers)
+    report["relevant_etfs"] = ",".join(index_for(etfs).query(query_text))
 
     save_json(report, REPORT_JSON)
 
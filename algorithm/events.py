@@ -0,0 +1,120 @@
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+# events each channel keeps; a viewer that falls further behind skips ahead
+HISTORY_EVENTS = 256
+# closed channels are kept this long for late viewers, and at most MAX_CHANNELS channels overall
+CHANNEL_TTL = 600
+MAX_CHANNELS = 512
+# a waiting subscriber wakes up this often with nothing new, so the stream can send a keepalive
+KEEPALIVE_SECONDS = 15
+# event kinds that end a job's stream
+TERMINAL = ("done", "failed")
+
+_current = contextvars.ContextVar("event_channel", default=None)
+
+
+class Channel:
+    """One job's recent events, as (id, kind, data) tuples with increasing ids"""
+
+    def __init__(self, lock, history: int):
+        self.events = deque(maxlen=history)
+        self.next_id = 1
+        self.closed_at = None
+        self.changed = threading.Condition(lock)
+
+
+class Broker:
+    """
+    In-memory pub/sub of job progress, one channel per job.
+
+    A channel holds only its last `history` events. Subscribers keep nothing
+    but a cursor into it and block on the channel's condition until it
+    changes, so memory does not grow with the number of viewers or with how
+    slowly they read, and idle viewers cost no work at all.
+    Channels live in the process that runs the job.
+    """
+
+    def __init__(self, history: int = HISTORY_EVENTS, ttl: float = CHANNEL_TTL, max_channels: int = MAX_CHANNELS):
+        self.history = history
+        self.ttl = ttl
+        self.max_channels = max_channels
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def open(self, name: str) -> None:
+        with self.lock:
+            self._expire()
+            self.channels[name] = Channel(self.lock, self.history)
+
+    def has(self, name: str) -> bool:
+        with self.lock:
+            return name in self.channels
+
+    def publish(self, name: str, kind: str, data: dict = None) -> None:
+        """Append an event to an open channel and wake its subscribers; a TERMINAL kind closes the channel"""
+        with self.lock:
+            channel = self.channels.get(name)
+            if channel is None or channel.closed_at is not None:
+                return
+            channel.events.append((channel.next_id, kind, data or {}))
+            channel.next_id += 1
+            if kind in TERMINAL:
+                channel.closed_at = time.time()
+            channel.changed.notify_all()
+
+    def subscribe(self, name: str, last_id: int = 0, keepalive: float = KEEPALIVE_SECONDS):
+        """
+        Yield the channel's events after `last_id`, then new ones as they are
+        published, ending after the channel closes; None is yielded after
+        `keepalive` seconds without news. Events are handed out after the
+        lock is released, so a slow reader never holds up publishers.
+        """
+        while True:
+            with self.lock:
+                channel = self.channels.get(name)
+                if channel is None:
+                    return
+                if channel.closed_at is None and (not channel.events or channel.events[-1][0] <= last_id):
+                    channel.changed.wait(keepalive)
+                pending = [event for event in channel.events if event[0] > last_id]
+                closed = channel.closed_at is not None
+            if not pending:
+                if closed:
+                    return
+                yield None
+                continue
+            yield from pending
+            last_id = pending[-1][0]
+
+    def _expire(self) -> None:
+        """Drop closed channels older than ttl, then the oldest closed ones while over max_channels"""
+        now = time.time()
+        closed = [n for n, c in self.channels.items() if c.closed_at is not None]
+        for name in closed:
+            if now - self.channels[name].closed_at > self.ttl or len(self.channels) >= self.max_channels:
+                del self.channels[name]
+
+
+BROKER = Broker()
+
+
+@contextmanager
+def publishing(name: str, broker: Broker = None):
+    """Make channel `name` the target of emit() calls in this thread"""
+    token = _current.set((broker or BROKER, name))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def emit(kind: str, **data) -> None:
+    """Publish a progress event to the job running in this thread, if any (a no-op outside jobs)"""
+    current = _current.get()
+    if current is not None:
+        broker, name = current
+        broker.publish(name, kind, data)
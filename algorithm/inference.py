@@ -1,11 +1,56 @@
 import os
 import sys
-import time
 import re
 import json
-import shutil
+import gzip
+import uuid
+import pstats
+import tempfile
+import cProfile
+import threading
+from functools import lru_cache
+from contextlib import contextmanager
 from datetime import datetime
-from algorithm.keyword_expansion import expand_to_keywords, save_keywords
+import markdown as md_lib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from algorithm.keyword_expansion import expand_to_keywords, save_keywords, get_model, query_embedding, MODEL_NAME
+from algorithm import scrape_reddit, traffic_counter, spike_detector, scrape_etfs, etf_selector, metrics, result_cache, events
+
+RUNS_DIR = os.path.join("tmp", "runs")
+RESULTS_DIR = os.path.join("static", "results")
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+# the finished page, rendered once when the report is written; app.show_result serves it as a file
+REPORT_PAGE = "report.html"
+MD_EXTENSIONS = ["fenced_code", "tables"]
+NUM_KEYWORDS = 100
+# Also write each stage's output into the run's workspace, as the old one-process-per-stage pipeline did
+WRITE_CHECKPOINTS = False
+# cProfile each run into its result folder (profile.pstats, profile.txt); one run at a time is profiled
+PROFILE_RUNS = bool(os.environ.get("PROFILE_RUNS"))
+PROFILE_TOP = 40
+
+_profile_lock = threading.Lock()
+
+
+class Workspace:
+    """
+    Everything one pipeline run writes: checkpoints under tmp/runs/<run_id>/ and
+    the published result folder static/results/<run_id>/ (report, markdown, plot).
+    Run ids are unique, so concurrent runs never share a path.
+    """
+
+    def __init__(self, run_id: str = None, runs_dir: str = RUNS_DIR, results_dir: str = RESULTS_DIR):
+        self.run_id = run_id or f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.dir = os.path.join(runs_dir, self.run_id)
+        self.result_dir = os.path.join(results_dir, self.run_id)
+
+    def checkpoint(self, name: str) -> str:
+        os.makedirs(self.dir, exist_ok=True)
+        return os.path.join(self.dir, name)
+
+    def result(self, name: str) -> str:
+        os.makedirs(self.result_dir, exist_ok=True)
+        return os.path.join(self.result_dir, name)
 
 
 def validate_input(user_input: str) -> bool:
@@ -22,65 +67,266 @@ def validate_input(user_input: str) -> bool:
     return True
 
 
-def run_inference(user_input: str) -> str:
+def parse_run_params(num_months=None, sample_per_week=None) -> dict:
+    """
+    Validate the per-request window length and HN sample size (None or "" means
+    the default); returns them as ints. Raises ValueError naming the bad one.
+    """
+    params = {}
+    for name, value, default, lo, hi in [
+        ("num_months", num_months, scrape_reddit.NUM_MONTHS, 2, scrape_reddit.MAX_NUM_MONTHS),
+        ("sample_per_week", sample_per_week, scrape_reddit.SAMPLE_PER_WEEK, 1, scrape_reddit.MAX_SAMPLE_PER_WEEK),
+    ]:
+        if value is None or value == "":
+            value = default
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be an integer") from None
+        if not lo <= value <= hi:
+            raise ValueError(f"{name} must be between {lo} and {hi}")
+        params[name] = value
+    return params
+
+
+def result_key(user_input: str, params: dict):
+    """(result cache key, data month) of a run of `user_input` with parse_run_params' `params` started now"""
+    data_month = scrape_reddit.recent_months(1)[0]
+    return result_cache.cache_key(user_input, num_keywords=NUM_KEYWORDS, data_month=data_month, **params), data_month
+
+
+def cached_result(user_input: str, num_months: int = None, sample_per_week: int = None):
+    """
+    The result folder of a still-valid earlier run of the same query (compared
+    after result_cache.normalize_query) and parameters, or None.
+    """
+    params = parse_run_params(num_months, sample_per_week)
+    key, data_month = result_key(user_input, params)
+    return result_cache.lookup(key, result_cache.data_version(data_month, params["sample_per_week"]))
+
+
+def write_result(ws: Workspace, user_input: str, report: dict, timings: dict = None) -> None:
+    """Publish spike_report.json and the Markdown report (output.md) into the run's result folder"""
+    with open(ws.result("spike_report.json"), 'w', encoding='utf-8') as f:
+        # strict JSON: a NaN would make the file unreadable to browsers and strict parsers
+        json.dump(report, f, indent=2, allow_nan=False)
+
+    md_lines = [f"# Traffic Spike Analysis for “{user_input}”", ""]
+    md_lines.append(f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    md_lines.append("")
+    md_lines.append("| Parameter        | Value      |")
+    md_lines.append("|:-----------------|-----------:|")
+    for key in ['year','month','num_months','sample_per_week','latest_rate','beta','mean','stdev','variance','median','min','max','threshold','recommendation', 'relevant_etfs']:
+        md_lines.append(f"| {key} | {report.get(key)} |")
+    md_lines.append("")
+    md_lines.append("## Spike Plot")
+    md_lines.append("")
+    # Each result folder owns its plot, so older reports keep theirs
+    md_lines.append(f"![Spike Plot](/static/results/{ws.run_id}/spike_plot.png)")
+    md_lines.append("")
+    if report.get("top_keywords"):
+        md_lines.append("## Top Keywords (latest month)")
+        md_lines.append("")
+        md_lines.append("| Keyword          | Weighted   | Share      |")
+        md_lines.append("|:-----------------|-----------:|-----------:|")
+        for entry in report["top_keywords"]:
+            md_lines.append(f"| {entry['keyword']} | {entry['weighted']} | {entry['share']:.1%} |")
+        md_lines.append("")
+    if timings:
+        md_lines.append("## Stage Timings")
+        md_lines.append("")
+        md_lines.append("| Stage            | Seconds    |")
+        md_lines.append("|:-----------------|-----------:|")
+        for stage, seconds in timings.items():
+            md_lines.append(f"| {stage} | {seconds:.2f} |")
+    md_content = "\n".join(md_lines)
+
+    publish_markdown(ws.result_dir, md_content)
+
+
+@lru_cache(maxsize=None)
+def _templates(templates_dir: str):
+    return Environment(loader=FileSystemLoader(templates_dir), autoescape=select_autoescape())
+
+
+def render_report_page(md_content: str, templates_dir: str = TEMPLATES_DIR) -> str:
+    """The Markdown report as a complete results page (templates/result.html)"""
+    html = md_lib.markdown(md_content, extensions=MD_EXTENSIONS)
+    return _templates(templates_dir).get_template("result.html").render(content=html)
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Concurrent writers (e.g. two first views of a legacy result) each use their own temp file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            # mkstemp's 0600 would hide the published page from a proxy serving static/ directly
+            os.fchmod(f.fileno(), 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_report_page(result_dir: str, md_content: str) -> None:
+    """REPORT_PAGE and a gzipped copy next to it, so serving a result costs no rendering or compression"""
+    page = render_report_page(md_content).encode('utf-8')
+    os.makedirs(result_dir, exist_ok=True)
+    # mtime=0 keeps the .gz bytes (and so its ETag) a function of the page alone
+    _write_atomic(os.path.join(result_dir, REPORT_PAGE + ".gz"), gzip.compress(page, 9, mtime=0))
+    _write_atomic(os.path.join(result_dir, REPORT_PAGE), page)
+
+
+def publish_markdown(result_dir: str, md_content: str) -> None:
+    """output.md plus its pre-rendered page; output.md goes last, as it marks the result complete"""
+    write_report_page(result_dir, md_content)
+    _write_atomic(os.path.join(result_dir, 'output.md'), md_content.encode('utf-8'))
+
+
+@contextmanager
+def profiled(ws: Workspace):
+    """Profile the block when PROFILE_RUNS is set and no other run is being profiled"""
+    if not PROFILE_RUNS or not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profile_lock.release()
+        profiler.dump_stats(ws.result("profile.pstats"))
+        with open(ws.result("profile.txt"), 'w', encoding='utf-8') as f:
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+
+def run_inference(user_input: str, progress=None, workspace: Workspace = None,
+                  num_months: int = None, sample_per_week: int = None, use_cache: bool = True) -> str:
     """
     Full pipeline:
     1) Expand keywords
-    2) Scrape Reddit
-    3) Count & normalize traffic
+    2) Scrape Reddit: refresh the month-partitioned HN cache for the last
+       `num_months` months at `sample_per_week` posts per week
+    3) Count & normalize traffic one month partition at a time, keeping the
+       keyword x month breakdown (keyword_month.npz)
     4) Detect spikes
-    5) Write a Markdown report embedding the JSON stats and static spike_plot.png
+    5) Write a Markdown report embedding the JSON stats and the run's own spike_plot.png
+    All files go to `workspace` (a fresh one per call by default), whose run id is returned.
+    Stages run in-process and hand DataFrames/lists straight to each other;
+    any stage failure propagates as an exception. Per-stage wall time is kept
+    in the report's `stage_seconds`; the fuller per-stage measurements
+    (metrics.RunMetrics) go to metrics.json, even when the run fails.
+    Each milestone is also passed to `progress(msg)` when given.
+    With `use_cache`, a still-valid earlier result for the same normalized
+    query, parameters and data month (see result_cache) is returned instead
+    of running again; finished runs are added to that cache.
     """
+    params = parse_run_params(num_months, sample_per_week)
+    key, _ = result_key(user_input, params)
+    folder = use_cache and cached_result(user_input, **params)
+    if folder:
+        metrics.REGISTRY.inc("runs_total", status="cached")
+        if progress:
+            progress("Cached result ✔")
+        return folder
+
+    ws = workspace or Workspace()
+    run = metrics.RunMetrics()
+    try:
+        with metrics.recording(run), profiled(ws):
+            version = _run_pipeline(user_input, progress, ws, run, **params)
+    except Exception:
+        metrics.REGISTRY.inc("runs_total", status="failed")
+        raise
+    else:
+        metrics.REGISTRY.inc("runs_total", status="done")
+    finally:
+        with open(ws.result("metrics.json"), 'w', encoding='utf-8') as f:
+            json.dump(dict(run.as_dict(), run_id=ws.run_id), f, indent=2)
+    if use_cache:
+        result_cache.store(key, ws.run_id, version, result_cache.normalize_query(user_input))
+        result_cache.maybe_evict()
+    return ws.run_id
+
+
+def _run_pipeline(user_input: str, progress, ws: Workspace, run: metrics.RunMetrics,
+                  num_months: int, sample_per_week: int) -> int:
+    """The pipeline stages; returns the result_cache.data_version of the posts it counted"""
     def log(msg: str):
         print(f"[inference] {msg}")
         sys.stdout.flush()
+        if progress:
+            progress(msg)
+
+    timings = {}
+
+    def timed(stage: str, fn, *args, **kwargs):
+        with run.stage(stage):
+            result = fn(*args, **kwargs)
+        timings[stage] = run.stages[stage]["wall_seconds"]
+        print(f"[inference] {stage}: {timings[stage]:.2f}s")
+        events.emit("timing", stage=stage, seconds=timings[stage])
+        return result
 
     log("Building Keywords...")
     phrases = [p.strip() for p in user_input.split(",")]
-    keywords = expand_to_keywords(phrases, num_keywords=100)
-    save_keywords(keywords, filepath="tmp/keywords.txt")
+    keywords = timed("keywords", expand_to_keywords, phrases, num_keywords=NUM_KEYWORDS)
+    run.record("keywords", keywords=len(keywords))
+    if WRITE_CHECKPOINTS:
+        save_keywords(keywords, filepath=ws.checkpoint("keywords.txt"))
 
     log("Scraping Reddit...")
-    os.system("python3 algorithm/scrape_reddit.py")
+    cached = timed("scrape", scrape_reddit.refresh_cache, scrape_reddit.recent_months(num_months),
+                   sample_per_week=sample_per_week)
+    num_posts = sum(cached.values())
+    if not num_posts:
+        raise RuntimeError("No HN data fetched; check your network or API limits.")
+    run.record("scrape", rows=num_posts)
+    # read straight after the refresh, so a later run's refresh cannot be credited to this result
+    version = result_cache.data_version(scrape_reddit.recent_months(1)[0], sample_per_week)
+    if WRITE_CHECKPOINTS:
+        scrape_reddit.save_posts(scrape_reddit.iter_posts(cached, sample_per_week=sample_per_week),
+                                 ws.checkpoint("hn_raw_posts.parquet"), ws.checkpoint("hn_raw_posts.csv"))
 
     log("Counting Traffic...")
-    os.system("python3 algorithm/traffic_counter.py")
+    # month partitions are the scan shards: read one at a time, by SCAN_WORKERS processes
+    posts = scrape_reddit.partition_files(cached, sample_per_week=sample_per_week)
+    rows, keyword_matrix, months = timed("count", traffic_counter.count_traffic_by_keyword, posts, keywords)
+    run.record("count", rows=num_posts, keywords_matched=int((keyword_matrix.getnnz(axis=1) > 0).sum()))
+    events.emit("counted", rows=num_posts, months=len(months))
+    if WRITE_CHECKPOINTS:
+        traffic_counter.write_avg_per_day(rows, ws.checkpoint("traffic_avg_per_day.csv"))
+    traffic_counter.save_keyword_matrix(ws.result("keyword_month.npz"), keyword_matrix, keywords, months)
 
     log("Analyze Time Series...")
-    os.system("python3 algorithm/spike_detector.py")
+    report = timed("spikes", spike_detector.analyze, spike_detector.rates_from_rows(rows),
+                   plot_path=ws.result("spike_plot.png"))
+    report["top_keywords"] = traffic_counter.top_keywords(keyword_matrix, keywords, months)
+    report.update(num_months=num_months, sample_per_week=sample_per_week)
 
     log("Pulling ETFs...")
-    os.system("python3 algorithm/scrape_etfs.py")
-    os.system("python3 algorithm/etf_selector.py")
-
-    ts = datetime.now().strftime("%Y%m%d%H%M%S")
-    result_dir = os.path.join("static", "results", ts)
-    os.makedirs(result_dir, exist_ok=True)
-
-    src_json = os.path.join("tmp", "spike_report.json")
-    dst_json = os.path.join(result_dir, "spike_report.json")
-    shutil.move(src_json, dst_json)
+    etf_df = timed("etf_scrape", scrape_etfs.fetch_etfs)
+    run.record("etf_scrape", rows=len(etf_df))
+    if WRITE_CHECKPOINTS:
+        etf_df.to_csv(ws.checkpoint("etf_list_us_canada_final.csv"), index=False)
+    query_text = " ".join(k.strip() for k in keywords if k.strip())
+    etfs = etf_selector.etf_records(etf_df.fillna("").to_dict("records"))
+    etf_index = timed("etf_index", etf_selector.index_for, etfs, model=get_model, model_name=MODEL_NAME)
 
-    with open(dst_json, 'r', encoding='utf-8') as f:
-        report = json.load(f)
+    def select_etfs():
+        # the keywords' embeddings are already cached from the keywords stage
+        query_vec = query_embedding(keywords) if etf_index.semantic is not None else None
+        return etf_index.query(query_text, query_vec=query_vec)
+    report["relevant_etfs"] = ",".join(timed("etf_select", select_etfs))
+    report["stage_seconds"] = timings
 
-    md_lines = [f"# Traffic Spike Analysis for “{user_input}”", ""]
-    md_lines.append(f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    md_lines.append("")
-    md_lines.append("| Parameter        | Value      |")
-    md_lines.append("|:-----------------|-----------:|")
-    for key in ['year','month','latest_rate','beta','mean','stdev','variance','median','min','max','threshold','recommendation', 'relevant_etfs']:
-        md_lines.append(f"| {key} | {report.get(key)} |")
-    md_lines.append("")
-    md_lines.append("## Spike Plot")
-    md_lines.append("")
-    # Reference static spike_plot.png directly
-    md_lines.append("![Spike Plot](/static/spike_plot.png)")
-    md_content = "\n".join(md_lines)
+    if WRITE_CHECKPOINTS:
+        with open(ws.checkpoint("spike_report.json"), 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
 
-    # Write markdown
-    with open(os.path.join(result_dir, 'output.md'), 'w', encoding='utf-8') as f:
-        f.write(md_content)
+    write_result(ws, user_input, report, timings)
 
     log("Inference complete ✔")
-    return ts
+    return version
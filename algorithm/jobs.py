@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from algorithm import events
+
+JOB_DB = os.path.join("tmp", "jobs.sqlite3")
+JOB_WORKERS = 4
+MAX_PENDING = 20
+# jobs silent for this long were most likely lost with their worker process
+STALE_SECONDS = 3600
+# queued and running jobs have `updated` refreshed this often, even through long stages without progress()
+HEARTBEAT_SECONDS = 60
+ORPHAN_ERROR = "The server restarted before this job finished; please submit it again."
+STALE_ERROR = "This job stopped reporting progress and was most likely lost in a restart; please submit it again."
+
+
+class QueueFull(Exception):
+    pass
+
+
+def process_start(pid: int) -> str:
+    """
+    When process `pid` started, in clock ticks since boot ("" where /proc is
+    unavailable). In a container restarted with the same hostname, gunicorn
+    and its workers come back with the same pids, but not the same start times.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as f:
+            stat = f.read()
+    except OSError:
+        return ""
+    # fields after the parenthesized command name; starttime is field 22 of the whole line
+    return stat.rpartition(")")[2].split()[19]
+
+
+def process_id() -> str:
+    """host:pid:start of this process, recorded as the owner of the jobs it runs"""
+    pid = os.getpid()
+    return f"{socket.gethostname()}:{pid}:{process_start(pid)}"
+
+
+def owner_gone(owner) -> bool:
+    """
+    Whether the process that ran a job has exited (a restart or a recycled
+    worker), taking its thread pool and the job with it. A live process with
+    the owner's pid but another start time reused the pid. Owners on other
+    hosts cannot be checked here and are left to STALE_SECONDS.
+    """
+    if not owner:
+        # recorded before jobs had owners, so by a process that is gone now
+        return True
+    parts = owner.split(":")
+    # owners recorded as host:pid predate start times
+    host, pid, start = parts if len(parts) == 3 else (*parts, "")
+    if host != socket.gethostname():
+        return False
+    try:
+        pid = int(pid)
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except (PermissionError, ValueError):
+        return False
+    return bool(start) and process_start(pid) not in ("", start)
+
+
+class MemoryJobStore:
+    """Job records in a dict; only visible to the process that created them."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def create(self, job: dict) -> None:
+        with self.lock:
+            self.jobs[job["id"]] = dict(job)
+
+    def update(self, job_id: str, **fields) -> None:
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def get(self, job_id: str):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job, stages=list(job["stages"]), params=dict(job["params"])) if job else None
+
+    def count_pending(self) -> int:
+        with self.lock:
+            return sum(1 for j in self.jobs.values() if j["status"] in ("queued", "running"))
+
+
+class SQLiteJobStore:
+    """Job records in SQLite, so every gunicorn worker can report on every job."""
+
+    COLUMNS = ["id", "query", "params", "status", "stage", "stages", "folder", "error", "created", "updated",
+               "owner"]
+
+    def __init__(self, path: str = JOB_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, query TEXT, params TEXT, status TEXT, stage TEXT, stages TEXT, "
+                "folder TEXT, error TEXT, created REAL, updated REAL)"
+            )
+            # databases created before jobs took run parameters
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "params" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN params TEXT")
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self.fail_orphans()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, job: dict) -> None:
+        row = dict(job, stages=json.dumps(job["stages"]), params=json.dumps(job["params"]))
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                [row[c] for c in self.COLUMNS],
+            )
+
+    def update(self, job_id: str, **fields) -> None:
+        if "stages" in fields:
+            fields["stages"] = json.dumps(fields["stages"])
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                [*fields.values(), job_id],
+            )
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.COLUMNS, row))
+        job["stages"] = json.loads(job["stages"])
+        job["params"] = json.loads(job["params"] or "{}")
+        if job["status"] in ("queued", "running") and owner_gone(job["owner"]):
+            self.fail_orphans([job_id])
+            job.update(status="failed", error=ORPHAN_ERROR)
+        return job
+
+    def fail_orphans(self, job_ids=None) -> int:
+        """Mark queued/running jobs (all, or `job_ids`) whose process has exited as failed; returns how many"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+            orphans = [job_id for job_id, owner in rows
+                       if (job_ids is None or job_id in job_ids) and owner_gone(owner)]
+            now = time.time()
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', error = ?, updated = ? WHERE id = ? "
+                "AND status IN ('queued', 'running')",
+                [(ORPHAN_ERROR, now, job_id) for job_id in orphans],
+            )
+        return len(orphans)
+
+    def count_pending(self) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running') AND updated > ?",
+                (time.time() - STALE_SECONDS,),
+            ).fetchone()[0]
+
+
+class JobQueue:
+    """
+    Runs `runner(query, progress, **params)` on a bounded thread pool.
+
+    The runner reports milestones by calling progress(message); each one becomes
+    the job's current stage. Its return value is stored as the job's result folder.
+    Status changes, stages and whatever the runner emit()s are also published
+    on the job's channel of `broker`, for live viewers. A heartbeat refreshes
+    the `updated` time of every queued and running job, so only jobs lost
+    with their process ever go STALE_SECONDS without an update.
+    """
+
+    def __init__(self, runner, store=None, max_workers: int = JOB_WORKERS, max_pending: int = MAX_PENDING,
+                 broker: events.Broker = None):
+        self.runner = runner
+        self.store = store or MemoryJobStore()
+        self.broker = broker or events.BROKER
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.active = set()
+        self.lock = threading.Lock()
+        # started by the first submit, so that under gunicorn --preload it runs in the worker, not the master
+        self.heartbeat = None
+
+    def submit(self, query: str, **params) -> str:
+        if self.store.count_pending() >= self.max_pending:
+            raise QueueFull(f"Too many pending jobs (max {self.max_pending}); try again later.")
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self.store.create({
+            "id": job_id, "query": query, "params": params, "status": "queued", "stage": None, "stages": [],
+            "folder": None, "error": None, "created": now, "updated": now, "owner": process_id(),
+        })
+        self.broker.open(job_id)
+        self.broker.publish(job_id, "status", {"status": "queued"})
+        with self.lock:
+            self.active.add(job_id)
+            if self.heartbeat is None:
+                self.heartbeat = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+                self.heartbeat.start()
+        self.pool.submit(self._run, job_id, query, params)
+        return job_id
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def _beat(self) -> None:
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with self.lock:
+                active = list(self.active)
+            now = time.time()
+            for job_id in active:
+                try:
+                    self.store.update(job_id, updated=now)
+                except sqlite3.Error as e:
+                    print(f"[jobs] heartbeat of {job_id} failed: {e}")
+
+    def _run(self, job_id: str, query: str, params: dict) -> None:
+        stages = []
+
+        def progress(message: str):
+            now = time.time()
+            stages.append({"stage": message, "at": now})
+            self.store.update(job_id, stage=message, stages=stages, updated=now)
+            self.broker.publish(job_id, "stage", stages[-1])
+
+        self.store.update(job_id, status="running", updated=time.time())
+        self.broker.publish(job_id, "status", {"status": "running"})
+        try:
+            with events.publishing(job_id, self.broker):
+                folder = self.runner(query, progress, **params)
+        except Exception as e:
+            self.store.update(job_id, status="failed", error=str(e), updated=time.time())
+            self.broker.publish(job_id, "failed", {"error": str(e)})
+        else:
+            self.store.update(job_id, status="done", folder=folder, updated=time.time())
+            self.broker.publish(job_id, "done", {"folder": folder})
+        finally:
+            with self.lock:
+                self.active.discard(job_id)
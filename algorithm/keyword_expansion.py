@@ -1,42 +1,132 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
+import numpy as np
 import wikipedia
-from nltk import word_tokenize, pos_tag, RegexpParser
-from nltk.corpus import wordnet
-from sentence_transformers import SentenceTransformer, util
+from algorithm.embedding_cache import EmbeddingCache, cosine_scores
+from algorithm.disk_cache import TTLCache
+from algorithm import metrics
 
+MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBED_BATCH_SIZE = 64
+WIKI_CACHE_DIR = os.path.join('tmp', 'wiki_cache')
+WIKI_CACHE_TTL = 7 * 24 * 3600
+WIKI_MAX_WORKERS = 8
 
-enb_model = SentenceTransformer('all-MiniLM-L6-v2')
+_embedding_cache = None
+_model_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    The process-wide embedding cache and its SentenceTransformer, created on
+    first use. torch and the weights are only loaded by whichever thread
+    needs them first, exactly once.
+    """
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _model_lock:
+            if _embedding_cache is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(MODEL_NAME)
+                _embedding_cache = EmbeddingCache(model, MODEL_NAME, batch_size=EMBED_BATCH_SIZE)
+    return _embedding_cache
+
+
+def get_model():
+    return get_embedding_cache().model
+
+
+def warm_up(encode: bool = True) -> None:
+    """
+    Load the model (and WordNet) ahead of the first request.
+    With encode=False only the weights are loaded: use that before a fork
+    (gunicorn --preload), so torch's thread pools start in the workers.
+    """
+    from nltk.corpus import wordnet
+    model = get_model()
+    wordnet.ensure_loaded()
+    if encode:
+        model.encode(["warm up"], show_progress_bar=False)
+
+
+class WikipediaBackend:
+    """Live backend: the `wikipedia` package. Pages are returned as plain dicts."""
+
+    def search(self, phrase: str, results: int) -> List[str]:
+        return wikipedia.search(phrase, results=results)
+
+    def page(self, title: str) -> dict:
+        page = wikipedia.page(title, auto_suggest=False)
+        # touching links/categories here keeps their extra round trips in the worker thread
+        return {'title': page.title, 'links': list(page.links), 'categories': list(page.categories)}
+
+
+class CachedBackend:
+    """Memoizes any backend's search results and pages in a TTLCache."""
+
+    def __init__(self, backend, cache: TTLCache):
+        self.backend = backend
+        self.cache = cache
+
+    def search(self, phrase: str, results: int) -> List[str]:
+        key = f"search:{results}:{phrase}"
+        titles = self.cache.get(key)
+        if titles is None:
+            titles = self.backend.search(phrase, results)
+            metrics.count("wiki_requests")
+            self.cache.set(key, titles)
+        return titles
+
+    def page(self, title: str) -> dict:
+        key = f"page:{title}"
+        page = self.cache.get(key)
+        if page is None:
+            page = self.backend.page(title)
+            metrics.count("wiki_requests")
+            self.cache.set(key, page)
+        return page
+
+
+wiki_backend = CachedBackend(WikipediaBackend(), TTLCache(WIKI_CACHE_DIR, WIKI_CACHE_TTL))
+
+
+def _try(fn, *args):
+    try:
+        return fn(*args)
+    except Exception:
+        return None
 
-grammar = r"NP: {<JJ>*<NN.*>+}"
-chunker = RegexpParser(grammar)
 
 def get_wikipedia_candidates(
     input_phrases: List[str],
     max_pages: int = 3,
-    max_links_per_page: int = 50
+    max_links_per_page: int = 50,
+    backend=None,
+    max_workers: int = WIKI_MAX_WORKERS
 ) -> List[str]:
     """
     For each phrase:
       - search top `max_pages` Wikipedia titles
       - for each title, fetch page.links (first N) and page.categories
+    Searches, then page fetches, fan out over a pool of `max_workers` threads.
+    `backend` defaults to the cached live Wikipedia backend.
     Returns a de-duped list of candidate terms.
     """
+    backend = backend or wiki_backend
     candidates = set()
-    for phrase in input_phrases:
-        try:
-            titles = wikipedia.search(phrase, results=max_pages)
-        except Exception:
-            continue
-        for title in titles:
-            try:
-                page = wikipedia.page(title, auto_suggest=False)
-            except Exception:
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        searches = pool.map(metrics.propagate(lambda p: _try(backend.search, p, max_pages)), input_phrases)
+        titles = list(dict.fromkeys(t for found in searches if found for t in found))
+        pages = pool.map(metrics.propagate(lambda t: _try(backend.page, t)), titles)
+        for page in pages:
+            if page is None:
                 continue
-            candidates.add(page.title)
-            for link in page.links[:max_links_per_page]:
+            candidates.add(page['title'])
+            for link in page['links'][:max_links_per_page]:
                 candidates.add(link)
-            for cat in page.categories:
+            for cat in page['categories']:
                 if cat.startswith('Category:'):
                     candidates.add(cat.replace('Category:', ''))
                 else:
@@ -44,6 +134,8 @@ def get_wikipedia_candidates(
     return list(candidates)
 
 def get_wordnet_candidates(input_phrases: List[str]) -> List[str]:
+    # nltk takes seconds to import, so it is only paid for on first use
+    from nltk.corpus import wordnet
     candidates = set()
     for phrase in input_phrases:
         key = phrase.replace(' ', '_')
@@ -61,7 +153,8 @@ def expand_to_keywords(
 ) -> List[str]:
     """
     1) Gather candidates from Wikipedia (links + categories) and WordNet.
-    2) Rank by mean embedding similarity to input phrases.
+    2) Rank by mean embedding similarity to input phrases (embeddings come
+       from the persistent cache; only unseen strings are encoded).
     3) Return top `num_keywords`.
     """
     wiki_cands = get_wikipedia_candidates(input_phrases)
@@ -69,15 +162,33 @@ def expand_to_keywords(
     seed = list({*wiki_cands, *wn_cands})
     if not seed:
         seed = input_phrases[:]
+    return rank_candidates(input_phrases, seed, num_keywords)
 
-    phrase_embeds = enb_model.encode(input_phrases, convert_to_tensor=True)
-    seed_embeds = enb_model.encode(seed, convert_to_tensor=True)
-    query_vec = phrase_embeds.mean(dim=0, keepdim=True)
-    cos_scores = util.cos_sim(query_vec, seed_embeds)[0]
-    top_idxs = cos_scores.topk(k=min(len(seed), num_keywords)).indices.tolist()
+def rank_candidates(
+    input_phrases: List[str],
+    seed: List[str],
+    num_keywords: int,
+    embedding_cache: EmbeddingCache = None
+) -> List[str]:
+    """The `num_keywords` candidates closest to the mean embedding of the input phrases"""
+    embedding_cache = embedding_cache or get_embedding_cache()
+    query_vec = query_embedding(input_phrases, embedding_cache)
+    seed_embeds = embedding_cache.embed(seed)
+    cos_scores = cosine_scores(seed_embeds, query_vec)
+    k = min(len(seed), num_keywords)
+    top_idxs = np.argpartition(-cos_scores, k - 1)[:k]
+    top_idxs = top_idxs[np.argsort(-cos_scores[top_idxs], kind='stable')]
     keywords = [seed[i] for i in top_idxs]
     return keywords
 
+def query_embedding(
+    phrases: List[str],
+    embedding_cache: EmbeddingCache = None
+) -> np.ndarray:
+    """Mean embedding of the phrases; for expanded keywords these are all cache hits"""
+    embedding_cache = embedding_cache or get_embedding_cache()
+    return embedding_cache.embed(phrases).mean(axis=0)
+
 def save_keywords(
     keywords: List[str],
     filepath: str = "tmp/keywords.txt"
@@ -0,0 +1,139 @@
+import time
+import resource
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+
+PREFIX = "bsb_"
+
+_current = contextvars.ContextVar("run_metrics", default=None)
+
+
+class Registry:
+    """
+    Process-wide counters and gauges rendered in the Prometheus text format.
+    Each gunicorn worker keeps its own registry, so every scrape sees one worker.
+    """
+
+    def __init__(self):
+        self.values = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] += value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def render(self) -> str:
+        with self.lock:
+            items = sorted(self.values.items())
+        lines, typed = [], set()
+        for (name, labels), value in items:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {'counter' if name.endswith('_total') else 'gauge'}")
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            # repr keeps every digit; :g would round large counters to 6 significant digits
+            value = repr(float(value))
+            lines.append(f"{PREFIX}{name}{{{label_text}}} {value}" if labels else f"{PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is in KB on Linux)"""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class RunMetrics:
+    """
+    Per-run measurements, grouped by stage: wall and CPU seconds, peak RSS
+    and whatever counters code running inside the stage reports via count().
+    CPU time is process-wide, so it includes helper threads (and any runs
+    executing concurrently).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.current_stage = None
+        self.counted = set()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        entry = self.stages.setdefault(name, {})
+        previous, self.current_stage = self.current_stage, name
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield entry
+        finally:
+            self.current_stage = previous
+            entry["wall_seconds"] = round(time.perf_counter() - wall, 3)
+            entry["cpu_seconds"] = round(time.process_time() - cpu, 3)
+            entry["peak_rss_mb"] = peak_rss_mb()
+            REGISTRY.inc("stage_seconds_total", entry["wall_seconds"], stage=name)
+            REGISTRY.inc("stage_cpu_seconds_total", entry["cpu_seconds"], stage=name)
+            REGISTRY.inc("stage_runs_total", stage=name)
+
+    def add(self, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counted.add(name)
+            entry = self.stages.setdefault(self.current_stage or "other", {})
+            entry[name] = entry.get(name, 0) + value
+
+    def record(self, stage: str, **values) -> None:
+        """Attach measured values (rows, keywords matched, ...) to a finished stage"""
+        with self.lock:
+            self.stages.setdefault(stage, {}).update(values)
+        for name, value in values.items():
+            REGISTRY.inc(f"stage_{name}_total", value, stage=stage)
+
+    def totals(self) -> dict:
+        """Whole-run sums of the timings and of everything reported via count()"""
+        summed = {"wall_seconds", "cpu_seconds"} | self.counted
+        totals = defaultdict(float)
+        for entry in self.stages.values():
+            for key, value in entry.items():
+                if key in summed:
+                    totals[key] += value
+        return {k: round(v, 3) for k, v in totals.items()}
+
+    def as_dict(self) -> dict:
+        return {"stages": self.stages, "totals": self.totals(), "peak_rss_mb": peak_rss_mb()}
+
+
+@contextmanager
+def recording(run: RunMetrics):
+    """Make `run` the target of count() calls in this thread (and threads started via propagate)"""
+    token = _current.set(run)
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+
+
+def count(name: str, value: float = 1) -> None:
+    """Add to the process-wide counter <name>_total and, inside a recorded run, to its current stage"""
+    REGISTRY.inc(f"{name}_total", value)
+    run = _current.get()
+    if run is not None:
+        run.add(name, value)
+
+
+def propagate(fn):
+    """Wrap fn so pool threads running it report to the submitting thread's run"""
+    run = _current.get()
+
+    def wrapper(*args, **kwargs):
+        token = _current.set(run)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+from contextlib import contextmanager
+from algorithm import scrape_reddit, spike_detector
+
+INDEX_FILE = os.path.join("tmp", "result_cache.json")
+RESULTS_DIR = os.path.join("static", "results")
+RUNS_DIR = os.path.join("tmp", "runs")
+# a cached result is reused for this long, unless the current month gets new posts first
+RESULT_TTL = float(os.environ.get("RESULT_TTL_SECONDS", 6 * 3600))
+# eviction of static/results: folders older than MAX_RESULT_AGE go, then the oldest until under MAX_RESULTS_MB
+MAX_RESULT_AGE = float(os.environ.get("MAX_RESULT_AGE_SECONDS", 30 * 86400))
+MAX_RESULTS_MB = float(os.environ.get("MAX_RESULTS_MB", 500))
+# folders this fresh may belong to a run still writing them, so eviction leaves them alone
+MIN_RESULT_AGE = 3600
+EVICT_INTERVAL = 600
+
+
+def normalize_query(user_input: str) -> str:
+    """Case-folded, whitespace-collapsed phrases, deduplicated and sorted: "nvidia, gpu" == "GPU,Nvidia" """
+    phrases = {" ".join(p.split()).casefold() for p in user_input.split(",")}
+    return ", ".join(sorted(p for p in phrases if p))
+
+
+def cache_key(user_input: str, num_months: int, sample_per_week: int, num_keywords: int, data_month) -> str:
+    """
+    Everything that decides a run's result: the normalized query, the
+    pipeline parameters, the HN sampler and the newest month
+    """
+    parts = {
+        "query": normalize_query(user_input),
+        "num_months": num_months,
+        "sample_per_week": sample_per_week,
+        "sampler": scrape_reddit.SAMPLER,
+        "num_keywords": num_keywords,
+        "beta": spike_detector.BETA,
+        "data_month": "%d-%02d" % tuple(data_month),
+    }
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def data_version(data_month, sample_per_week: int, cache_dir: str = scrape_reddit.CACHE_DIR) -> int:
+    """
+    The newest post cached for the newest month (its manifest high_water). It
+    grows whenever a refresh brings in newer posts, even when the redrawn
+    buckets keep the month's row count the same.
+    """
+    manifest = scrape_reddit.load_manifest(scrape_reddit.sample_cache_dir(cache_dir, sample_per_week))
+    return manifest.get("%d-%02d" % tuple(data_month), {}).get("high_water", 0)
+
+
+@contextmanager
+def locked_index(path: str = INDEX_FILE):
+    """The index as a dict, held under an flock and written back atomically on exit"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        index = load_index(path)
+        yield index
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+
+def load_index(path: str = INDEX_FILE) -> dict:
+    if not os.path.exists(path):
+        return {"entries": {}, "evicted_at": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def lookup(key: str, version: int, ttl: float = RESULT_TTL, path: str = INDEX_FILE,
+           results_dir: str = RESULTS_DIR):
+    """The cached result folder for `key`, or None if missing, expired, outdated by new data or evicted"""
+    entry = load_index(path)["entries"].get(key)
+    if entry is None or time.time() - entry["created"] > ttl or version > entry["data_version"]:
+        return None
+    if not os.path.exists(os.path.join(results_dir, entry["folder"], "output.md")):
+        return None
+    return entry["folder"]
+
+
+def store(key: str, folder: str, version: int, query: str, path: str = INDEX_FILE) -> None:
+    with locked_index(path) as index:
+        index["entries"][key] = {"folder": folder, "data_version": version, "query": query,
+                                 "created": time.time()}
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def evict_results(results_dir: str = RESULTS_DIR, runs_dir: str = RUNS_DIR, max_age: float = MAX_RESULT_AGE,
+                  max_mb: float = MAX_RESULTS_MB, path: str = INDEX_FILE):
+    """
+    Delete result folders (and their tmp/runs checkpoints) older than `max_age`,
+    then the oldest ones until static/results is under `max_mb`, and drop
+    index entries whose folder is gone. Returns the evicted run ids.
+    """
+    if not os.path.isdir(results_dir):
+        return []
+    now = time.time()
+    folders = []
+    for name in os.listdir(results_dir):
+        folder = os.path.join(results_dir, name)
+        if os.path.isdir(folder):
+            folders.append((os.path.getmtime(folder), name, dir_size(folder)))
+    folders.sort()
+
+    total = sum(size for _, _, size in folders)
+    evicted = []
+    for mtime, name, size in folders:
+        age = now - mtime
+        if age < MIN_RESULT_AGE or (age <= max_age and total <= max_mb * 2 ** 20):
+            continue
+        shutil.rmtree(os.path.join(results_dir, name), ignore_errors=True)
+        shutil.rmtree(os.path.join(runs_dir, name), ignore_errors=True)
+        total -= size
+        evicted.append(name)
+
+    with locked_index(path) as index:
+        index["entries"] = {k: e for k, e in index["entries"].items()
+                            if os.path.isdir(os.path.join(results_dir, e["folder"]))}
+        index["evicted_at"] = now
+    return evicted
+
+
+def maybe_evict(interval: float = EVICT_INTERVAL, path: str = INDEX_FILE) -> None:
+    """evict_results, at most once per `interval` seconds across all processes"""
+    if time.time() - load_index(path).get("evicted_at", 0) < interval:
+        return
+    evicted = evict_results(path=path)
+    if evicted:
+        print(f"[result_cache] evicted {len(evicted)} result folder(s)")
+
+
+def main():
+    evicted = evict_results()
+    print(f"[result_cache] evicted {len(evicted)} result folder(s)")
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
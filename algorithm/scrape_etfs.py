@@ -1,24 +1,44 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
 import re
+from algorithm import metrics
 
 etf_pages = [
     "https://en.wikipedia.org/wiki/List_of_American_exchange-traded_funds",
     "https://en.wikipedia.org/wiki/List_of_Canadian_exchange-traded_funds",
 ]
 
-etfs = []
+OUTPUT_CSV = "tmp/etf_list_us_canada_final.csv"
+CACHE_DIR = os.path.join("tmp", "etf_cache")
+CACHE_TTL = 24 * 3600
+REQUEST_TIMEOUT = 30
+COLUMNS = ["Name", "Ticker", "Sector", "Source_Page"]
 
 pattern = r"(.*?)\s+\((?:NYSE Arca|NASDAQ|BATS|CBOE|AMEX|TSX)[\s:\|]*([A-Z0-9]+)\)"
 
-for url in etf_pages:
-    print(f"Scraping {url}...")
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
-    
+# only the article body is turned into a tree; navigation, references etc. are skipped
+content_only = SoupStrainer("div", class_="mw-parser-output")
+
+
+def parse_etf_page(html, url):
+    """Extract Name/Ticker/Sector rows from the HTML of one Wikipedia ETF list page"""
+    try:
+        soup = BeautifulSoup(html, "lxml", parse_only=content_only)
+    except FeatureNotFound:
+        soup = BeautifulSoup(html, "html.parser", parse_only=content_only)
+
     content = soup.find('div', {'class': 'mw-parser-output'})
-    
+    if content is None:
+        raise ValueError(f"No article content found in {url}")
+
+    etfs = []
     current_sector = None
 
     for tag in content.find_all(["h2", "h3", "h4", "ul", "li"]):
@@ -40,10 +60,115 @@ for url in etf_pages:
                             "Sector": current_sector,
                             "Source_Page": url
                         })
+    return etfs
+
+
+def http_fetch(url, headers):
+    """Default fetcher: returns (status_code, text, response headers)"""
+    response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    metrics.count("http_requests")
+    metrics.count("http_bytes", len(response.content))
+    if response.status_code != 304:
+        response.raise_for_status()
+    return response.status_code, response.text, response.headers
+
+
+class ETFUniverse:
+    """
+    ETF list provider backed by a per-page disk cache.
+
+    A page is re-checked at most every `ttl` seconds, with If-None-Match /
+    If-Modified-Since so an unchanged page comes back as a bodiless 304 and is
+    not re-parsed. Pages are fetched concurrently. `fetch(url, headers)` can be
+    swapped for one that serves saved HTML fixtures.
+    """
+
+    def __init__(self, pages=None, cache_dir=CACHE_DIR, ttl=CACHE_TTL, fetch=http_fetch):
+        self.pages = pages or etf_pages
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.fetch = fetch
+        self.lock = threading.Lock()
+        self._frame = None
+        self._frame_key = None
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _load(self, url):
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, url, entry):
+        path = self._path(url)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def _refresh(self, url, entry, now):
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            status, text, resp_headers = self.fetch(url, headers)
+        except Exception as e:
+            if entry is None:
+                raise
+            print(f"Refreshing {url} failed ({e}); using cached copy")
+            return entry
+        if status == 304 and entry is not None:
+            entry = dict(entry, checked_at=now)
+        else:
+            print(f"Scraping {url}...")
+            entry = {
+                "etag": resp_headers.get("ETag"),
+                "last_modified": resp_headers.get("Last-Modified"),
+                "checked_at": now,
+                "fetched_at": now,
+                "rows": parse_etf_page(text, url),
+            }
+        self._save(url, entry)
+        return entry
+
+    def get(self):
+        """The current, de-duplicated ETF list as a DataFrame"""
+        with self.lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            now = time.time()
+            entries = {url: self._load(url) for url in self.pages}
+            stale = [url for url, e in entries.items() if e is None or now - e["checked_at"] >= self.ttl]
+            if stale:
+                with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+                    for url, entry in zip(stale, pool.map(metrics.propagate(lambda u: self._refresh(u, entries[u], now)), stale)):
+                        entries[url] = entry
+
+            key = tuple((url, entries[url]["fetched_at"]) for url in self.pages)
+            if key != self._frame_key:
+                rows = [row for url in self.pages for row in entries[url]["rows"]]
+                self._frame = pd.DataFrame(rows, columns=COLUMNS).drop_duplicates()
+                self._frame_key = key
+            return self._frame.copy()
+
+
+etf_universe = ETFUniverse()
+
+
+def fetch_etfs():
+    """The de-duplicated ETF list, refreshed from Wikipedia only when the cache is stale"""
+    return etf_universe.get()
+
 
-etf_df = pd.DataFrame(etfs)
+def main():
+    etf_df = fetch_etfs()
+    etf_df.to_csv(OUTPUT_CSV, index=False)
+    print(f"Scraped {len(etf_df)} ETFs and saved to 'etf_list_us_canada_final.csv'.")
 
-etf_df = etf_df.drop_duplicates()
 
-etf_df.to_csv("tmp/etf_list_us_canada_final.csv", index=False)
-print(f"Scraped {len(etf_df)} ETFs and saved to 'etf_list_us_canada_final.csv'.")
+if __name__ == "__main__":
+    main()
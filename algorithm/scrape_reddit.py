@@ -1,56 +1,240 @@
 import os
+import json
 import time
+import fcntl
 import random
-import math
 import datetime
+import threading
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import pandas as pd
+from algorithm import metrics, corpus_store, events
 
 SAMPLE_PER_WEEK = 1000
-WEEKS_PER_MONTH = 4
 HITS_PER_PAGE = 1000
+WEEK_SECONDS = 7 * 86400
+# sampling strata: each month is cut into equal buckets of about this length, each drawing its share of
+# the weekly sample in one page. A call per day is about 30 calls a month, ~730 (5 minutes at
+# REQUESTS_PER_SECOND) for a cold 24-month cache, and every day of a month is sampled in proportion;
+# shorter buckets also spread the sample within the day at proportionally more calls
+SAMPLE_BUCKET_SECONDS = int(os.environ.get("SAMPLE_BUCKET_SECONDS", 86400))
+# seeds the cut point inside every bucket, so a month always yields the same sample
+SAMPLE_SEED = 0
+# names the sampling scheme; each scheme caches its months in its own directory (and results under
+# its own key), so a time series never mixes months drawn by different schemes
+SAMPLER = f"strata-{SAMPLE_BUCKET_SECONDS}-{SAMPLE_SEED}"
+# Algolia indexes items with some delay, so buckets that ended less than this before a fetch are fetched again
+INDEX_LAG_SECONDS = 3600
+NUM_MONTHS = 24
+# bounds on the per-request window and sample size; the cache keeps MAX_NUM_MONTHS months
+MAX_NUM_MONTHS = 60
+MAX_SAMPLE_PER_WEEK = HITS_PER_PAGE
+# months whose buckets are fetched at once; bounds how many months of hits sit in memory
+MONTHS_IN_FLIGHT = 2
 OUTPUT_CSV = os.path.join("tmp", "hn_raw_posts.csv")
+OUTPUT_PARQUET = os.path.join("tmp", "hn_raw_posts.parquet")
+CACHE_DIR = os.path.join("tmp", "hn_cache")
+MANIFEST_FILE = "manifest.json"
 API_URL = "https://hn.algolia.com/api/v1/search_by_date"
 
+MAX_WORKERS = 8
+REQUESTS_PER_SECOND = 2.5
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 1.0
+REQUEST_TIMEOUT = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+COLUMNS = corpus_store.COLUMNS
 
-def fetch_hn_month(year: int, month: int):
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills `rate` tokens per second, holds at most `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(pool_size: int = MAX_WORKERS):
+    """
+    Session whose connection pool is large enough that concurrent workers reuse connections.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_hits(session, limiter, params, api_url: str = API_URL):
     """
-    Fetch up to SAMPLE_PER_WEEK hits for each of WEEKS_PER_MONTH segments in the given month.
+    GET one page of hits, waiting on the rate limiter before every attempt and
+    retrying 429/5xx responses and connection errors with exponential backoff.
+    Retry-After is honoured when the server sends it.
     """
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            resp = session.get(api_url, params=params, timeout=REQUEST_TIMEOUT)
+            metrics.count("http_requests")
+            metrics.count("http_bytes", len(resp.content))
+        except requests.ConnectionError:
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(BACKOFF_SECONDS * 2 ** attempt)
+            continue
+        if resp.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+            retry_after = resp.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else BACKOFF_SECONDS * 2 ** attempt
+            time.sleep(delay)
+            continue
+        resp.raise_for_status()
+        return resp.json().get("hits", [])
+
+
+def month_bounds(year: int, month: int):
+    """The month as a [start_ts, end_ts) window of local time"""
     start_dt = datetime.datetime(year, month, 1)
     if month == 12:
         next_month_dt = datetime.datetime(year + 1, 1, 1)
     else:
         next_month_dt = datetime.datetime(year, month + 1, 1)
+    return int(start_dt.timestamp()), int(next_month_dt.timestamp())
+
+
+def month_buckets(year: int, month: int, bucket_seconds: int = SAMPLE_BUCKET_SECONDS):
+    """
+    Split the month into consecutive [start_ts, end_ts) buckets of equal
+    length, as close to bucket_seconds as fits a whole number of them (so a
+    DST change stretches every bucket a little rather than leaving a sliver).
+    """
+    start, end = month_bounds(year, month)
+    strata = max(1, round((end - start) / bucket_seconds))
+    edges = [start + (end - start) * i // strata for i in range(strata + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def buckets_to_fetch(year: int, month: int, since=None, now=None, bucket_seconds: int = SAMPLE_BUCKET_SECONDS):
+    """
+    The month's buckets worth requesting: those already begun, and if the
+    month was last fetched at `since`, only those that were not final then.
+    """
+    now = now or time.time()
+    return [(start_ts, end_ts) for start_ts, end_ts in month_buckets(year, month, bucket_seconds)
+            if start_ts < now and (since is None or end_ts + INDEX_LAG_SECONDS > since)]
 
-    total_days = (next_month_dt - start_dt).days
-    segment_days = math.ceil(total_days / WEEKS_PER_MONTH)
-    all_hits = []
 
-    for i in range(WEEKS_PER_MONTH):
-        seg_start = start_dt + datetime.timedelta(days=i * segment_days)
-        seg_end = seg_start + datetime.timedelta(days=segment_days)
-        if seg_end > next_month_dt:
-            seg_end = next_month_dt
+def bucket_quota(start_ts: int, end_ts: int, sample_per_week: int = SAMPLE_PER_WEEK) -> int:
+    """
+    Posts to draw from a bucket: its share of `sample_per_week` by length, at
+    least one and at most one page (which only buckets longer than a week can
+    reach).
+    """
+    return min(HITS_PER_PAGE, max(1, round(sample_per_week * (end_ts - start_ts) / WEEK_SECONDS)))
+
 
-        start_ts = int(seg_start.timestamp())
-        end_ts = int(seg_end.timestamp())
+def bucket_cut(start_ts: int, end_ts: int, seed: int = SAMPLE_SEED) -> int:
+    """A seeded point in (start_ts, end_ts]; the bucket's sample is the posts around it"""
+    rng = random.Random(f"{seed}:{start_ts}:{end_ts}")
+    return start_ts + 1 + rng.randrange(end_ts - start_ts)
 
+
+def fetch_window(session, limiter, start_ts: int, end_ts: int, limit: int, api_url: str = API_URL):
+    """
+    The `limit` newest hits created in [start_ts, end_ts), paging through
+    HITS_PER_PAGE-sized pages when one is not enough.
+    """
+    per_page = min(limit, HITS_PER_PAGE)
+    hits, page = [], 0
+    while len(hits) < limit:
         params = {
             "tags": "(story,comment)",
-            "hitsPerPage": HITS_PER_PAGE,
-            "page": 0,
+            "hitsPerPage": per_page,
+            "page": page,
             "numericFilters": f"created_at_i>={start_ts},created_at_i<{end_ts}"
         }
-        resp = requests.get(API_URL, params=params)
-        resp.raise_for_status()
-        hits = resp.json().get("hits", [])
+        batch = get_hits(session, limiter, params, api_url)
+        hits.extend(batch)
+        if len(batch) < per_page:
+            break
+        page += 1
+    return hits[:limit]
+
+
+def fetch_oldest(session, limiter, start_ts: int, end_ts: int, limit: int, span: int, api_url: str = API_URL):
+    """
+    The `limit` (at most HITS_PER_PAGE) oldest hits created in [start_ts,
+    end_ts). search_by_date serves the newest first, so this looks for a
+    window [start_ts, start_ts + span) that fits in one page yet holds
+    `limit` hits, doubling or bisecting `span` (the caller's guess) between
+    one-page calls.
+    """
+    lo, hi = 0, None  # spans known to hold fewer than `limit` hits / a full page
+    while True:
+        span = max(1, min(span, end_ts - start_ts))
+        hits = fetch_window(session, limiter, start_ts, start_ts + span, HITS_PER_PAGE, api_url)
+        complete = len(hits) < HITS_PER_PAGE
+        if complete and (len(hits) >= limit or start_ts + span >= end_ts):
+            break
+        if complete:
+            lo = span
+        else:
+            hi = span
+        if hi is not None and hi - lo <= 1:
+            # more than a page within one second: the page returned is as close as search_by_date gets
+            break
+        span = (lo + hi) // 2 if hi is not None else span * 2
+    return sorted(hits, key=lambda h: h.get("created_at_i", 0))[:limit]
 
-        if len(hits) > SAMPLE_PER_WEEK:
-            hits = random.sample(hits, SAMPLE_PER_WEEK)
 
-        all_hits.extend(hits)
-        time.sleep(0.5)
+def fetch_bucket(session, limiter, start_ts: int, end_ts: int, api_url: str = API_URL,
+                 sample_per_week: int = SAMPLE_PER_WEEK):
+    """
+    Draw one bucket's quota: the posts just before its seeded cut point,
+    newest first, and if those run out, the ones just after it.
+    search_by_date always returns the newest items of a window, so without
+    the cut every draw would sit at the end of its bucket.
+    """
+    quota = bucket_quota(start_ts, end_ts, sample_per_week)
+    cut = bucket_cut(start_ts, end_ts)
+    hits = fetch_window(session, limiter, start_ts, cut, quota, api_url)
+    if len(hits) < quota and cut < end_ts:
+        # guess the span after the cut from the density before it, with room to spare
+        need = quota - len(hits)
+        span = 2 * need * (cut - start_ts) // max(1, len(hits))
+        hits += fetch_oldest(session, limiter, cut, end_ts, need, span, api_url)
+    return hits
+
+
+def fetch_hn_month(year: int, month: int, session=None, limiter=None, api_url: str = API_URL,
+                   sample_per_week: int = SAMPLE_PER_WEEK, bucket_seconds: int = SAMPLE_BUCKET_SECONDS):
+    """
+    Fetch the stratified sample of the given month, one bucket after another.
+    """
+    session = session or make_session()
+    limiter = limiter or TokenBucket(REQUESTS_PER_SECOND)
+    all_hits = []
+
+    for start_ts, end_ts in buckets_to_fetch(year, month, bucket_seconds=bucket_seconds):
+        all_hits.extend(fetch_bucket(session, limiter, start_ts, end_ts, api_url, sample_per_week))
 
     if not all_hits:
         return pd.DataFrame()
@@ -58,6 +242,68 @@ def fetch_hn_month(year: int, month: int):
     return build_dataframe(all_hits, year, month)
 
 
+def iter_hn_months(months, max_workers: int = MAX_WORKERS, rate: float = REQUESTS_PER_SECOND,
+                   api_url: str = API_URL, since=None, sample_per_week: int = SAMPLE_PER_WEEK,
+                   months_in_flight: int = MONTHS_IN_FLIGHT):
+    """
+    Fetch the sample buckets of every (year, month) concurrently over one pooled
+    session, at most `max_workers` requests in flight and `rate` requests per
+    second overall. `since` optionally maps (year, month) to the time it was
+    last fetched; only buckets that were not final then are requested again.
+    Yields ((year, month), DataFrame) in the order of `months`, as each month
+    completes. Only `months_in_flight` months are fetched at a time, so memory
+    stays bounded however long the window is. Months with a failed bucket are
+    reported and skipped.
+    """
+    since = since or {}
+    session = make_session(max_workers)
+    limiter = TokenBucket(rate, capacity=max_workers)
+    fetch = metrics.propagate(fetch_bucket)
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def submit(y, m):
+            return (y, m), [pool.submit(fetch, session, limiter, start_ts, end_ts, api_url, sample_per_week)
+                            for start_ts, end_ts in buckets_to_fetch(y, m, since.get((y, m)))]
+
+        pending = iter(months)
+        in_flight = deque(submit(y, m) for y, m in islice(pending, months_in_flight))
+        while in_flight:
+            (y, m), bucket_futures = in_flight.popleft()
+            try:
+                all_hits = [hit for f in bucket_futures for hit in f.result()]
+            except Exception as e:
+                print(f"→ {y}-{m:02d}: Error: {e}")
+                all_hits = None
+            for y_next, m_next in pending:
+                in_flight.append(submit(y_next, m_next))
+                break
+            if all_hits is None:
+                continue
+            df = build_dataframe(all_hits, y, m)
+            del all_hits
+            print(f"→ {y}-{m:02d}: collected {len(df)} rows")
+            yield (y, m), df
+
+
+def fetch_hn_months(months, max_workers: int = MAX_WORKERS,
+                    rate: float = REQUESTS_PER_SECOND, api_url: str = API_URL, since=None,
+                    sample_per_week: int = SAMPLE_PER_WEEK):
+    """iter_hn_months collected into {(year, month): DataFrame}"""
+    return dict(iter_hn_months(months, max_workers, rate, api_url, since, sample_per_week))
+
+
+def recent_months(num_months: int = NUM_MONTHS, today=None):
+    """
+    The last `num_months` (year, month) pairs, newest first, including the current month.
+    """
+    today = today or datetime.date.today()
+    months = []
+    for i in range(num_months):
+        year_offset, m_idx = divmod(today.month - 1 - i, 12)
+        months.append((today.year + year_offset, m_idx + 1))
+    return months
+
+
 def build_dataframe(hits, year, month):
     rows = []
     for hit in hits:
@@ -83,30 +329,190 @@ def build_dataframe(hits, year, month):
             "score": hit.get("points") or 0,
             "num_comments": hit.get("num_comments") or 0
         })
-    return pd.DataFrame(rows)
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def month_end_ts(year: int, month: int) -> int:
+    return month_bounds(year, month)[1]
+
+
+def partition_path(year: int, month: int, cache_dir: str = CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{year}-{month:02d}.parquet")
+
+
+def load_manifest(cache_dir: str = CACHE_DIR):
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, cache_dir: str = CACHE_DIR):
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def write_partition(df, year: int, month: int, cache_dir: str = CACHE_DIR):
+    """Store already compacted posts (corpus_store.compact_posts) as the month's partition"""
+    corpus_store.write_posts(df, partition_path(year, month, cache_dir))
+
+
+def sample_cache_dir(cache_dir: str = CACHE_DIR, sample_per_week: int = SAMPLE_PER_WEEK,
+                     sampler: str = SAMPLER) -> str:
+    """Partitions drawn with other sample sizes or samplers are not interchangeable, so each has its own directory"""
+    return os.path.join(cache_dir, f"sample-{sample_per_week}-{sampler}")
+
+
+def refresh_cache(months, cache_dir: str = CACHE_DIR, max_workers: int = MAX_WORKERS,
+                  rate: float = REQUESTS_PER_SECOND, api_url: str = API_URL,
+                  sample_per_week: int = SAMPLE_PER_WEEK):
+    """
+    Bring the month-partitioned cache up to date for `months`.
+
+    Each month lives in <cache_dir>/sample-N-<SAMPLER>/YYYY-MM.parquet, tracked in a
+    manifest, and is written as soon as it has been fetched, so only a few
+    months are ever held in memory. Months that had already ended (and been
+    indexed) when they were fetched are closed and never fetched again; open
+    months have the buckets that were not final at their last fetch drawn
+    again, so they converge on the sample a fetch after the month would draw. Partitions more than
+    MAX_NUM_MONTHS months older than the newest requested month are evicted.
+    Concurrent runs take turns through an flock on the cache directory, so the
+    second one reuses what the first fetched instead of racing it.
+
+    Returns {(year, month): rows} for the requested months now cached, oldest first.
+    """
+    cache_dir = sample_cache_dir(cache_dir, sample_per_week)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, ".lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return _refresh_cache(months, cache_dir, max_workers, rate, api_url, sample_per_week)
+
+
+def _refresh_cache(months, cache_dir, max_workers, rate, api_url, sample_per_week):
+    manifest = load_manifest(cache_dir)
+    now = int(time.time())
+    migrate_partitions(months, manifest, cache_dir)
+
+    missing, since = [], {}
+    for y, m in months:
+        entry = manifest.get(f"{y}-{m:02d}")
+        if entry is None or not os.path.exists(partition_path(y, m, cache_dir)):
+            missing.append((y, m))
+        elif not entry["closed"]:
+            since[(y, m)] = entry["fetched_at"]
+    print(f"Cache: {len(months) - len(missing) - len(since)} closed, "
+          f"{len(since)} to refresh, {len(missing)} to fetch")
+    events.emit("cache", closed=len(months) - len(missing) - len(since), refresh=len(since), fetch=len(missing))
+
+    fetched = iter_hn_months(missing + list(since), max_workers=max_workers, rate=rate,
+                             api_url=api_url, since=since, sample_per_week=sample_per_week)
+    for (y, m), df in fetched:
+        key = f"{y}-{m:02d}"
+        # strip HTML, dedupe and type the posts once, here, instead of on every scan
+        df = corpus_store.compact_posts(df)
+        if (y, m) in since:
+            # the refetched buckets replace what was drawn from them before
+            old = corpus_store.read_posts(partition_path(y, m, cache_dir))
+            refetched = buckets_to_fetch(y, m, since[(y, m)], now)
+            if refetched:
+                old = old[(old["created_at"] < refetched[0][0]).to_numpy()]
+            df = corpus_store.merge_posts(old, df)
+        write_partition(df, y, m, cache_dir)
+        high_water = int(df["created_at"].max()) if len(df) else manifest.get(key, {}).get("high_water", 0)
+        manifest[key] = {
+            "rows": len(df),
+            "high_water": high_water,
+            "closed": month_end_ts(y, m) + INDEX_LAG_SECONDS <= now,
+            "fetched_at": now,
+            "format": corpus_store.FORMAT_VERSION,
+        }
+        # checkpoint as we go: an interrupted refresh keeps the months it finished
+        save_manifest(manifest, cache_dir)
+        events.emit("month", month=key, rows=len(df))
+
+    newest = max(months)
+    oldest_kept = recent_months(MAX_NUM_MONTHS, datetime.date(newest[0], newest[1], 1))[-1]
+    for key in list(manifest):
+        y, m = map(int, key.split("-"))
+        if (y, m) < oldest_kept:
+            path = partition_path(y, m, cache_dir)
+            if os.path.exists(path):
+                os.remove(path)
+            del manifest[key]
+    save_manifest(manifest, cache_dir)
+
+    return {(y, m): manifest[f"{y}-{m:02d}"]["rows"]
+            for y, m in sorted(months) if f"{y}-{m:02d}" in manifest}
+
+
+def migrate_partitions(months, manifest, cache_dir):
+    """Rewrite cached partitions of `months` stored in an older format (raw HTML, string ids) as compact ones"""
+    migrated = 0
+    for y, m in months:
+        entry = manifest.get(f"{y}-{m:02d}")
+        path = partition_path(y, m, cache_dir)
+        if entry is None or entry.get("format") == corpus_store.FORMAT_VERSION or not os.path.exists(path):
+            continue
+        df = corpus_store.compact_posts(pd.read_parquet(path))
+        write_partition(df, y, m, cache_dir)
+        entry.update(rows=len(df), format=corpus_store.FORMAT_VERSION)
+        migrated += 1
+    if migrated:
+        save_manifest(manifest, cache_dir)
+        print(f"Cache: migrated {migrated} partition(s) to format {corpus_store.FORMAT_VERSION}")
+
+
+def partition_files(months, cache_dir: str = CACHE_DIR, sample_per_week: int = SAMPLE_PER_WEEK):
+    """Paths of the cached month partitions for `months`, oldest first (the traffic counter's scan shards)"""
+    cache_dir = sample_cache_dir(cache_dir, sample_per_week)
+    paths = [partition_path(y, m, cache_dir) for y, m in sorted(months)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def iter_posts(months, cache_dir: str = CACHE_DIR, sample_per_week: int = SAMPLE_PER_WEEK, columns=None):
+    """Yield the cached posts one month partition at a time (optionally only `columns`), oldest first"""
+    for path in partition_files(months, cache_dir, sample_per_week):
+        yield corpus_store.read_posts(path, columns=columns)
+
+
+def save_posts(posts, parquet_path: str = OUTPUT_PARQUET, csv_path: str = OUTPUT_CSV):
+    """
+    Persist compact posts (a DataFrame or an iterable of month chunks, as
+    iter_posts yields them) as one zstd Parquet file in the corpus_store
+    schema, appending chunk by chunk; fall back to CSV when no Parquet
+    engine is installed.
+    """
+    chunks = [posts] if isinstance(posts, pd.DataFrame) else posts
+    os.makedirs(os.path.dirname(parquet_path) or ".", exist_ok=True)
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        # a stale Parquet file would shadow the fresh CSV in traffic_counter
+        if os.path.exists(parquet_path):
+            os.remove(parquet_path)
+        for i, df in enumerate(chunks):
+            df.to_csv(csv_path, index=False, mode="w" if i == 0 else "a", header=i == 0)
+        print(f"Saved raw HN posts to {csv_path}")
+        return
+
+    tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+    with pq.ParquetWriter(tmp_path, corpus_store.schema(), compression=corpus_store.COMPRESSION,
+                          compression_level=corpus_store.COMPRESSION_LEVEL) as writer:
+        for df in chunks:
+            writer.write_table(corpus_store.to_table(df))
+    os.replace(tmp_path, parquet_path)
+    print(f"Saved raw HN posts to {parquet_path}")
 
 
 def main():
-    today = datetime.date.today()
-    dfs = []
+    cached = refresh_cache(recent_months())
 
-    for i in range(24):
-        year_offset, m_idx = divmod(today.month - 1 - i, 12)
-        y = today.year + year_offset
-        m = m_idx + 1
-        print(f"→ Fetching {y}-{m:02d}…")
-        try:
-            df = fetch_hn_month(y, m)
-            print(f"   collected {len(df)} rows")
-            dfs.append(df)
-        except Exception as e:
-            print(f"   Error: {e}")
-
-    if dfs:
-        result = pd.concat(dfs, ignore_index=True)
-        os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
-        result.to_csv(OUTPUT_CSV, index=False)
-        print(f"Saved raw HN posts to {OUTPUT_CSV}")
+    if sum(cached.values()):
+        save_posts(iter_posts(cached))
     else:
         print("No data fetched; check your network or API limits.")
 
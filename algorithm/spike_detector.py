@@ -1,9 +1,11 @@
+import io
 import os
 import json
 import statistics
 from datetime import datetime
 import csv as _csv
-import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.figure import Figure
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, os.pardir))
@@ -12,6 +14,11 @@ INPUT_CSV = os.path.join(PROJECT_ROOT, 'tmp', 'traffic_avg_per_day.csv')
 BETA = 1.0
 PLOT_PATH = os.path.join(PROJECT_ROOT, 'static', 'spike_plot.png')
 REPORT_JSON = os.path.join(PROJECT_ROOT, 'tmp', 'spike_report.json')
+ROLLING_WINDOW = 12
+EWMA_ALPHA = 0.3
+MAD_SCALE = 1.4826  # makes the MAD a consistent estimator of the stdev for normal data
+# 8-bit palette PNGs are about a third of the size of matplotlib's RGBA ones and look the same for line plots
+PLOT_PALETTE_COLORS = 256
 
 
 def load_monthly_rates(csv_path):
@@ -31,6 +38,11 @@ def load_monthly_rates(csv_path):
     return records
 
 
+def rates_from_rows(rows):
+    """Same as load_monthly_rates, from in-memory (year, month, avg_per_day) rows"""
+    return sorted((datetime(year, month, 1), rate) for year, month, rate in rows)
+
+
 def compute_baseline_stats(rates):
     return {
         'mean': statistics.mean(rates),
@@ -51,37 +63,149 @@ def detect_spike(rates, beta):
     return recommendation, stats, latest, threshold
 
 
-def plot_timeseries(dates, rates, stats, threshold):
-    plt.figure(figsize=(6, 3), dpi=100)
-    plt.plot(dates, rates, marker='o', label='avg_per_day')
-    plt.axhline(stats['mean'], linestyle='--', label='baseline mean')
-    plt.axhline(threshold, linestyle='-.', label=f'mean + {BETA}*std')
-    plt.title('Monthly Average Traffic per Day')
-    plt.xlabel('Month')
-    plt.ylabel('Avg Weighted Traffic per Day')
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(PLOT_PATH, dpi=100, bbox_inches='tight')
-    plt.close()
+def baseline_mask(n_months, window=None):
+    """mask[t, j] is True when month j is in month t's baseline: the `window` months before t (all if None)"""
+    t = np.arange(n_months)[:, None]
+    j = np.arange(n_months)[None, :]
+    mask = j < t
+    if window is not None:
+        mask &= j >= t - window
+    return mask
 
 
-def main():
-    if not os.path.isfile(INPUT_CSV):
-        raise FileNotFoundError(f"Avg-per-day CSV not found: {INPUT_CSV}")
-    data = load_monthly_rates(INPUT_CSV)
-    if len(data) < 2:
-        raise RuntimeError(f"Need at least two months of data, but found {len(data)}")
-    dates, rates = zip(*data)
+def _window_median(values, counts):
+    """Median over the last axis of (series, month, j) values whose masked slots hold +inf"""
+    ordered = np.sort(values, axis=-1)
+    months = np.arange(values.shape[1])
+    lo = ordered[:, months, np.maximum(counts - 1, 0) // 2]
+    hi = ordered[:, months, counts // 2 - (counts == 0)]
+    return np.where(counts > 0, (lo + hi) / 2, np.nan)
+
+
+def baseline_arrays(rates, window=None, alpha=EWMA_ALPHA):
+    """
+    Baseline statistics for every series and every month of a (series, months)
+    array in one vectorized pass. Month t's baseline is the months before it
+    (the last `window` of them when given). Returns (series, months) arrays:
+    mean, stdev (sample), variance (population), median, mad, min, max, ewma
+    and ewm_std. Months without enough history hold NaN.
+    """
+    rates = np.asarray(rates, dtype=float)
+    n_months = rates.shape[1]
+    mask = baseline_mask(n_months, window)
+    counts = mask.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = rates @ mask.T / counts
+        dev = np.where(mask, rates[:, None, :] - mean[:, :, None], 0.0)
+        sq = (dev ** 2).sum(axis=-1)
+        stdev = np.sqrt(sq / (counts - 1))
+        variance = sq / counts
+
+        inf_masked = np.where(mask, rates[:, None, :], np.inf)
+        median = _window_median(inf_masked, counts)
+        abs_dev = np.where(mask, np.abs(rates[:, None, :] - median[:, :, None]), np.inf)
+        mad = _window_median(abs_dev, counts) * MAD_SCALE
+        low = np.where(counts > 0, inf_masked.min(axis=-1), np.nan)
+        high = np.where(counts > 0, np.where(mask, rates[:, None, :], -np.inf).max(axis=-1), np.nan)
+
+        # adjusted EWMA over each baseline: weight (1 - alpha)^(age - 1), normalized
+        ages = np.arange(n_months)[:, None] - np.arange(n_months)[None, :]
+        weights = np.where(mask, (1 - alpha) ** (ages - 1.0), 0.0)
+        weights /= weights.sum(axis=1, keepdims=True)
+        ewma = rates @ weights.T
+        ewm_std = np.sqrt(np.einsum('tj,stj->st', weights, (rates[:, None, :] - ewma[:, :, None]) ** 2))
+    counts = np.broadcast_to(counts, rates.shape)
+    stdev[counts < 2] = np.nan
+    return {
+        'mean': mean, 'stdev': stdev, 'variance': variance, 'median': median, 'mad': mad,
+        'min': low, 'max': high, 'ewma': ewma, 'ewm_std': ewm_std,
+    }
+
+
+def detect_spikes_batch(rates, beta=BETA, window=ROLLING_WINDOW, alpha=EWMA_ALPHA):
+    """
+    Screen many series at once. `rates` is a (series, months) array.
+
+    Returns one dict per series with the fields of the single-series report
+    (baseline: every month before the latest, threshold mean + beta * stdev),
+    plus z-scores of the latest month against a rolling `window`-month
+    baseline, a median/MAD robust baseline and an EWMA baseline.
+    """
+    rates = np.asarray(rates, dtype=float)
+    full = baseline_arrays(rates, None, alpha)
+    rolling = baseline_arrays(rates, window, alpha) if window else full
+    with np.errstate(invalid='ignore', divide='ignore'):
+        threshold = full['mean'] + beta * full['stdev']
+        rolling_z = (rates - rolling['mean']) / rolling['stdev']
+        robust_z = (rates - rolling['median']) / rolling['mad']
+        ewma_z = (rates - rolling['ewma']) / rolling['ewm_std']
+    spike = rates[:, -1] > threshold[:, -1]
 
-    recommendation, stats, latest, threshold = detect_spike(rates, BETA)
-    plot_timeseries(dates, rates, stats, threshold)
+    columns = {
+        'latest_rate': rates[:, -1],
+        'beta': np.full(len(rates), float(beta)),
+        'mean': full['mean'][:, -1],
+        'stdev': full['stdev'][:, -1],
+        'variance': full['variance'][:, -1],
+        'median': full['median'][:, -1],
+        'min': full['min'][:, -1],
+        'max': full['max'][:, -1],
+        'threshold': threshold[:, -1],
+        'rolling_z': rolling_z[:, -1],
+        'robust_z': robust_z[:, -1],
+        'ewma': rolling['ewma'][:, -1],
+        'ewma_z': ewma_z[:, -1],
+    }
+    names = list(columns)
+    reports = [dict(zip(names, map(float, row))) for row in zip(*columns.values())]
+    for report, flag in zip(reports, spike):
+        report['recommendation'] = 'straddle' if flag else 'no_action'
+    return reports
+
+
+def plot_timeseries(dates, rates, stats, threshold, beta=BETA, plot_path=PLOT_PATH):
+    # Figure instead of pyplot: no global state, so safe to call from worker threads
+    fig = Figure(figsize=(6, 3), dpi=100)
+    ax = fig.subplots()
+    ax.plot(dates, rates, marker='o', label='avg_per_day')
+    ax.axhline(stats['mean'], linestyle='--', label='baseline mean')
+    ax.axhline(threshold, linestyle='-.', label=f'mean + {beta}*std')
+    ax.set_title('Monthly Average Traffic per Day')
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Avg Weighted Traffic per Day')
+    ax.legend()
+    fig.tight_layout()
+    save_figure(fig, plot_path)
+
+
+def save_figure(fig, plot_path):
+    """PNGs are quantized to a PLOT_PALETTE_COLORS palette; other formats (e.g. .svg) are saved as is"""
+    if not plot_path.endswith('.png'):
+        fig.savefig(plot_path, bbox_inches='tight')
+        return
+    from PIL import Image
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+    buf.seek(0)
+    with Image.open(buf) as image:
+        image.convert('RGB').quantize(PLOT_PALETTE_COLORS).save(plot_path, optimize=True)
+
+
+def analyze(records, beta=BETA, plot_path=PLOT_PATH):
+    """Detect a spike in sorted (date, rate) records, draw the plot and return the report dict"""
+    if len(records) < 2:
+        raise RuntimeError(f"Need at least two months of data, but found {len(records)}")
+    dates, rates = zip(*records)
+
+    recommendation, stats, latest, threshold = detect_spike(rates, beta)
+    plot_timeseries(dates, rates, stats, threshold, beta, plot_path)
 
     last_date = dates[-1]
-    report = {
+    return {
         'year': last_date.year,
         'month': last_date.month,
         'latest_rate': latest,
-        'beta': BETA,
+        'beta': beta,
         'mean': stats['mean'],
         'stdev': stats['stdev'],
         'variance': stats['variance'],
@@ -90,9 +214,15 @@ def main():
         'max': stats['max'],
         'threshold': threshold,
         'recommendation': recommendation,
-        'plot_path': PLOT_PATH,
-        'input_csv': INPUT_CSV
+        'plot_path': plot_path
     }
+
+
+def main():
+    if not os.path.isfile(INPUT_CSV):
+        raise FileNotFoundError(f"Avg-per-day CSV not found: {INPUT_CSV}")
+    report = analyze(load_monthly_rates(INPUT_CSV), BETA, PLOT_PATH)
+    report['input_csv'] = INPUT_CSV
     with open(REPORT_JSON, 'w', encoding='utf-8') as f:
         json.dump(report, f, indent=2)
 
@@ -1,27 +1,179 @@
+import os
 import csv
 import re
+import time
 import calendar
-from collections import defaultdict
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from algorithm import corpus_store, events
 
 DATA_CSV = 'tmp/hn_raw_posts.csv'
+DATA_PARQUET = 'tmp/hn_raw_posts.parquet'
 KEYWORDS_FILE = 'tmp/keywords.txt'
 THRESHOLD = 2
 STORY_WEIGHT = 1.0
 COMMENT_WEIGHT = 0.4
 OUTPUT_CSV = 'tmp/traffic_avg_per_day.csv'
+KEYWORD_MATRIX = 'tmp/keyword_month.npz'
+TOP_KEYWORDS = 10
+MATCHER_ENGINE = 'trie'
+TYPE_WEIGHTS = {'story': STORY_WEIGHT, 'comment': COMMENT_WEIGHT}
+FRAME_COLUMNS = ['year', 'month', 'created_at', 'type', 'body']
+CHUNK_ROWS = 100_000
+# processes scanning shards (month partitions or Parquet row groups); 1 scans in-process
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', 1))
+# shards queued per worker beyond the one it is scanning, which bounds memory when shards are DataFrames
+SHARDS_IN_FLIGHT = 2
+
+
+def read_keywords(path: str):
+    """Load the raw keyword strings, one per line"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
 
 
 def load_keywords(path: str):
     """Load keywords and compile into regex patterns"""
-    with open(path, 'r', encoding='utf-8') as f:
-        kws = [line.strip() for line in f if line.strip()]
     return [re.compile(r"\b" + re.escape(kw) + r"\b", flags=re.IGNORECASE)
-            for kw in kws]
+            for kw in read_keywords(path)]
+
+
+class PatternMatcher:
+    """Reference engine: one regex per keyword, summed findall counts."""
+
+    def __init__(self, keywords):
+        self.patterns = [re.compile(r"\b" + re.escape(kw) + r"\b", flags=re.IGNORECASE)
+                         for kw in keywords]
+
+    def count(self, text: str) -> int:
+        return sum(len(p.findall(text)) for p in self.patterns)
+
+    def keyword_counts(self, text: str) -> dict:
+        """{keyword index: occurrences} for every keyword found in text"""
+        counts = {}
+        for i, p in enumerate(self.patterns):
+            n = len(p.findall(text))
+            if n:
+                counts[i] = n
+        return counts
+
+
+class TrieMatcher:
+    """Single-pass engine: all keywords folded into one trie-shaped regex.
+
+    Counts are identical to PatternMatcher: every keyword is counted
+    independently (overlapping keywords both count, repeats of one keyword
+    never overlap), with word-boundary and case-insensitive semantics.
+    """
+
+    _WORD = re.compile(r"\w")
+    # the only non-ASCII characters re.IGNORECASE equates with ASCII letters
+    _IRREGULAR = re.compile("[\u0130\u0131\u017f\u212a]")
+
+    def __init__(self, keywords):
+        self.fallback = PatternMatcher(keywords)
+        # non-ASCII keywords have irregular case folding; keep them per-pattern
+        self.extra_indices = [i for i, kw in enumerate(keywords) if not kw.isascii()]
+        self.extra = PatternMatcher([keywords[i] for i in self.extra_indices])
+        # lowercased key -> indices of the keywords it stands for (case variants and duplicates)
+        self.key_indices = defaultdict(list)
+        for i, kw in enumerate(keywords):
+            if kw.isascii():
+                self.key_indices[kw.lower()].append(i)
+        self.multiplicity = {k: len(v) for k, v in self.key_indices.items()}
+        keys = sorted(self.multiplicity)
+        # for each keyword, the lengths of shorter keywords that are its prefix
+        self.prefix_lengths = {
+            k: sorted({len(o) for o in keys if len(o) < len(k) and k.startswith(o)})
+            for k in keys
+        }
+        trie = {}
+        for k in keys:
+            node = trie
+            for ch in k:
+                node = node.setdefault(ch, {})
+            node[''] = {}
+        body = self._render(trie) if keys else '(?!)'
+        # matched against lowercased text, so no IGNORECASE (it defeats sre's literal fast path)
+        self.pattern = re.compile(r"(?=\b(" + body + r")\b)")
 
+    def _render(self, node):
+        alts = [re.escape(ch) + self._render(child)
+                for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ''
+        group = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        if '' in node:
+            # greedy optional: longer keywords are tried before this one ends
+            return '(?:' + group + ')?'
+        return group
 
-def compute_weighted_counts_and_days(data_csv: str, patterns: list):
-    """Read data_csv and return two dicts:
+    def _boundary(self, text: str, i: int) -> bool:
+        before = i > 0 and self._WORD.match(text, i - 1) is not None
+        after = i < len(text) and self._WORD.match(text, i) is not None
+        return before != after
+
+    def _scan(self, text: str) -> dict:
+        """{lowercased key: occurrences} over the trie keywords, for already lowercased text"""
+        found = defaultdict(int)
+        last_end = {}
+        for m in self.pattern.finditer(text):
+            start = m.start(1)
+            key = m.group(1)
+            hits = [key]
+            for n in self.prefix_lengths[key]:
+                if self._boundary(text, start + n):
+                    hits.append(key[:n])
+            for k in hits:
+                if start >= last_end.get(k, 0):
+                    last_end[k] = start + len(k)
+                    found[k] += 1
+        return found
+
+    def count(self, text: str) -> int:
+        if self._IRREGULAR.search(text):
+            return self.fallback.count(text)
+        occ = self.extra.count(text) if self.extra.patterns else 0
+        for k, n in self._scan(text.lower()).items():
+            occ += n * self.multiplicity[k]
+        return occ
+
+    def keyword_counts(self, text: str) -> dict:
+        """Same as PatternMatcher.keyword_counts, from the single trie scan"""
+        if self._IRREGULAR.search(text):
+            return self.fallback.keyword_counts(text)
+        counts = {}
+        if self.extra.patterns:
+            for j, n in self.extra.keyword_counts(text).items():
+                counts[self.extra_indices[j]] = n
+        for k, n in self._scan(text.lower()).items():
+            for i in self.key_indices[k]:
+                counts[i] = n
+        return counts
+
+
+MATCHERS = {
+    'regex': PatternMatcher,
+    'trie': TrieMatcher,
+}
+
+
+def build_matcher(keywords, engine: str = MATCHER_ENGINE):
+    """Return a matcher exposing count(text) -> total keyword occurrences
+    and keyword_counts(text) -> {keyword index: occurrences}"""
+    try:
+        return MATCHERS[engine](keywords)
+    except KeyError:
+        raise ValueError(f"Unknown matcher engine: {engine}") from None
+
+
+def compute_weighted_counts_and_days(data_csv: str, matcher):
+    """Read data_csv, counting keyword hits per row with `matcher`, and return two dicts:
     1) counts[(year,month)] = weighted count
     2) days_seen[(year,month)] = max day-of-month observed in data
     """
@@ -40,7 +192,7 @@ def compute_weighted_counts_and_days(data_csv: str, patterns: list):
             if dt.year == year and dt.month == month:
                 days_seen[(year, month)] = max(days_seen[(year, month)], dt.day)
             text = row.get('body', '') or ''
-            occ = sum(len(p.findall(text)) for p in patterns)
+            occ = matcher.count(text)
             if occ < THRESHOLD:
                 continue
             post_type = row.get('type', '').strip().lower()
@@ -51,27 +203,409 @@ def compute_weighted_counts_and_days(data_csv: str, patterns: list):
     return counts, days_seen
 
 
-def main():
-    patterns = load_keywords(KEYWORDS_FILE)
-    counts, days_seen = compute_weighted_counts_and_days(DATA_CSV, patterns)
+def iter_posts_frames(path: str, chunk_rows: int = CHUNK_ROWS):
+    """load_posts_frame in chunks of at most chunk_rows rows (Feather files come whole)"""
+    if path.endswith('.feather'):
+        yield load_posts_frame(path)
+    elif path.endswith('.csv'):
+        yield from pd.read_csv(path, usecols=FRAME_COLUMNS, dtype={'type': str, 'body': str},
+                               chunksize=chunk_rows)
+    else:
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_rows,
+                                                                         columns=FRAME_COLUMNS):
+            yield batch.to_pandas()
+
+
+def as_chunks(posts):
+    """Posts arrive as one DataFrame or as an iterable of shards (see read_shard)"""
+    return (posts,) if isinstance(posts, pd.DataFrame) else posts
+
+
+def file_shards(path: str, chunk_rows: int = CHUNK_ROWS):
+    """
+    Split a posts file into scan shards: runs of whole Parquet row groups of
+    about chunk_rows rows, as (path, row_groups) pairs that a worker reads
+    itself. A CSV file is cut into DataFrame chunks and a Feather file is one shard.
+    """
+    if path.endswith('.feather'):
+        return [path]
+    if path.endswith('.csv'):
+        return iter_posts_frames(path, chunk_rows)
+    import pyarrow.parquet as pq
+    meta = pq.ParquetFile(path, memory_map=True).metadata
+    shards, groups, rows = [], [], 0
+    for i in range(meta.num_row_groups):
+        groups.append(i)
+        rows += meta.row_group(i).num_rows
+        if rows >= chunk_rows:
+            shards.append((path, groups))
+            groups, rows = [], 0
+    if groups:
+        shards.append((path, groups))
+    return shards
+
+
+def read_shard(shard):
+    """The posts of one shard: a DataFrame as is, a file path whole, or (path, row_groups) of a Parquet file"""
+    if isinstance(shard, pd.DataFrame):
+        return shard
+    if isinstance(shard, str):
+        return load_posts_frame(shard)
+    import pyarrow.parquet as pq
+    path, row_groups = shard
+    return pq.ParquetFile(path, memory_map=True).read_row_groups(row_groups, columns=FRAME_COLUMNS).to_pandas()
+
+
+def merge_days_seen(total, days_seen):
+    for ym, day in days_seen.items():
+        total[ym] = max(total[ym], day)
+
+
+_worker_matcher = None
+
+
+def _init_scan_worker(keywords, engine):
+    global _worker_matcher
+    _worker_matcher = build_matcher(keywords, engine)
+
+
+def _scan_shard(fn, shard, args):
+    return fn(read_shard(shard), _worker_matcher, *args)
+
+
+def scan_pool(workers: int, keywords, engine: str = MATCHER_ENGINE):
+    """
+    A process pool whose workers each compile the matcher once. Workers come
+    from a forkserver that has already imported this module, so they start
+    fast and never inherit the locks of a threaded parent (the web app).
+    """
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload([__name__])
+    return ProcessPoolExecutor(workers, mp_context=context, initializer=_init_scan_worker,
+                               initargs=(keywords, engine))
+
+
+def scan_shards(shards, fn, keywords, engine: str = MATCHER_ENGINE, args=(), workers: int = SCAN_WORKERS):
+    """
+    Yield fn(posts, matcher, *args) for every shard, in shard order.
+
+    With workers > 1 the shards are scanned by a process pool, at most
+    SHARDS_IN_FLIGHT per worker ahead of the caller. Each shard's partial
+    result is computed exactly as in-process and handed back in the same
+    order, so merging them gives bit-identical totals for any worker count.
+    """
+    total = len(shards) if hasattr(shards, '__len__') else None
+    for done, result in enumerate(_scan_results(shards, fn, keywords, engine, args, workers), 1):
+        events.emit('shard', done=done, total=total)
+        yield result
+
+
+def _scan_results(shards, fn, keywords, engine, args, workers):
+    if workers <= 1:
+        matcher = build_matcher(keywords, engine)
+        for shard in shards:
+            yield fn(read_shard(shard), matcher, *args)
+        return
+    with scan_pool(workers, keywords, engine) as pool:
+        pending = deque()
+        for shard in shards:
+            pending.append(pool.submit(_scan_shard, fn, shard, args))
+            if len(pending) >= workers * (SHARDS_IN_FLIGHT + 1):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def load_posts_frame(path: str):
+    """Load only the columns the counter needs from a Parquet, Feather or CSV file"""
+    if path.endswith('.feather'):
+        return pd.read_feather(path, columns=FRAME_COLUMNS)
+    if path.endswith('.csv'):
+        return pd.read_csv(path, usecols=FRAME_COLUMNS, dtype={'type': str, 'body': str})
+    return corpus_store.read_posts(path, columns=FRAME_COLUMNS)
+
+
+def local_dates(ts):
+    """Split int64 epoch seconds into local (year, month, day) arrays, as datetime.fromtimestamp would"""
+    # UTC offsets only change on quarter-hour boundaries, so look them up once per bucket
+    buckets, inverse = np.unique(ts // 900, return_inverse=True)
+    offsets = np.array([calendar.timegm(time.localtime(int(b) * 900)) - int(b) * 900
+                        for b in buckets], dtype=np.int64)
+    local = (ts + offsets[inverse]).astype('datetime64[s]')
+    months = local.astype('datetime64[M]')
+    day = (local.astype('datetime64[D]') - months).astype(np.int64) + 1
+    months = months.astype(np.int64)
+    return months // 12 + 1970, months % 12 + 1, day
 
+
+def _frame_rows(df):
+    """Valid rows of a posts DataFrame: (year, month, type weight, body) plus the days_seen dict"""
+    year = pd.to_numeric(df['year'], errors='coerce')
+    month = pd.to_numeric(df['month'], errors='coerce')
+    ts = pd.to_numeric(df['created_at'], errors='coerce')
+    valid = (year.notna() & month.notna() & ts.notna()).to_numpy()
+    year = year.to_numpy()[valid].astype(np.int64)
+    month = month.to_numpy()[valid].astype(np.int64)
+    ts = ts.to_numpy()[valid].astype(np.int64)
+    if not valid.any():
+        return year, month, np.empty(0), [], defaultdict(int)
+
+    local_year, local_month, local_day = local_dates(ts)
+    in_month = (local_year == year) & (local_month == month)
+    days = (pd.DataFrame({'year': year[in_month], 'month': month[in_month],
+                          'day': local_day[in_month]})
+            .groupby(['year', 'month'])['day'].max())
+    days_seen = defaultdict(int, {(int(y), int(m)): int(d) for (y, m), d in days.items()})
+
+    bodies = df['body'][valid].fillna('').astype(str)
+    # weigh each distinct type once (the compact store keeps `type` categorical already)
+    types = df['type'][valid].astype('category')
+    type_weights = (pd.Series(types.cat.categories.astype(str)).str.strip().str.lower()
+                    .map(TYPE_WEIGHTS).to_numpy(dtype=float, na_value=np.nan))
+    # code -1 (missing type) picks the trailing NaN
+    weight = np.append(type_weights, np.nan)[types.cat.codes.to_numpy()]
+    return year, month, weight, bodies, days_seen
+
+
+def compute_weighted_counts_and_days_frame(df, matcher):
+    """Columnar version of compute_weighted_counts_and_days.
+
+    Takes a DataFrame with the hn_raw_posts schema and returns the same two
+    dicts, using vectorized group-bys instead of per-row accumulation. Only
+    the keyword scan itself still runs once per body.
+    """
+    year, month, weight, bodies, days_seen = _frame_rows(df)
+    if not len(bodies):
+        return defaultdict(float), days_seen
+    occ = np.fromiter((matcher.count(text) for text in bodies), dtype=np.int64, count=len(bodies))
+    hit = (occ >= THRESHOLD) & ~np.isnan(weight)
+    weighted = (pd.DataFrame({'year': year[hit], 'month': month[hit], 'weight': weight[hit]})
+                .groupby(['year', 'month'])['weight'].sum())
+
+    counts = defaultdict(float, {(int(y), int(m)): float(w) for (y, m), w in weighted.items()})
+    return counts, days_seen
+
+
+def compute_keyword_month_matrix(df, matcher, n_keywords: int):
+    """Per-keyword version of compute_weighted_counts_and_days_frame, from the same single scan.
+
+    Returns (matrix, months, days_seen): matrix is a sparse CSR
+    (keyword, month) array of weighted counts over the sorted (year, month)
+    list `months`. A row passing THRESHOLD still adds its type weight once,
+    split across its keywords by their share of its occurrences, so each
+    column sums to that month's weighted count.
+    """
+    year, month, weight, bodies, days_seen = _frame_rows(df)
+    codes = year * 12 + month - 1
+    kw_rows, month_codes, data = [], [], []
+    for text, w, code in zip(bodies, weight, codes):
+        if np.isnan(w):
+            continue
+        found = matcher.keyword_counts(text)
+        occ = sum(found.values())
+        if occ < THRESHOLD:
+            continue
+        share = w / occ
+        for i, n in found.items():
+            kw_rows.append(i)
+            month_codes.append(code)
+            data.append(n * share)
+
+    matrix, months = _keyword_month_csr(kw_rows, month_codes, data, n_keywords)
+    return matrix, months, days_seen
+
+
+def _keyword_month_csr(kw_rows, month_codes, data, n_keywords: int):
+    """Sum (keyword, year * 12 + month - 1, weight) triples into a CSR matrix over the sorted months"""
+    month_codes, cols = np.unique(np.asarray(month_codes, dtype=np.int64), return_inverse=True)
+    matrix = sparse.coo_matrix((np.asarray(data, dtype=float), (np.asarray(kw_rows, dtype=np.int64), cols)),
+                               shape=(n_keywords, len(month_codes))).tocsr()
+    months = [(int(c) // 12, int(c) % 12 + 1) for c in month_codes]
+    return matrix, months
+
+
+def merge_keyword_month_matrices(parts, n_keywords: int):
+    """
+    Sum per-shard (matrix, months, days_seen) results of
+    compute_keyword_month_matrix into one. Only one shard's partial sums are
+    held at a time, so memory does not grow with the corpus.
+    """
+    kw_rows, month_codes, data = [], [], []
+    days_seen = defaultdict(int)
+    for matrix, months, days in parts:
+        coo = matrix.tocoo()
+        codes = np.array([y * 12 + m - 1 for y, m in months], dtype=np.int64)
+        kw_rows.append(coo.row)
+        month_codes.append(codes[coo.col])
+        data.append(coo.data)
+        merge_days_seen(days_seen, days)
+    if not data:
+        return sparse.csr_matrix((n_keywords, 0)), [], days_seen
+    matrix, months = _keyword_month_csr(np.concatenate(kw_rows), np.concatenate(month_codes),
+                                        np.concatenate(data), n_keywords)
+    return matrix, months, days_seen
+
+
+def counts_from_matrix(matrix, months):
+    """Monthly weighted totals (the counts dict) as the column sums of a keyword x month matrix"""
+    totals = np.asarray(matrix.sum(axis=0)).ravel()
+    return defaultdict(float, {ym: float(t) for ym, t in zip(months, totals)})
+
+
+def top_keywords(matrix, keywords, months, n: int = TOP_KEYWORDS):
+    """The n keywords contributing most to the latest month, with their weighted count and share"""
+    if not months:
+        return []
+    column = matrix[:, len(months) - 1].toarray().ravel()
+    total = column.sum()
+    order = np.argsort(-column, kind='stable')[:n]
+    return [{'keyword': keywords[i], 'weighted': round(float(column[i]), 4),
+             'share': round(float(column[i] / total), 4)}
+            for i in order if column[i] > 0]
+
+
+def save_keyword_matrix(path: str, matrix, keywords, months):
+    """Write the CSR arrays with their keyword and month labels to one compressed .npz"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                            shape=np.array(matrix.shape), keywords=np.array(keywords, dtype=str),
+                            months=np.array(months, dtype=np.int64).reshape(-1, 2))
+    os.replace(tmp_path, path)
+
+
+def load_keyword_matrix(path: str):
+    """Inverse of save_keyword_matrix: returns (matrix, keywords, months)"""
+    with np.load(path) as z:
+        matrix = sparse.csr_matrix((z['data'], z['indices'], z['indptr']), shape=tuple(z['shape']))
+        return matrix, z['keywords'].tolist(), [tuple(ym) for ym in z['months'].tolist()]
+
+
+def compute_avg_per_day(counts, days_seen):
+    """Return sorted [(year, month, avg_per_day)] rows.
+
+    Every month is normalized by its length except the latest, which uses the
+    last day actually observed. Averages are rounded to the 4 decimals the CSV
+    checkpoint keeps, so in-process and file-based runs agree.
+    """
     months = sorted(counts.keys())
     if not months:
-        return
+        return []
     last_month = months[-1]
 
-    with open(OUTPUT_CSV, 'w', encoding='utf-8', newline='') as csvfile:
+    rows = []
+    for ym in months:
+        year, month = ym
+        weighted = counts[ym]
+        if ym == last_month:
+            days = days_seen.get(ym, calendar.monthrange(year, month)[1])
+        else:
+            days = calendar.monthrange(year, month)[1]
+        avg = weighted / days if days else 0.0
+        rows.append((year, month, round(avg, 4)))
+    return rows
+
+
+def count_traffic(posts, keywords, engine: str = MATCHER_ENGINE, workers: int = SCAN_WORKERS):
+    """In-process entry point: raw posts (DataFrame or shards) + keywords -> avg-per-day rows"""
+    counts, days_seen = defaultdict(float), defaultdict(int)
+    for chunk_counts, chunk_days in scan_shards(as_chunks(posts), compute_weighted_counts_and_days_frame,
+                                                keywords, engine, workers=workers):
+        for ym, weighted in chunk_counts.items():
+            counts[ym] += weighted
+        merge_days_seen(days_seen, chunk_days)
+    return compute_avg_per_day(counts, days_seen)
+
+
+def count_traffic_by_keyword(posts, keywords, engine: str = MATCHER_ENGINE, workers: int = SCAN_WORKERS):
+    """count_traffic plus the keyword x month matrix it was derived from: (rows, matrix, months)"""
+    parts = scan_shards(as_chunks(posts), compute_keyword_month_matrix, keywords, engine,
+                        args=(len(keywords),), workers=workers)
+    matrix, months, days_seen = merge_keyword_month_matrices(parts, len(keywords))
+    return compute_avg_per_day(counts_from_matrix(matrix, months), days_seen), matrix, months
+
+
+def compute_query_month_counts(df, matcher, query_keywords, n_keywords: int):
+    """Weighted counts for many keyword sets from one scan of the corpus.
+
+    `matcher` covers the union vocabulary and query_keywords[q] lists the
+    vocabulary indices of query q (repeats allowed). Each row is scanned
+    once; its per-keyword counts are summed per query and the THRESHOLD test
+    applied to each query separately. Returns (counts, months, days_seen, hits):
+    counts is a (query, month) array over the sorted months of the corpus and
+    hits a boolean array of the same shape marking where a query had any.
+    """
+    year, month, weight, bodies, days_seen = _frame_rows(df)
+    month_codes, row_month = np.unique(year * 12 + month - 1, return_inverse=True)
+    months = [(int(c) // 12, int(c) % 12 + 1) for c in month_codes]
+
+    indptr, indices, data = [0], [], []
+    for text, w in zip(bodies, weight):
+        if not np.isnan(w):
+            found = matcher.keyword_counts(text)
+            indices.extend(found)
+            data.extend(found.values())
+        indptr.append(len(indices))
+    hits = sparse.csr_matrix((np.array(data, dtype=np.int64), np.array(indices, dtype=np.int64), indptr),
+                             shape=(len(bodies), n_keywords))
+    q_cols = [q for q, kws in enumerate(query_keywords) for _ in kws]
+    k_rows = [i for kws in query_keywords for i in kws]
+    membership = sparse.coo_matrix((np.ones(len(k_rows), dtype=np.int64), (k_rows, q_cols)),
+                                   shape=(n_keywords, len(query_keywords))).tocsr()
+
+    occ = (hits @ membership).tocoo()
+    keep = occ.data >= THRESHOLD
+    rows, queries = occ.row[keep], occ.col[keep]
+    counts = np.zeros((len(query_keywords), len(months)))
+    np.add.at(counts, (queries, row_month[rows]), weight[rows])
+    hits = np.zeros(counts.shape, dtype=bool)
+    hits[queries, row_month[rows]] = True
+    return counts, months, days_seen, hits
+
+
+def count_traffic_multi(posts, keyword_sets, engine: str = MATCHER_ENGINE, workers: int = SCAN_WORKERS):
+    """count_traffic for many keyword lists over the same posts, scanning them once.
+
+    `posts` is a DataFrame or an iterable of shards. Returns (series, months):
+    series[q] holds query q's rows exactly as count_traffic(posts, keyword_sets[q])
+    gives them (months with hits only, the latest normalized by its days seen),
+    and `months` lists every (year, month) in the corpus.
+    """
+    vocab = list(dict.fromkeys(kw for kws in keyword_sets for kw in kws))
+    position = {kw: i for i, kw in enumerate(vocab)}
+    query_keywords = [[position[kw] for kw in kws] for kws in keyword_sets]
+    by_month = defaultdict(lambda: np.zeros(len(keyword_sets)))
+    hit = defaultdict(lambda: np.zeros(len(keyword_sets), dtype=bool))
+    days_seen = defaultdict(int)
+    for counts, months, days, hits in scan_shards(as_chunks(posts), compute_query_month_counts, vocab, engine,
+                                                  args=(query_keywords, len(vocab)), workers=workers):
+        for ym, column, column_hits in zip(months, counts.T, hits.T):
+            by_month[ym] += column
+            hit[ym] |= column_hits
+        merge_days_seen(days_seen, days)
+    months = sorted(by_month)
+    series = [compute_avg_per_day({ym: float(by_month[ym][q]) for ym in months if hit[ym][q]}, days_seen)
+              for q in range(len(keyword_sets))]
+    return series, months
+
+
+def write_avg_per_day(rows, output_csv: str):
+    if not rows:
+        return
+    with open(output_csv, 'w', encoding='utf-8', newline='') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(['year', 'month', 'avg_per_day'])
-        for ym in months:
-            year, month = ym
-            weighted = counts[ym]
-            if ym == last_month:
-                days = days_seen.get(ym, calendar.monthrange(year, month)[1])
-            else:
-                days = calendar.monthrange(year, month)[1]
-            avg = weighted / days if days else 0.0
+        for year, month, avg in rows:
             writer.writerow([year, month, f"{avg:.4f}"])
 
+
+def main():
+    keywords = read_keywords(KEYWORDS_FILE)
+    shards = file_shards(DATA_PARQUET if os.path.isfile(DATA_PARQUET) else DATA_CSV)
+    rows, matrix, months = count_traffic_by_keyword(shards, keywords)
+    write_avg_per_day(rows, OUTPUT_CSV)
+    save_keyword_matrix(KEYWORD_MATRIX, matrix, keywords, months)
+
 if __name__ == '__main__':
     main()
@@ -1,9 +1,49 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
-import markdown as md_lib
-from algorithm.inference import validate_input, run_inference
+import os
+import gc
+import json
+import time
+import threading
+from flask import (Flask, Response, render_template, request, redirect, url_for, flash, jsonify, abort, send_file,
+                   stream_with_context)
+from werkzeug.security import safe_join
+from algorithm.inference import (validate_input, parse_run_params, cached_result, run_inference,
+                                 write_report_page, REPORT_PAGE)
+from algorithm.batch import parse_queries, run_batch
+from algorithm.keyword_expansion import warm_up
+from algorithm.jobs import JobQueue, SQLiteJobStore, QueueFull, STALE_SECONDS, STALE_ERROR
+from algorithm import metrics, scrape_reddit, events
+
+# Load the embedding model while the app is imported. Under `gunicorn --preload`
+# that happens once in the master, and the forked workers share the weights.
+if os.environ.get("PRELOAD_MODEL"):
+    warm_up(encode=False)
+    # keep later collections from writing to (and so un-sharing) the preloaded pages
+    gc.freeze()
+
+# result folders are never rewritten once published, so browsers and proxies may keep them
+RESULT_MAX_AGE = 86400
+# a viewer of a job run by another worker process re-reads the job store this often
+STORE_POLL_SECONDS = 2
+# an open event stream holds one of the worker's threads (gunicorn --threads in the Dockerfile), so
+# streams are capped below that and the remaining threads always serve pages and the API; viewers
+# over the cap are turned away with a 503 and fall back to polling /api/jobs/<id>
+MAX_EVENT_STREAMS = int(os.environ.get("MAX_EVENT_STREAMS", 48))
+# event streams must reach the browser unbuffered, also through nginx
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 app = Flask(__name__)
 app.secret_key = "replace-with-a-secure-random-string"
+# also covers the per-result plots under /static/results/<folder>/
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = RESULT_MAX_AGE
+
+jobs = JobQueue(run_inference, store=SQLiteJobStore())
+# batch jobs share the job store, so /job/<id> and /api/jobs/<id> report on them too
+batches = JobQueue(run_batch, store=jobs.store, max_workers=1)
+event_streams = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+def run_params(source):
+    """Optional window length and HN sample size from a form or JSON body; raises ValueError"""
+    return parse_run_params(source.get("num_months"), source.get("sample_per_week"))
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -17,25 +57,195 @@ def index():
             return redirect(url_for("index"))
 
         try:
-            folder = run_inference(text)
-            return redirect(url_for("show_result", folder=folder))
-        except Exception as e:
+            params = run_params(request.form)
+            # an identical (normalized) query is answered from the result cache without queueing
+            folder = cached_result(text, **params)
+            if folder:
+                return redirect(url_for("show_result", folder=folder))
+            job_id = jobs.submit(text, **params)
+        except (ValueError, QueueFull) as e:
             flash(f"❌ Error: {e}")
             return redirect(url_for("index"))
+        return redirect(url_for("show_job", job_id=job_id))
+
+    return render_template("index.html", num_months=scrape_reddit.NUM_MONTHS,
+                           max_months=scrape_reddit.MAX_NUM_MONTHS,
+                           sample_per_week=scrape_reddit.SAMPLE_PER_WEEK,
+                           max_sample=scrape_reddit.MAX_SAMPLE_PER_WEEK)
 
-    return render_template("index.html")
+@app.route("/job/<job_id>")
+def show_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        flash("❌ Job not found.")
+        return redirect(url_for("index"))
+    if job["status"] == "done":
+        return redirect(url_for("show_result", folder=job["folder"]))
+    return render_template("job.html", job=job)
+
+@app.route("/api/jobs", methods=["POST"])
+def submit_job():
+    payload = request.get_json(silent=True) or request.form
+    text = payload.get("user_input", "")
+    if not validate_input(text):
+        return jsonify(error="invalid input"), 400
+    try:
+        params = run_params(payload)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    folder = cached_result(text, **params)
+    if folder:
+        return jsonify(status="done", cached=True, folder=folder,
+                       result_url=url_for("show_result", folder=folder)), 200
+    try:
+        job_id = jobs.submit(text, **params)
+    except QueueFull as e:
+        return jsonify(error=str(e)), 503
+    return jsonify(job_id=job_id, status_url=url_for("job_status", job_id=job_id)), 202
+
+@app.route("/api/batches", methods=["POST"])
+def submit_batch():
+    """Queries as a JSON list, an uploaded file or form text, one query per line"""
+    payload = request.get_json(silent=True) or {}
+    if "queries" in request.files:
+        text = request.files["queries"].read().decode("utf-8", errors="replace")
+    elif isinstance(payload.get("queries"), list):
+        text = "\n".join(str(q) for q in payload["queries"])
+    else:
+        text = str(request.form.get("queries") or payload.get("queries") or "")
+    try:
+        queries = parse_queries(text)
+        params = run_params(payload or request.form)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    try:
+        job_id = batches.submit("\n".join(queries), **params)
+    except QueueFull as e:
+        return jsonify(error=str(e)), 503
+    return jsonify(job_id=job_id, queries=len(queries),
+                   status_url=url_for("job_status", job_id=job_id)), 202
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    if job["status"] == "done":
+        job["result_url"] = url_for("show_result", folder=job["folder"])
+    return jsonify(job)
+
+def sse(kind: str, data: dict, event_id: int = None) -> str:
+    """One Server-Sent Events message"""
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+def with_result_url(kind: str, data: dict) -> dict:
+    if kind == "done" and data.get("folder"):
+        return dict(data, result_url=url_for("show_result", folder=data["folder"]))
+    return data
+
+def broker_events(job_id: str, last_id: int):
+    """The job's channel, as published by the pipeline running it in this process"""
+    metrics.REGISTRY.inc("event_viewers")
+    try:
+        for event in jobs.broker.subscribe(job_id, last_id):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            event_id, kind, data = event
+            yield sse(kind, with_result_url(kind, data), event_id)
+    finally:
+        metrics.REGISTRY.inc("event_viewers", -1)
+
+def store_events(job_id: str):
+    """
+    Stages and status from the job store, for jobs this worker is not running
+    (or ran long ago). Live jobs are refreshed by their queue's heartbeat,
+    so one silent for STALE_SECONDS was lost with its worker (on this host,
+    jobs.get already fails those as soon as the owner is gone): it is marked
+    failed and the stream ends.
+    """
+    seen, status, sent = 0, None, time.time()
+    while True:
+        job = jobs.get(job_id)
+        for stage in job["stages"][seen:]:
+            yield sse("stage", stage)
+            sent = time.time()
+        seen = len(job["stages"])
+        if job["status"] == "done":
+            yield sse("done", with_result_url("done", {"folder": job["folder"]}))
+            return
+        if job["status"] == "failed":
+            yield sse("failed", {"error": job["error"]})
+            return
+        if time.time() - job["updated"] > STALE_SECONDS:
+            jobs.store.update(job_id, status="failed", error=STALE_ERROR, updated=time.time())
+            yield sse("failed", {"error": STALE_ERROR})
+            return
+        if job["status"] != status:
+            status = job["status"]
+            yield sse("status", {"status": status})
+            sent = time.time()
+        elif time.time() - sent >= events.KEEPALIVE_SECONDS:
+            # lets the server notice a viewer that went away, and free its thread
+            yield ": keepalive\n\n"
+            sent = time.time()
+        time.sleep(STORE_POLL_SECONDS)
+
+@app.route("/api/jobs/<job_id>/events")
+def job_events(job_id):
+    """
+    Live progress of a job as Server-Sent Events: status changes, stages,
+    months fetched, shards counted and stage timings, ending with a `done`
+    (carrying result_url) or `failed` event. Reconnecting clients resume
+    after their Last-Event-ID. Past MAX_EVENT_STREAMS open streams in this
+    worker, answers 503 and the page polls instead.
+    """
+    if jobs.get(job_id) is None:
+        abort(404)
+    if not event_streams.acquire(blocking=False):
+        metrics.count("event_streams_refused")
+        return Response("Too many open event streams; poll /api/jobs/<id> instead.\n", status=503,
+                        mimetype="text/plain", headers={"Retry-After": str(STORE_POLL_SECONDS)})
+    last_id = request.headers.get("Last-Event-ID", "")
+    if jobs.broker.has(job_id):
+        stream = broker_events(job_id, int(last_id) if last_id.isdigit() else 0)
+    else:
+        stream = store_events(job_id)
+    response = Response(stream_with_context(stream), mimetype="text/event-stream", headers=STREAM_HEADERS)
+    # runs when the stream ends or the viewer disconnects, even if it never started
+    response.call_on_close(event_streams.release)
+    return response
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus text exposition of this worker's counters (see algorithm/metrics.py)"""
+    metrics.REGISTRY.set("jobs_pending", jobs.store.count_pending())
+    metrics.REGISTRY.set("peak_rss_bytes", metrics.peak_rss_mb() * 1024 * 1024)
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/result/<folder>")
 def show_result(folder):
-    md_path = f"{app.static_folder}/results/{folder}/output.md"
-    try:
-        raw = open(md_path).read()
-        html = md_lib.markdown(raw, extensions=["fenced_code", "tables"])
-    except FileNotFoundError:
+    """The page pre-rendered when the run finished, gzipped when the client accepts it, with ETag/304 support"""
+    result_dir = safe_join(f"{app.static_folder}/results", folder)
+    md_path = result_dir and os.path.join(result_dir, "output.md")
+    if not md_path or not os.path.exists(md_path):
         flash("❌ Result not found.")
         return redirect(url_for("index"))
+    page = os.path.join(result_dir, REPORT_PAGE)
+    if not os.path.exists(page):
+        # published before pages were pre-rendered: render it once, now
+        with open(md_path, encoding="utf-8") as f:
+            write_report_page(result_dir, f.read())
 
-    return render_template("result.html", content=html)
+    if "gzip" in request.accept_encodings and os.path.exists(page + ".gz"):
+        response = send_file(page + ".gz", mimetype="text/html", conditional=True)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = send_file(page, mimetype="text/html", conditional=True)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    return response
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,59 @@
+"""
+Batch traffic counting (traffic_counter.count_traffic_multi, one scan for
+all queries) against one count_traffic scan per query, checking that every
+query gets exactly the rows a single run gives it.
+
+Besides random keyword sets, which hit every month, the queries include one
+whose keywords only appear in the first SPARSE_MONTHS months (so its latest
+month is not the corpus's) and one that matches nothing.
+Run from the project root:
+    python3 -m benchmarks.bench_batch_counts
+"""
+import random
+import string
+import time
+
+from algorithm.traffic_counter import count_traffic, count_traffic_multi
+from benchmarks.corpus import generate_corpus
+
+MONTHS = 12
+ROWS_PER_MONTH = 4000
+NUM_KEYWORDS = 200
+NUM_QUERIES = 20
+KEYWORDS_PER_QUERY = 10
+SPARSE_MONTHS = 2
+SPARSE_ROWS = 50
+SEED = 7
+
+
+def main():
+    rng = random.Random(SEED)
+    keywords = sorted({"".join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(NUM_KEYWORDS)})
+    df = generate_corpus(MONTHS * ROWS_PER_MONTH, keywords, seed=SEED, months=MONTHS)
+    months = sorted(set(zip(df["year"], df["month"])))
+    sparse = ["sparseword"]
+    for ym in months[:SPARSE_MONTHS]:
+        rows = df.index[(df["year"] == ym[0]) & (df["month"] == ym[1])][:SPARSE_ROWS]
+        df.loc[rows, "body"] += " sparseword sparseword"
+    keyword_sets = [rng.sample(keywords, KEYWORDS_PER_QUERY) for _ in range(NUM_QUERIES)]
+    keyword_sets += [sparse, ["nomatchword"]]
+    shards = [df[(df["year"] == y) & (df["month"] == m)] for y, m in months]
+
+    start = time.perf_counter()
+    singles = [count_traffic(shards, kws) for kws in keyword_sets]
+    t_single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    series, _ = count_traffic_multi(shards, keyword_sets)
+    t_multi = time.perf_counter() - start
+
+    for kws, single, rows in zip(keyword_sets, singles, series):
+        if single != rows:
+            raise RuntimeError(f"Batch and single counts disagree for {kws[:3]}...: {rows} != {single}")
+    print(f"{len(df)} rows, {len(shards)} shards, {len(keyword_sets)} queries (all match count_traffic)")
+    print(f"count_traffic per query: {t_single:.2f}s")
+    print(f"count_traffic_multi:     {t_multi:.2f}s ({t_single / t_multi:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Run several pipelines at once and check that they stay isolated: every run must
+publish its own folder whose report and plot match a serial run of the same query.
+
+Network-bound stages are replaced with offline fixtures (a synthetic corpus and
+ETF list, fixed keyword sets per query), so this runs without network access.
+Run from the project root:
+    python3 -m benchmarks.bench_concurrent_runs
+"""
+import json
+import os
+import random
+import string
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from algorithm import etf_selector, inference, scrape_etfs, scrape_reddit
+from benchmarks.corpus import generate_corpus
+
+NUM_QUERIES = 4
+CORPUS_ROWS = 96_000
+SEED = 11
+
+
+def install_fixtures(rng):
+    keyword_sets = {}
+    all_keywords = []
+    for i in range(NUM_QUERIES):
+        kws = sorted({"".join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(25)})
+        keyword_sets[f"query {i}"] = kws
+        all_keywords += kws
+    corpus = generate_corpus(CORPUS_ROWS, all_keywords, seed=SEED)
+    etfs = pd.DataFrame([{"Name": f"{kws[0]} fund", "Ticker": f"T{i}", "Sector": "", "Source_Page": ""}
+                         for i, kws in enumerate(keyword_sets.values())])
+
+    inference.expand_to_keywords = lambda phrases, num_keywords: keyword_sets[phrases[0]]
+    scrape_reddit.refresh_cache = lambda months, **kwargs: {(0, 0): len(corpus)}
+    scrape_reddit.partition_files = lambda cached, **kwargs: [corpus]
+    scrape_etfs.fetch_etfs = lambda: etfs
+    # the fixture keywords are random strings, tied to their fund by shared words alone
+    etf_selector.ETF_RANKER = "tfidf"
+    return list(keyword_sets)
+
+
+def run(query):
+    # every run must compute its own result, not reuse an earlier one from the result cache
+    return inference.run_inference(query, use_cache=False)
+
+
+def published(run_id):
+    result_dir = os.path.join(inference.RESULTS_DIR, run_id)
+    with open(os.path.join(result_dir, "spike_report.json"), encoding="utf-8") as f:
+        report = json.load(f)
+    with open(os.path.join(result_dir, "spike_plot.png"), "rb") as f:
+        plot = f.read()
+    with open(os.path.join(result_dir, "output.md"), encoding="utf-8") as f:
+        md = f.read()
+    report.pop("stage_seconds")
+    report.pop("plot_path")
+    return report, plot, md
+
+
+def main():
+    queries = install_fixtures(random.Random(SEED))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            start = time.perf_counter()
+            serial = {q: published(run(q)) for q in queries}
+            t_serial = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=NUM_QUERIES) as pool:
+                run_ids = dict(zip(queries, pool.map(run, queries)))
+            t_parallel = time.perf_counter() - start
+
+            if len(set(run_ids.values())) != len(queries):
+                raise RuntimeError("Concurrent runs shared a result folder")
+            for q, run_id in run_ids.items():
+                report, plot, md = published(run_id)
+                if report != serial[q][0] or plot != serial[q][1] or f"/static/results/{run_id}/spike_plot.png" not in md:
+                    raise RuntimeError(f"Run for {q!r} does not match its serial run")
+                if report["relevant_etfs"] != f"T{queries.index(q)}":
+                    raise RuntimeError(f"Run for {q!r} picked up another query's ETFs")
+        finally:
+            os.chdir(cwd)
+
+    print(f"{len(queries)} isolated runs verified")
+    print(f"serial:   {t_serial:.2f}s")
+    print(f"parallel: {t_parallel:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
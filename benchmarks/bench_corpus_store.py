@@ -0,0 +1,76 @@
+"""
+Disk size, load time and traffic-count time of one corpus in three formats:
+the legacy CSV export, the legacy month partitions (snappy Parquet with raw
+HTML bodies and string ids) and the compact store (corpus_store: stripped
+text, deduplicated ids, typed columns, zstd).
+
+The synthetic corpus (benchmarks.corpus) is given Hacker News-style markup
+first: escaped apostrophes, links and paragraph tags, plus DUPLICATE_SHARE of
+rows fetched twice, as overlapping fetches produce.
+Run from the project root:
+    python3 -m benchmarks.bench_corpus_store [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from algorithm import corpus_store, traffic_counter
+from benchmarks.corpus import ensure_corpus
+from benchmarks.fixtures import load_keyword_list
+
+ROWS = 200_000
+KEYWORD_LIST = "keywords_100"
+DUPLICATE_SHARE = 0.05
+LINK_SHARE = 0.2
+SEED = 7
+
+
+def hn_markup(df, rng):
+    """Raw posts as Algolia returns them: HTML-escaped text, links, some rows twice"""
+    bodies = df["body"].str.replace(" ", "&#x27;s ", n=1, regex=False)
+    links = rng.random(len(df)) < LINK_SHARE
+    bodies[links] = bodies[links] + ' <p><a href="https://example.com/item?id=1" rel="nofollow">' \
+                                    'https://example.com/item?id=1</a>'
+    raw = df.assign(body=bodies)
+    dupes = raw.sample(frac=DUPLICATE_SHARE, random_state=SEED)
+    return pd.concat([raw, dupes], ignore_index=True)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    keywords = load_keyword_list(KEYWORD_LIST)
+    raw = hn_markup(pd.read_parquet(ensure_corpus(rows, KEYWORD_LIST)), np.random.default_rng(SEED))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "hn_raw_posts.csv")
+        legacy_path = os.path.join(tmp, "legacy.parquet")
+        compact_path = os.path.join(tmp, "compact.parquet")
+        raw.to_csv(csv_path, index=False)
+        raw.to_parquet(legacy_path, index=False)
+        compact, t_ingest = timed(corpus_store.compact_posts, raw)
+        corpus_store.write_posts(compact, compact_path)
+
+        print(f"{len(raw)} raw rows, {len(compact)} after dedup; compacting took {t_ingest:.2f}s")
+        print(f"{'format':<10} {'size':>9} {'load':>8} {'count':>8} {'total':>8}")
+        base = None
+        for name, path in [("csv", csv_path), ("legacy", legacy_path), ("compact", compact_path)]:
+            size = os.path.getsize(path) / 2 ** 20
+            frame, t_load = timed(traffic_counter.load_posts_frame, path)
+            _, t_count = timed(traffic_counter.count_traffic, frame, keywords)
+            base = base or (size, t_load + t_count)
+            print(f"{name:<10} {size:>7.1f}MB {t_load:>7.2f}s {t_count:>7.2f}s {t_load + t_count:>7.2f}s"
+                  f"  ({base[0] / size:.1f}x smaller, {base[1] / (t_load + t_count):.1f}x faster than csv)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Per-query ETF ranking latency: refitting TF-IDF on every query (select_etfs)
+versus querying the precomputed ETFIndex.
+
+Run from the project root:
+    python3 -m benchmarks.bench_etf_selector
+"""
+import os
+import random
+import string
+import tempfile
+import time
+
+from algorithm.etf_selector import ETFIndex, select_etfs
+
+NUM_ETFS = 5000
+NUM_QUERIES = 50
+SEED = 5
+
+
+def make_universe(rng):
+    vocab = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(3000)]
+    sectors = [" ".join(rng.choices(vocab, k=2)) for _ in range(60)]
+    etfs = [{"ticker": f"E{i:04d}", "text": f"{' '.join(rng.choices(vocab, k=5))} ETF {rng.choice(sectors)}"}
+            for i in range(NUM_ETFS)]
+    queries = [" ".join(rng.choices(vocab, k=100)) for _ in range(NUM_QUERIES)]
+    return etfs, queries
+
+
+def main():
+    etfs, queries = make_universe(random.Random(SEED))
+
+    start = time.perf_counter()
+    refit = [select_etfs(q, etfs) for q in queries]
+    t_refit = (time.perf_counter() - start) / len(queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "etf_index.joblib")
+        start = time.perf_counter()
+        ETFIndex.build(etfs).save(path)
+        t_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = ETFIndex.load(path)
+        t_load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed = [index.query(q) for q in queries]
+        t_query = (time.perf_counter() - start) / len(queries)
+
+    overlap = sum(len(set(a) & set(b)) for a, b in zip(refit, indexed)) / sum(len(a) for a in refit)
+    print(f"{NUM_ETFS} ETFs, {NUM_QUERIES} queries")
+    print(f"refit per query:  {t_refit * 1000:.1f} ms")
+    print(f"index per query:  {t_query * 1000:.2f} ms ({t_refit / t_query:.0f}x)")
+    print(f"index build+save: {t_build * 1000:.0f} ms, load: {t_load * 1000:.0f} ms")
+    # the refit path also counts the query as a document when computing IDF
+    print(f"top-N overlap with refit: {overlap:.0%}")
+
+
+if __name__ == "__main__":
+    main()
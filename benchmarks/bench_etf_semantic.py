@@ -0,0 +1,98 @@
+"""
+Query latency of the embedding ETF ranker (etf_selector.ETFRanker) as the
+universe grows: exact float32 scoring, int8-quantized scoring and the
+inverted-file (k-means) index, plus the IVF's recall@10 against exact search.
+
+Vectors come from a stand-in encoder (topic centroids plus noise, 384
+dimensions like all-MiniLM-L6-v2), so this measures the index, not the
+model. When sentence-transformers is installed, the fixture ETF list is also
+ranked with the real model for a few queries that share no words with the
+funds they should find.
+Run from the project root:
+    python3 -m benchmarks.bench_etf_semantic
+"""
+import time
+import zlib
+
+import numpy as np
+
+from algorithm import etf_selector
+from algorithm.etf_selector import ETFIndex, ETFRanker, EmbeddingIndex, build_ivf
+from benchmarks.fixtures import load_etf_rows
+
+SIZES = [3000, 20000, 50000]
+DIM = 384
+TOPICS = 500
+NUM_QUERIES = 200
+TOP_N = 10
+SEED = 3
+SYNONYM_QUERIES = ["chip makers", "crypto", "green power", "weight loss drugs", "precious metals"]
+
+
+class StandInEncoder:
+    """Deterministic embeddings: the text's topic centroid plus per-text noise"""
+
+    def __init__(self, seed=SEED):
+        self.centers = np.random.default_rng(seed).standard_normal((TOPICS, DIM)).astype(np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, texts, **kwargs):
+        out = np.empty((len(texts), DIM), dtype=np.float32)
+        for i, text in enumerate(texts):
+            rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+            out[i] = self.centers[int(text.split()[1]) % TOPICS] + 0.8 * rng.standard_normal(DIM)
+        return out
+
+
+def timed_queries(ranker, queries):
+    start = time.perf_counter()
+    results = [ranker.query(text, TOP_N, query_vec=vec) for text, vec in queries]
+    return (time.perf_counter() - start) / len(queries) * 1000, results
+
+
+def main():
+    encoder = StandInEncoder()
+    rng = np.random.default_rng(SEED)
+    print(f"{'ETFs':>6} {'build':>8} {'float32':>9} {'int8':>9} {'ivf':>9} {'recall@10':>10}")
+    for n in SIZES:
+        etfs = [{"ticker": f"E{i:05d}", "text": f"Fund {rng.integers(TOPICS)} ETF {i}"} for i in range(n)]
+        topics = rng.integers(TOPICS, size=NUM_QUERIES)
+        queries = [(f"topic {t}", encoder.encode([f"Query {t} q{i}"])[0]) for i, t in enumerate(topics)]
+        tfidf = ETFIndex.build(etfs)
+
+        start = time.perf_counter()
+        built = EmbeddingIndex.build(etfs, encoder, "stand-in", quantize=False)
+        t_build = time.perf_counter() - start
+        quantized = EmbeddingIndex.build(etfs, encoder, "stand-in", quantize=True)
+        quantized.ivf = None
+        exact = EmbeddingIndex(built.vectors, None, built.texts, built.fingerprint, "stand-in")
+        ivf = EmbeddingIndex(built.vectors, None, built.texts, built.fingerprint, "stand-in",
+                             built.ivf or build_ivf(built.vectors))
+
+        # the stand-in ETF texts share no words with the queries, so these rank on embeddings alone
+        t_exact, want = timed_queries(ETFRanker(tfidf, exact), queries)
+        t_int8, _ = timed_queries(ETFRanker(tfidf, quantized), queries)
+        t_ivf, got = timed_queries(ETFRanker(tfidf, ivf), queries)
+        recall = np.mean([len(set(w) & set(g)) / len(w) for w, g in zip(want, got)])
+        print(f"{n:>6} {t_build:>7.2f}s {t_exact:>7.2f}ms {t_int8:>7.2f}ms {t_ivf:>7.2f}ms {recall:>10.1%}")
+
+    try:
+        from algorithm import keyword_expansion
+        model = keyword_expansion.get_model()
+    except Exception as e:
+        print(f"real-model check skipped ({type(e).__name__}: {e})")
+        return
+    etfs = etf_selector.etf_records(load_etf_rows())
+    names = {e["ticker"]: e["text"] for e in etfs}
+    ranker = ETFRanker(ETFIndex.build(etfs),
+                       EmbeddingIndex.build(etfs, model, keyword_expansion.MODEL_NAME, quantize=False))
+    for query in SYNONYM_QUERIES:
+        vec = keyword_expansion.query_embedding([query])
+        hybrid = ranker.query(query, 3, query_vec=vec)
+        print(f"{query!r}: tfidf={ranker.tfidf.query(query, 3)} hybrid={[names[t] for t in hybrid]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Many live viewers of one job through gunicorn, started with the Dockerfile's
+CMD (worker class, threads, timeout) on a local port, against the former
+--threads=4 setup without a stream cap.
+
+STREAMS viewers open /api/jobs/<id>/events for a running job while PROBES
+page and status requests are timed; then the job finishes and every
+accepted stream must end with its `done` event. Streams over
+MAX_EVENT_STREAMS are refused with a 503 (job.html then polls), so pages
+and the API keep answering however many viewers there are.
+
+The job is a row in a scratch job store, owned by this process, so the
+server follows it through the store the way it does for a job another
+worker runs. Needs gunicorn. Run from the project root:
+    python3 -m benchmarks.bench_event_streams
+"""
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from algorithm.jobs import SQLiteJobStore, process_id
+
+STREAMS = 80
+PROBES = 20
+PROBE_TIMEOUT = 2
+FORMER = {"--threads": "4", "MAX_EVENT_STREAMS": "100000"}
+
+
+def dockerfile_cmd():
+    with open("Dockerfile", encoding="utf-8") as f:
+        line = next(line for line in f if line.startswith("CMD"))
+    return json.loads(line[len("CMD"):])
+
+
+def start_server(work_dir, port, overrides):
+    args = [a for a in dockerfile_cmd()[1:] if not a.startswith("--bind")]
+    args = [f"{a.split('=')[0]}={overrides[a.split('=')[0]]}" if a.split("=")[0] in overrides else a
+            for a in args]
+    env = {k: v for k, v in os.environ.items() if k != "PRELOAD_MODEL"}
+    env.update(PYTHONPATH=os.getcwd(), **{k: v for k, v in overrides.items() if not k.startswith("--")})
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", f"--bind=127.0.0.1:{port}",
+                               f"--chdir={work_dir}", *args], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if get(port, "/", 1)[0] == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("gunicorn did not start")
+
+
+def get(port, path, timeout):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status, None
+    finally:
+        conn.close()
+
+
+def view(port, job_id, outcome):
+    """Follow the stream to its end: outcome = [status, got done]"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        conn.request("GET", f"/api/jobs/{job_id}/events")
+        resp = conn.getresponse()
+        outcome[0] = resp.status
+        if resp.status != 200:
+            resp.read()
+            return
+        for line in resp:
+            if line.startswith(b"event: done"):
+                outcome[1] = True
+                return
+    except OSError:
+        outcome[0] = outcome[0] or "error"
+    finally:
+        conn.close()
+
+
+def run(overrides):
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.makedirs(os.path.join(work_dir, "tmp"))
+        store = SQLiteJobStore(os.path.join(work_dir, "tmp", "jobs.sqlite3"))
+        now = time.time()
+        store.create({"id": "job", "query": "load test", "params": {}, "status": "running", "stage": None,
+                      "stages": [], "folder": None, "error": None, "created": now, "updated": now,
+                      "owner": process_id()})
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        server = start_server(work_dir, port, overrides)
+        try:
+            outcomes = [[None, False] for _ in range(STREAMS)]
+            viewers = [threading.Thread(target=view, args=(port, "job", o), daemon=True) for o in outcomes]
+            for t in viewers:
+                t.start()
+            deadline = time.time() + 10
+            while time.time() < deadline and sum(o[0] is not None for o in outcomes) < STREAMS:
+                time.sleep(0.1)
+
+            latencies, failed = [], 0
+            for i in range(PROBES):
+                start = time.perf_counter()
+                try:
+                    status, _ = get(port, "/" if i % 2 else "/api/jobs/job", PROBE_TIMEOUT)
+                    failed += status != 200
+                except OSError:
+                    failed += 1
+                latencies.append(time.perf_counter() - start)
+
+            store.update("job", status="done", folder="load-test")
+            start = time.perf_counter()
+            for t in viewers:
+                t.join(60)
+            ended = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+    accepted = sum(o[0] == 200 for o in outcomes)
+    refused = sum(o[0] == 503 for o in outcomes)
+    done = sum(o[1] for o in outcomes)
+    return accepted, refused, done, np.array(latencies) * 1000, failed, ended
+
+
+def main():
+    print(f"{STREAMS} viewers of one running job, {PROBES} page/status probes (timeout {PROBE_TIMEOUT}s)")
+    print(f"{'setup':<10} {'streams':>8} {'refused':>8} {'done':>5} {'probe p50':>10} {'probe max':>10} "
+          f"{'failed':>7} {'all ended':>10}")
+    for name, overrides in [("former", FORMER), ("Dockerfile", {})]:
+        accepted, refused, done, latencies, failed, ended = run(overrides)
+        print(f"{name:<10} {accepted:>8} {refused:>8} {done:>5} {np.percentile(latencies, 50):>8.1f}ms "
+              f"{latencies.max():>8.1f}ms {failed:>7} {ended:>9.1f}s")
+        if name == "Dockerfile" and (failed or done != accepted or accepted + refused != STREAMS):
+            raise RuntimeError("Streams blocked other requests or did not all end")
+
+
+if __name__ == "__main__":
+    main()
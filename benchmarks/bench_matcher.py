@@ -0,0 +1,61 @@
+"""
+Compare keyword matcher engines used by traffic_counter.
+
+Run from the project root:
+    python3 -m benchmarks.bench_matcher
+"""
+import random
+import string
+import time
+
+from algorithm.traffic_counter import build_matcher
+
+KEYWORD_COUNTS = [100, 500, 2000]
+NUM_BODIES = 500
+WORDS_PER_BODY = 150
+SEED = 42
+
+
+def make_keywords(rng, n):
+    kws = set()
+    while len(kws) < n:
+        words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+                 for _ in range(rng.randint(1, 3))]
+        kws.add(" ".join(words))
+    return sorted(kws)
+
+
+def make_bodies(rng, keywords):
+    vocab = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10)))
+             for _ in range(5000)]
+    bodies = []
+    for _ in range(NUM_BODIES):
+        words = rng.choices(vocab, k=WORDS_PER_BODY)
+        for _ in range(rng.randint(0, 4)):
+            words.insert(rng.randrange(len(words)), rng.choice(keywords).title())
+        bodies.append(" ".join(words) + ".")
+    return bodies
+
+
+def time_engine(engine, keywords, bodies):
+    matcher = build_matcher(keywords, engine)
+    start = time.perf_counter()
+    counts = [matcher.count(b) for b in bodies]
+    return time.perf_counter() - start, counts
+
+
+def main():
+    rng = random.Random(SEED)
+    print(f"{'keywords':>8} {'regex (s)':>10} {'trie (s)':>10} {'speedup':>8}")
+    for n in KEYWORD_COUNTS:
+        keywords = make_keywords(rng, n)
+        bodies = make_bodies(rng, keywords)
+        t_regex, c_regex = time_engine('regex', keywords, bodies)
+        t_trie, c_trie = time_engine('trie', keywords, bodies)
+        if c_regex != c_trie:
+            raise RuntimeError(f"Engines disagree at {n} keywords")
+        print(f"{n:>8} {t_regex:>10.3f} {t_trie:>10.3f} {t_regex / t_trie:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Fan-out of job progress events (events.Broker) to many live viewers.
+
+For each viewer count, one publisher emits NUM_EVENTS events at
+EVENT_INTERVAL while every viewer reads the channel on its own thread, the
+way /api/jobs/<id>/events streams do. One extra viewer sleeps SLOW_READ
+seconds per event, like a stalled client. Reports delivery latency, the
+events the stalled viewer had to skip, and memory allocated during the run,
+which should not grow with viewers.
+Run from the project root:
+    python3 -m benchmarks.bench_progress_stream
+"""
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+from algorithm.events import Broker
+
+VIEWERS = [1, 50, 200]
+NUM_EVENTS = 1000
+EVENT_INTERVAL = 0.001
+SLOW_READ = 0.05
+
+
+def view(broker, latencies, counts, delay=0.0):
+    """Read the channel to its end; counts = [ticks received, events skipped]"""
+    expected = 1
+    for event in broker.subscribe("job", keepalive=1):
+        if event is None:
+            continue
+        event_id, kind, data = event
+        counts[1] += event_id - expected
+        expected = event_id + 1
+        if kind == "tick":
+            latencies[counts[0]] = time.perf_counter() - data["sent"]
+            counts[0] += 1
+        time.sleep(delay)
+
+
+def run(viewers):
+    broker = Broker()
+    broker.open("job")
+    # allocated before tracing, so the peak covers the broker and the viewers' reads only
+    latencies = np.zeros((viewers + 1, NUM_EVENTS))
+    counts = [[0, 0] for _ in range(viewers + 1)]
+    threads = [threading.Thread(target=view, args=(broker, latencies[i], counts[i])) for i in range(viewers)]
+    threads.append(threading.Thread(target=view, args=(broker, latencies[-1], counts[-1], SLOW_READ)))
+    tracemalloc.start()
+    for t in threads:
+        t.start()
+    for i in range(NUM_EVENTS):
+        broker.publish("job", "tick", {"i": i, "sent": time.perf_counter()})
+        time.sleep(EVENT_INTERVAL)
+    broker.publish("job", "done", {})
+    for t in threads:
+        t.join()
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    fast = latencies[:-1] * 1000
+    delivered = min(received for received, _ in counts[:-1])
+    return delivered, np.percentile(fast, 50), np.percentile(fast, 99), counts[-1][1], peak
+
+
+def main():
+    print(f"{NUM_EVENTS} events, one every {EVENT_INTERVAL * 1000:.0f}ms, plus a viewer reading one per "
+          f"{SLOW_READ * 1000:.0f}ms")
+    print(f"{'viewers':>7} {'delivered':>9} {'p50':>8} {'p99':>8} {'slow skipped':>13} {'peak alloc':>11}")
+    for viewers in VIEWERS:
+        delivered, p50, p99, skipped, peak = run(viewers)
+        print(f"{viewers:>7} {delivered:>9} {p50:>6.2f}ms {p99:>6.2f}ms {skipped:>13} {peak:>9.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
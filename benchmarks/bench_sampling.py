@@ -0,0 +1,118 @@
+"""
+How evenly the HN fetcher's sample covers a month, and at what API cost:
+the stratified sampler (scrape_reddit.fetch_hn_month) with its default
+SAMPLE_BUCKET_SECONDS and with FINE_BUCKET_SECONDS, against the former scheme,
+which took page 0 (the newest HITS_PER_PAGE hits) of each of four
+week-long segments and then random.sample'd it without a seed.
+
+The month is simulated in-process: one post every POST_INTERVAL seconds
+(about HN's volume), served newest-first for any created_at_i window and
+page, like search_by_date. For each scheme it reports API calls, rows,
+days of the month with at least one sampled post, the worst gap between
+a day's share of the sample and its true share (1/days), and whether two
+draws give the same posts.
+Run from the project root:
+    python3 -m benchmarks.bench_sampling
+"""
+import math
+import random
+import re
+
+from algorithm import scrape_reddit
+from algorithm.scrape_reddit import HITS_PER_PAGE, TokenBucket, fetch_hn_month, month_bounds
+
+MONTH = (2025, 3)
+POST_INTERVAL = 8
+LEGACY_SEGMENTS = 4
+FINE_BUCKET_SECONDS = 6 * 3600
+SAMPLES_PER_WEEK = [250, 1000]
+
+
+class SimulatedMonth:
+    """A requests.Session stand-in answering search_by_date from a fixed post timeline"""
+
+    def __init__(self, start_ts, end_ts):
+        self.start_ts, self.end_ts = start_ts, end_ts
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        lo, hi = map(int, re.findall(r"\d+", params["numericFilters"]))
+        lo, hi = max(lo, self.start_ts), min(hi, self.end_ts)
+        first = math.ceil((lo - self.start_ts) / POST_INTERVAL)
+        last = math.ceil((hi - self.start_ts) / POST_INTERVAL) - 1
+        skip = params["page"] * params["hitsPerPage"]
+        newest = range(last - skip, max(first - 1, last - skip - params["hitsPerPage"]), -1)
+        hits = [{"objectID": str(i), "created_at_i": self.start_ts + i * POST_INTERVAL, "_tags": ["comment"],
+                 "comment_text": "post"} for i in newest]
+        return SimulatedResponse(hits)
+
+
+class SimulatedResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, hits):
+        self.hits = hits
+        self.content = b""
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"hits": self.hits}
+
+
+def legacy_sample(session, start_ts, end_ts, limiter, sample_per_week):
+    """The former fetch: newest HITS_PER_PAGE of each week-long segment, randomly subsampled"""
+    segment = math.ceil((end_ts - start_ts) / 86400 / LEGACY_SEGMENTS) * 86400
+    hits = []
+    for seg_start in range(start_ts, end_ts, segment):
+        params = {"tags": "(story,comment)", "hitsPerPage": HITS_PER_PAGE, "page": 0,
+                  "numericFilters": f"created_at_i>={seg_start},created_at_i<{min(seg_start + segment, end_ts)}"}
+        page = scrape_reddit.get_hits(session, limiter, params, "simulated")
+        hits += random.sample(page, min(len(page), sample_per_week))
+    return [(h["objectID"], h["created_at_i"]) for h in hits]
+
+
+def stratified_sample(session, start_ts, end_ts, limiter, sample_per_week,
+                      bucket_seconds=scrape_reddit.SAMPLE_BUCKET_SECONDS):
+    df = fetch_hn_month(*MONTH, session=session, limiter=limiter, api_url="simulated",
+                        sample_per_week=sample_per_week, bucket_seconds=bucket_seconds)
+    return list(zip(df["id"], df["created_at"]))
+
+
+def fine_sample(session, start_ts, end_ts, limiter, sample_per_week):
+    return stratified_sample(session, start_ts, end_ts, limiter, sample_per_week, FINE_BUCKET_SECONDS)
+
+
+def coverage(sample, start_ts, end_ts):
+    days = (end_ts - start_ts) // 86400
+    per_day = [0] * days
+    for _, ts in sample:
+        per_day[min((ts - start_ts) // 86400, days - 1)] += 1
+    worst = max(abs(n / len(sample) - 1 / days) for n in per_day)
+    return sum(1 for n in per_day if n), days, worst
+
+
+def main():
+    start_ts, end_ts = month_bounds(*MONTH)
+    limiter = TokenBucket(1e9, capacity=1e9)
+    print(f"{MONTH[0]}-{MONTH[1]:02d}, one post every {POST_INTERVAL}s")
+    print(f"{'sample':>6} {'scheme':<14} {'calls':>6} {'rows':>6} {'days hit':>9} {'worst day gap':>14} "
+          f"{'repeatable':>11}")
+    for sample_per_week in SAMPLES_PER_WEEK:
+        schemes = [("legacy", legacy_sample),
+                   (f"{scrape_reddit.SAMPLE_BUCKET_SECONDS // 3600}h buckets", stratified_sample),
+                   (f"{FINE_BUCKET_SECONDS // 3600}h buckets", fine_sample)]
+        for name, draw in schemes:
+            session = SimulatedMonth(start_ts, end_ts)
+            first = draw(session, start_ts, end_ts, limiter, sample_per_week)
+            second = draw(SimulatedMonth(start_ts, end_ts), start_ts, end_ts, limiter, sample_per_week)
+            hit, days, worst = coverage(first, start_ts, end_ts)
+            print(f"{sample_per_week:>6} {name:<14} {session.calls:>6} {len(first):>6} {hit:>5}/{days:<3} "
+                  f"{worst:>14.4f} {str(sorted(first) == sorted(second)):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Speedup of the sharded traffic scan (traffic_counter.scan_shards) at 1, 2,
+4, 8 and 16 worker processes over a month-partitioned cache, checking that
+every worker count gives bit-identical results to the serial scan.
+
+The cache is the one bench_streaming builds (ROWS_PER_MONTH synthetic posts
+per month, one partition per month = one shard). Speedup is bounded by the
+cores available (printed first) and by shards per worker: with 24 shards,
+16 workers run two uneven rounds.
+Run from the project root:
+    python3 -m benchmarks.bench_scan_workers [months]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+from algorithm import scrape_reddit, traffic_counter
+from benchmarks.bench_streaming import KEYWORD_LIST, SAMPLE_PER_WEEK, ensure_cache
+from benchmarks.fixtures import load_keyword_list
+
+MONTHS = 24
+WORKERS = [1, 2, 4, 8, 16]
+
+
+def identical(a, b):
+    """Same avg-per-day rows, months and keyword x month matrix, down to the bit"""
+    (rows_a, m_a, months_a), (rows_b, m_b, months_b) = a, b
+    return (rows_a == rows_b and months_a == months_b and np.array_equal(m_a.indptr, m_b.indptr)
+            and np.array_equal(m_a.indices, m_b.indices)
+            and m_a.data.tobytes() == m_b.data.tobytes())
+
+
+def main():
+    months = int(sys.argv[1]) if len(sys.argv) > 1 else MONTHS
+    keywords = load_keyword_list(KEYWORD_LIST)
+    cache_dir, cached = ensure_cache(months, keywords)
+    shards = scrape_reddit.partition_files(cached, cache_dir, SAMPLE_PER_WEEK)
+    print(f"{len(shards)} shards, {sum(cached.values())} rows, {os.cpu_count()} CPU(s)")
+    print(f"{'workers':>7} {'seconds':>8} {'speedup':>8} {'identical':>10}")
+    serial = base = None
+    for workers in WORKERS:
+        start = time.perf_counter()
+        result = traffic_counter.count_traffic_by_keyword(shards, keywords, workers=workers)
+        seconds = time.perf_counter() - start
+        serial = serial or result
+        base = base or seconds
+        print(f"{workers:>7} {seconds:>7.2f}s {base / seconds:>7.2f}x {str(identical(serial, result)):>10}")
+
+
+if __name__ == "__main__":
+    main()
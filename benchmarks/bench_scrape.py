@@ -0,0 +1,115 @@
+"""
+Throughput and rate-limit compliance of the HN fetcher against a local stub of
+the Algolia search_by_date endpoint, so no network access is needed.
+
+Run from the project root:
+    python3 -m benchmarks.bench_scrape
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from algorithm.scrape_reddit import (
+    TokenBucket,
+    fetch_hn_month,
+    fetch_hn_months,
+    make_session,
+    recent_months,
+)
+
+LATENCY = 0.05          # seconds the stub takes per response
+HITS_PER_WINDOW = 200   # hits the stub holds for any requested window
+THROTTLE_EVERY = 10     # every Nth request gets a 429
+RATE = 40.0             # requests per second allowed by the client limiter
+NUM_MONTHS = 3
+WORKERS = 8
+
+
+class StubAlgolia(BaseHTTPRequestHandler):
+    """Answers search_by_date with synthetic hits inside the requested window."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled connections are reused
+    lock = threading.Lock()
+    request_times = []
+
+    def do_GET(self):
+        with self.lock:
+            self.request_times.append(time.monotonic())
+            n = len(self.request_times)
+        time.sleep(LATENCY)
+        if n % THROTTLE_EVERY == 0:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        query = parse_qs(urlparse(self.path).query)
+        lo, hi = map(int, re.findall(r"\d+", query["numericFilters"][0]))
+        per_page, page = int(query["hitsPerPage"][0]), int(query["page"][0])
+        rng = random.Random(lo)
+        hits = [{
+            "objectID": str(lo + i),
+            "created_at_i": rng.randrange(lo, hi),
+            "_tags": ["comment"],
+            "comment_text": "stub body",
+        } for i in range(HITS_PER_WINDOW)][page * per_page:(page + 1) * per_page]
+        body = json.dumps({"hits": hits}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def max_in_window(times, window=1.0):
+    times = sorted(times)
+    best, lo = 0, 0
+    for hi, t in enumerate(times):
+        while t - times[lo] > window:
+            lo += 1
+        best = max(best, hi - lo + 1)
+    return best
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAlgolia)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_port}/api/v1/search_by_date"
+    months = recent_months(NUM_MONTHS)
+
+    try:
+        StubAlgolia.request_times.clear()
+        start = time.perf_counter()
+        session, limiter = make_session(1), TokenBucket(RATE)
+        serial_rows = sum(len(fetch_hn_month(y, m, session, limiter, api_url)) for y, m in months)
+        t_serial = time.perf_counter() - start
+
+        StubAlgolia.request_times.clear()
+        start = time.perf_counter()
+        results = fetch_hn_months(months, max_workers=WORKERS, rate=RATE, api_url=api_url)
+        t_pool = time.perf_counter() - start
+        pool_rows = sum(len(df) for df in results.values())
+        peak = max_in_window(StubAlgolia.request_times)
+    finally:
+        server.shutdown()
+
+    if serial_rows != pool_rows:
+        raise RuntimeError(f"Row counts differ: {serial_rows} vs {pool_rows}")
+    # a full bucket may burst WORKERS requests on top of the steady rate
+    if peak > RATE + WORKERS:
+        raise RuntimeError(f"Rate limit exceeded: {peak} requests in one second")
+    print(f"{len(months)} months, {pool_rows} rows")
+    print(f"serial:            {t_serial:.2f}s")
+    print(f"pooled x{WORKERS}:         {t_pool:.2f}s ({t_serial / t_pool:.1f}x)")
+    print(f"peak requests/sec: {peak} (limit {RATE:.0f} + burst {WORKERS})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+ETF universe refresh cost against saved-HTML-style fixtures: full html.parser
+parse vs the scoped lxml parse, and a cold fetch vs a 304 revalidation vs a
+fresh cache hit.
+
+Run from the project root:
+    python3 -m benchmarks.bench_scrape_etfs
+"""
+import random
+import re
+import string
+import tempfile
+import time
+
+from bs4 import BeautifulSoup
+
+from algorithm.scrape_etfs import ETFUniverse, parse_etf_page, pattern
+
+PAGES = ["https://example.test/etfs_us", "https://example.test/etfs_ca"]
+SECTIONS = 40
+ETFS_PER_SECTION = 60
+SEED = 3
+
+
+def make_page(rng):
+    """Markup shaped like a Wikipedia ETF list: chrome around an mw-parser-output body"""
+    chrome = "".join(f"<li><a href='/wiki/{i}'>nav {i}</a></li>" for i in range(2000))
+    body = []
+    for s in range(SECTIONS):
+        body.append(f"<h2>Sector {s}<span>[edit]</span></h2><ul>")
+        for _ in range(ETFS_PER_SECTION):
+            name = " ".join("".join(rng.choices(string.ascii_letters, k=7)) for _ in range(3))
+            ticker = "".join(rng.choices(string.ascii_uppercase, k=4))
+            body.append(f"<li><a href='#'>{name}</a> (NYSE Arca: {ticker})</li>")
+        body.append("</ul>")
+    return (f"<html><head><title>ETFs</title></head><body><div id='nav'><ul>{chrome}</ul></div>"
+            f"<div class='mw-parser-output'>{''.join(body)}</div>"
+            f"<div id='footer'><ul>{chrome}</ul></div></body></html>")
+
+
+def legacy_parse(html, url):
+    soup = BeautifulSoup(html, "html.parser")
+    content = soup.find('div', {'class': 'mw-parser-output'})
+    rows = []
+    for ul in content.find_all("ul"):
+        for li in ul.find_all("li", recursive=False):
+            match = re.search(pattern, li.get_text())
+            if match:
+                rows.append((match.group(1).strip(), match.group(2).strip()))
+    return rows
+
+
+class FixtureServer:
+    """fetch() stand-in that honours If-None-Match like Wikipedia does"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = 0
+
+    def fetch(self, url, headers):
+        self.calls += 1
+        etag = f'"{hash(self.pages[url])}"'
+        if headers.get("If-None-Match") == etag:
+            return 304, "", {"ETag": etag}
+        return 200, self.pages[url], {"ETag": etag}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    rng = random.Random(SEED)
+    html = {url: make_page(rng) for url in PAGES}
+
+    t_legacy, legacy = timed(legacy_parse, html[PAGES[0]], PAGES[0])
+    t_scoped, scoped = timed(parse_etf_page, html[PAGES[0]], PAGES[0])
+    if [(r["Name"], r["Ticker"]) for r in scoped] != legacy:
+        raise RuntimeError("Scoped parse disagrees with html.parser")
+
+    server = FixtureServer(html)
+    with tempfile.TemporaryDirectory() as tmp:
+        t_cold, cold = timed(ETFUniverse(PAGES, tmp, ttl=3600, fetch=server.fetch).get)
+        t_fresh, _ = timed(ETFUniverse(PAGES, tmp, ttl=3600, fetch=server.fetch).get)
+        calls_after_fresh = server.calls
+        t_304, revalidated = timed(ETFUniverse(PAGES, tmp, ttl=0, fetch=server.fetch).get)
+    if not cold.equals(revalidated) or calls_after_fresh != len(PAGES):
+        raise RuntimeError("Cache did not serve the expected data")
+
+    print(f"{len(legacy)} ETFs per page")
+    print(f"html.parser full page: {t_legacy * 1000:.0f} ms")
+    print(f"lxml scoped to body:   {t_scoped * 1000:.0f} ms ({t_legacy / t_scoped:.1f}x)")
+    print(f"cold refresh (200):    {t_cold * 1000:.0f} ms")
+    print(f"revalidate (304):      {t_304 * 1000:.1f} ms")
+    print(f"within TTL:            {t_fresh * 1000:.1f} ms (no requests)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Boot the web app under gunicorn and measure import-to-first-response latency
+and per-worker memory, for three ways of loading the embedding model:
+
+    lazy        model loaded on a worker's first keyword expansion
+    per-worker  PRELOAD_MODEL=1 without --preload: every worker loads its own copy
+    preload     PRELOAD_MODEL=1 with --preload: loaded once, shared copy-on-write
+
+Linux only (reads /proc). Run from the project root:
+    python3 -m benchmarks.bench_startup
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+WORKERS = 2
+BOOT_TIMEOUT = 300
+SETTLE_SECONDS = 2.0
+MODES = {
+    "lazy": ([], {}),
+    "per-worker": ([], {"PRELOAD_MODEL": "1"}),
+    "preload": (["--preload"], {"PRELOAD_MODEL": "1"}),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # the field after the parenthesised command name is state, then ppid
+        if int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+            found.append(int(entry))
+    return found
+
+
+def memory_mb(pid):
+    """(RSS, PSS) of a process in MB; PSS splits shared pages between their users"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0]) / 1024
+    return values["Rss"], values["Pss"]
+
+
+def wait_for_response(proc, url, deadline):
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {proc.returncode} before serving {url}")
+        try:
+            with urllib.request.urlopen(url, timeout=5) as resp:
+                if resp.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"No response from {url} within {BOOT_TIMEOUT}s")
+
+
+def settled_memory(master):
+    """Poll until the workers' memory stops growing, then return per-process (RSS, PSS)"""
+    last, stable_since = None, time.time()
+    while True:
+        workers = children(master)
+        if len(workers) == WORKERS:
+            total = sum(memory_mb(pid)[0] for pid in workers)
+            if last is None or abs(total - last) > 1:
+                last, stable_since = total, time.time()
+            elif time.time() - stable_since >= SETTLE_SECONDS:
+                return memory_mb(master), [memory_mb(pid) for pid in workers]
+        time.sleep(0.25)
+
+
+def measure(mode):
+    flags, env = MODES[mode]
+    port = free_port()
+    start = time.time()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", f"--bind=127.0.0.1:{port}", f"--workers={WORKERS}",
+         "--worker-class=gthread", "--threads=4", *flags, "app:app"],
+        env={**os.environ, **env}, stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_response(proc, f"http://127.0.0.1:{port}/", start + BOOT_TIMEOUT)
+        first_response = time.time() - start
+        master, workers = settled_memory(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return first_response, master, workers
+
+
+def main():
+    print(f"{'mode':<11} {'first resp':>10} {'worker RSS':>11} {'worker PSS':>11} {'total PSS':>10}")
+    for mode in MODES:
+        first_response, master, workers = measure(mode)
+        rss = sum(r for r, _ in workers) / len(workers)
+        pss = sum(p for _, p in workers) / len(workers)
+        total = master[1] + sum(p for _, p in workers)
+        print(f"{mode:<11} {first_response:>9.2f}s {rss:>9.0f}MB {pss:>9.0f}MB {total:>8.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Peak memory of counting traffic over the month-partitioned HN cache, streamed
+one partition at a time (what inference does) versus concatenated into one
+DataFrame first (the old, unbounded path), for growing windows.
+
+Each window is a synthetic cache (benchmarks.corpus) of ROWS_PER_MONTH rows
+per month under tmp/bench/stream-<months>/. Streaming peak should stay flat
+as the window grows; the concatenated peak grows with it.
+Run from the project root:
+    python3 -m benchmarks.bench_streaming
+"""
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+
+from algorithm import corpus_store, scrape_reddit, traffic_counter
+from benchmarks.corpus import CORPUS_DIR, END_MONTH, corpus_chunks, month_range
+from benchmarks.fixtures import load_keyword_list
+
+WINDOWS = [12, 24, 48]
+ROWS_PER_MONTH = 20_000
+SAMPLE_PER_WEEK = 1000
+KEYWORD_LIST = "keywords_100"
+
+
+def ensure_cache(months, keywords):
+    """A month-partitioned cache in the layout refresh_cache writes; returns (cache_dir, {(y, m): rows})"""
+    cache_dir = os.path.join(CORPUS_DIR, f"stream-{months}")
+    part_dir = scrape_reddit.sample_cache_dir(cache_dir, SAMPLE_PER_WEEK)
+    window = month_range(END_MONTH, months)
+    manifest = scrape_reddit.load_manifest(part_dir)
+    if len(manifest) != months:
+        os.makedirs(part_dir, exist_ok=True)
+        chunks = corpus_chunks(months * ROWS_PER_MONTH, keywords, months=months, chunk_rows=ROWS_PER_MONTH)
+        for (y, m), df in zip(window, chunks):
+            df = corpus_store.compact_posts(df)
+            scrape_reddit.write_partition(df, y, m, part_dir)
+            manifest[f"{y}-{m:02d}"] = {"rows": len(df), "high_water": int(df["created_at"].max()),
+                                        "closed": True, "fetched_at": 0, "format": corpus_store.FORMAT_VERSION}
+        scrape_reddit.save_manifest(manifest, part_dir)
+    return cache_dir, {ym: ROWS_PER_MONTH for ym in window}
+
+
+def streamed(cache_dir, cached, keywords):
+    posts = scrape_reddit.iter_posts(cached, cache_dir, SAMPLE_PER_WEEK, columns=traffic_counter.FRAME_COLUMNS)
+    return traffic_counter.count_traffic_by_keyword(posts, keywords)[0]
+
+
+def concatenated(cache_dir, cached, keywords):
+    posts = pd.concat(list(scrape_reddit.iter_posts(cached, cache_dir, SAMPLE_PER_WEEK)), ignore_index=True)
+    return traffic_counter.count_traffic_by_keyword(posts, keywords)[0]
+
+
+def peak(fn, *args):
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds = time.perf_counter() - start
+        return result, seconds, tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    keywords = load_keyword_list(KEYWORD_LIST)
+    print(f"{'months':>6} {'rows':>10} {'streamed':>18} {'concatenated':>18}")
+    for months in WINDOWS:
+        cache_dir, cached = ensure_cache(months, keywords)
+        rows_s, t_s, mb_s = peak(streamed, cache_dir, cached, keywords)
+        rows_c, t_c, mb_c = peak(concatenated, cache_dir, cached, keywords)
+        if rows_s != rows_c:
+            raise RuntimeError(f"Streamed counts differ from concatenated ones for {months} months")
+        print(f"{months:>6} {months * ROWS_PER_MONTH:>10} {mb_s:>9.1f}MB {t_s:>6.2f}s "
+              f"{mb_c:>9.1f}MB {t_c:>6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
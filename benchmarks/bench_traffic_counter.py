@@ -0,0 +1,57 @@
+"""
+Compare the CSV row loop with the columnar Parquet path in traffic_counter.
+
+Run from the project root:
+    python3 -m benchmarks.bench_traffic_counter
+"""
+import os
+import random
+import string
+import tempfile
+import time
+
+from algorithm.traffic_counter import (
+    build_matcher,
+    compute_weighted_counts_and_days,
+    compute_weighted_counts_and_days_frame,
+    load_posts_frame,
+)
+from benchmarks.corpus import generate_corpus
+
+MONTHS = 24
+ROWS_PER_MONTH = 4000
+NUM_KEYWORDS = 100
+SEED = 7
+
+
+def main():
+    rng = random.Random(SEED)
+    keywords = sorted({"".join(rng.choices(string.ascii_lowercase, k=6)) for _ in range(NUM_KEYWORDS)})
+    matcher = build_matcher(keywords)
+    df = generate_corpus(MONTHS * ROWS_PER_MONTH, keywords, seed=SEED, months=MONTHS)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "hn_raw_posts.csv")
+        parquet_path = os.path.join(tmp, "hn_raw_posts.parquet")
+        df.to_csv(csv_path, index=False)
+        df.to_parquet(parquet_path, index=False)
+
+        start = time.perf_counter()
+        csv_counts, csv_days = compute_weighted_counts_and_days(csv_path, matcher)
+        t_csv = time.perf_counter() - start
+
+        start = time.perf_counter()
+        frame = load_posts_frame(parquet_path)
+        pq_counts, pq_days = compute_weighted_counts_and_days_frame(frame, matcher)
+        t_pq = time.perf_counter() - start
+
+    if dict(csv_days) != dict(pq_days) or csv_counts.keys() != pq_counts.keys() or any(
+            abs(csv_counts[k] - pq_counts[k]) > 1e-9 for k in csv_counts):
+        raise RuntimeError("CSV and Parquet paths disagree")
+    print(f"{len(df)} rows, {len(keywords)} keywords")
+    print(f"csv loop:      {t_csv:.3f}s")
+    print(f"parquet frame: {t_pq:.3f}s ({t_csv / t_pq:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
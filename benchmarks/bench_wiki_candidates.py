@@ -0,0 +1,68 @@
+"""
+Serial vs pooled Wikipedia candidate harvesting, and a warm-cache rerun, against
+an in-process fixture backend that simulates network latency.
+
+Run from the project root:
+    python3 -m benchmarks.bench_wiki_candidates
+"""
+import tempfile
+import time
+
+from algorithm.disk_cache import TTLCache
+from algorithm.keyword_expansion import CachedBackend, get_wikipedia_candidates
+
+PHRASES = ["nvidia", "gpu", "semiconductor", "data center", "machine learning"]
+LATENCY = 0.1
+
+
+class FixtureBackend:
+    """Deterministic stand-in for WikipediaBackend."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, phrase, results):
+        self.calls += 1
+        time.sleep(LATENCY)
+        return [f"{phrase} ({i})" for i in range(results)]
+
+    def page(self, title):
+        self.calls += 1
+        time.sleep(LATENCY)
+        return {
+            "title": title,
+            "links": [f"{title} link {i}" for i in range(80)],
+            "categories": [f"Category:{title} category"],
+        }
+
+
+def timed(backend, max_workers):
+    start = time.perf_counter()
+    candidates = get_wikipedia_candidates(PHRASES, backend=backend, max_workers=max_workers)
+    return time.perf_counter() - start, sorted(candidates)
+
+
+def main():
+    t_serial, serial = timed(FixtureBackend(), 1)
+    t_pool, pooled = timed(FixtureBackend(), 8)
+    if serial != pooled:
+        raise RuntimeError("Serial and pooled harvesting disagree")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture = FixtureBackend()
+        cached = CachedBackend(fixture, TTLCache(tmp, ttl=3600))
+        t_cold, _ = timed(cached, 8)
+        cold_calls = fixture.calls
+        t_warm, warm = timed(cached, 8)
+    if warm != serial or fixture.calls != cold_calls:
+        raise RuntimeError("Warm cache did not serve every lookup")
+
+    print(f"{len(PHRASES)} phrases, {len(serial)} candidates")
+    print(f"serial:     {t_serial:.2f}s")
+    print(f"pooled x8:  {t_pool:.2f}s ({t_serial / t_pool:.1f}x)")
+    print(f"cold cache: {t_cold:.2f}s ({cold_calls} backend calls)")
+    print(f"warm cache: {t_warm:.3f}s (0 backend calls)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Synthetic Hacker News corpora in the hn_raw_posts schema (scrape_reddit.COLUMNS).
+
+Rows are spread evenly over MONTHS months ending at a fixed END_MONTH, so a
+given (rows, keyword list, seed) always produces the same data, whatever the
+date. Bodies are drawn from a fixed pool of filler texts with 0-3 keywords
+appended; comments are wrapped in <p> tags as Algolia returns them.
+Generation is chunked, so corpora up to 10M rows are written without
+holding them in memory.
+
+Write one to the benchmark cache from the project root:
+    python3 -m benchmarks.corpus 1000000
+"""
+import calendar
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from algorithm.scrape_reddit import COLUMNS
+from benchmarks.fixtures import load_keyword_list
+
+CORPUS_DIR = os.path.join("tmp", "bench")
+MONTHS = 24
+END_MONTH = (2025, 6)
+CHUNK_ROWS = 250_000
+VOCAB_SIZE = 20_000
+NUM_TEMPLATES = 20_000
+WORDS_PER_BODY = (20, 100)
+KEYWORD_HITS_P = [0.55, 0.2, 0.15, 0.1]  # probability of appending 0, 1, 2, 3 keywords
+STORY_SHARE = 0.25
+SEED = 0
+
+
+def month_range(end, months):
+    """The `months` (year, month) pairs ending at `end`, oldest first"""
+    year, month = end
+    out = []
+    for _ in range(months):
+        out.append((year, month))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return out[::-1]
+
+
+def _word_pool(rng):
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    lengths = rng.integers(2, 11, size=VOCAB_SIZE)
+    return ["".join(rng.choice(letters, size=n)) for n in lengths]
+
+
+def corpus_chunks(rows, keywords, seed=SEED, months=MONTHS, end=END_MONTH, chunk_rows=CHUNK_ROWS):
+    """Yield DataFrames of at most chunk_rows rows, oldest month first"""
+    rng = np.random.default_rng(seed)
+    vocab = np.array(_word_pool(rng), dtype=object)
+    lo, hi = WORDS_PER_BODY
+    templates = [" ".join(vocab[rng.integers(VOCAB_SIZE, size=rng.integers(lo, hi))])
+                 for _ in range(NUM_TEMPLATES)]
+    titles = [" ".join(vocab[rng.integers(VOCAB_SIZE, size=rng.integers(3, 10))]).capitalize()
+              for _ in range(1000)]
+    keywords = list(keywords)
+    month_list = month_range(end, months)
+    starts = np.array([calendar.timegm((y, m, 1, 0, 0, 0)) for y, m in month_list], dtype=np.int64)
+    lengths = np.array([calendar.monthrange(y, m)[1] * 86400 for y, m in month_list], dtype=np.int64)
+
+    for first in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - first)
+        month_idx = (np.arange(first, first + n) * months) // rows
+        created = starts[month_idx] + (rng.random(n) * lengths[month_idx]).astype(np.int64)
+        is_story = rng.random(n) < STORY_SHARE
+        template = rng.integers(NUM_TEMPLATES, size=n)
+        hits = rng.choice(len(KEYWORD_HITS_P), size=n, p=KEYWORD_HITS_P)
+        picks = rng.integers(len(keywords), size=(n, len(KEYWORD_HITS_P) - 1))
+        bodies = []
+        for story, t, h, p in zip(is_story, template, hits, picks):
+            body = templates[t]
+            if h:
+                body = " ".join([body, *(keywords[i] for i in p[:h])])
+            bodies.append(body if story else f"<p>{body}</p>")
+        title_idx = rng.integers(len(titles), size=n)
+        ids = np.arange(first, first + n)
+        yield pd.DataFrame({
+            "year": [month_list[i][0] for i in month_idx],
+            "month": [month_list[i][1] for i in month_idx],
+            "id": ids.astype(str),
+            "created_at": created,
+            "type": np.where(is_story, "story", "comment"),
+            "title": [titles[i] if s else "" for i, s in zip(title_idx, is_story)],
+            "url": [f"https://example.com/{i}" if s else "" for i, s in zip(ids, is_story)],
+            "body": bodies,
+            "score": rng.integers(0, 500, size=n),
+            "num_comments": np.where(is_story, rng.integers(0, 300, size=n), 0),
+        }, columns=COLUMNS)
+
+
+def generate_corpus(rows, keywords, seed=SEED, **kwargs):
+    """The whole corpus as one DataFrame (for sizes that fit in memory)"""
+    return pd.concat(list(corpus_chunks(rows, keywords, seed, **kwargs)), ignore_index=True)
+
+
+def corpus_path(rows, keyword_list, seed=SEED):
+    return os.path.join(CORPUS_DIR, f"corpus_{rows}_{keyword_list}_s{seed}.parquet")
+
+
+def ensure_corpus(rows, keyword_list="keywords_100", seed=SEED):
+    """Path of the cached Parquet corpus, writing it chunk by chunk on first use"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = corpus_path(rows, keyword_list, seed)
+    if os.path.exists(path):
+        return path
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    writer = None
+    try:
+        for chunk in corpus_chunks(rows, load_keyword_list(keyword_list), seed):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(ensure_corpus(rows))
+
+
+if __name__ == "__main__":
+    main()
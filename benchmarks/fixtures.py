@@ -0,0 +1,99 @@
+"""
+Offline fixtures for the benchmark suite: fixed keyword lists and a saved ETF
+list, so no benchmark touches Wikipedia or Algolia.
+
+The files in benchmarks/fixtures/ are committed; this module only documents
+how they were made. Regenerate (deterministically) from the project root:
+    python3 -m benchmarks.fixtures
+"""
+import csv
+import os
+import random
+import string
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+KEYWORD_LISTS = {"keywords_100": 100, "keywords_1000": 1000}
+NUM_ETFS = 3000
+SEED = 2024
+
+# Real words, so ETF names and keywords share vocabulary the way live data does
+THEMES = [
+    "artificial intelligence", "semiconductor", "cloud computing", "cybersecurity", "robotics",
+    "clean energy", "solar", "wind", "uranium", "lithium", "battery", "electric vehicle",
+    "biotech", "genomics", "healthcare", "pharmaceutical", "medical devices", "fintech",
+    "blockchain", "bitcoin", "payments", "banking", "insurance", "real estate", "infrastructure",
+    "water", "agriculture", "gold", "silver", "copper", "oil", "natural gas", "aerospace",
+    "defense", "space", "gaming", "esports", "streaming", "social media", "internet",
+    "software", "data center", "5g", "quantum computing", "nanotech", "cannabis", "retail",
+    "consumer staples", "utilities", "transportation", "shipping", "airlines", "travel",
+    "dividend", "value", "growth", "momentum", "low volatility", "small cap", "mid cap",
+    "emerging markets", "china", "india", "japan", "europe", "canada", "treasury", "bond",
+]
+ISSUERS = ["iShares", "Vanguard", "SPDR", "Invesco", "Global X", "First Trust", "ARK",
+           "VanEck", "Schwab", "WisdomTree", "Horizons", "BMO", "Direxion", "ProShares"]
+SECTORS = ["Technology", "Energy", "Health Care", "Financials", "Materials", "Industrials",
+           "Consumer", "Real Estate", "Utilities", "Fixed Income", "Broad Market", ""]
+SOURCE_PAGES = [
+    "https://en.wikipedia.org/wiki/List_of_American_exchange-traded_funds",
+    "https://en.wikipedia.org/wiki/List_of_Canadian_exchange-traded_funds",
+]
+
+
+def make_keywords(rng, n):
+    """Half real theme phrases and their words, half pseudo-words of 1-3 tokens"""
+    real = list(dict.fromkeys(THEMES + sorted(w for t in THEMES for w in t.split())))
+    kws = real[:n // 2]
+    seen = set(kws)
+    while len(kws) < n:
+        kw = " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+                      for _ in range(rng.randint(1, 3)))
+        if kw not in seen:
+            seen.add(kw)
+            kws.append(kw)
+    return kws
+
+
+def make_etfs(rng, n):
+    tickers = set()
+    rows = []
+    while len(rows) < n:
+        ticker = "".join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 4)))
+        if ticker in tickers:
+            continue
+        tickers.add(ticker)
+        themes = rng.sample(THEMES, rng.randint(1, 2))
+        name = f"{rng.choice(ISSUERS)} {' & '.join(t.title() for t in themes)} ETF"
+        rows.append({"Name": name, "Ticker": ticker, "Sector": rng.choice(SECTORS),
+                     "Source_Page": rng.choice(SOURCE_PAGES)})
+    return rows
+
+
+def fixture_path(name):
+    return os.path.join(FIXTURES_DIR, name)
+
+
+def load_keyword_list(name):
+    with open(fixture_path(f"{name}.txt"), encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def load_etf_rows():
+    with open(fixture_path("etfs.csv"), encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def main():
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for name, n in KEYWORD_LISTS.items():
+        keywords = make_keywords(random.Random(f"{SEED}-{name}"), n)
+        with open(fixture_path(f"{name}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(keywords) + "\n")
+    with open(fixture_path("etfs.csv"), "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["Name", "Ticker", "Sector", "Source_Page"])
+        writer.writeheader()
+        writer.writerows(make_etfs(random.Random(SEED), NUM_ETFS))
+    print(f"fixtures written to {FIXTURES_DIR}")
+
+
+if __name__ == "__main__":
+    main()
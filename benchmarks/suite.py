@@ -0,0 +1,196 @@
+"""
+Reproducible benchmark suite over synthetic corpora and offline fixtures.
+
+Every case is timed (best and median of --repeats runs) and then run once
+more under tracemalloc for its peak Python/NumPy allocation. Results go to
+a JSON file stamped with the git commit, so runs can be compared across commits.
+
+Run from the project root:
+    python3 -m benchmarks.suite
+    python3 -m benchmarks.suite --rows 10000 1000000 10000000 --no-memory
+    python3 -m benchmarks.suite --compare tmp/bench/results-<old>.json tmp/bench/results-<new>.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from algorithm import etf_selector, spike_detector, traffic_counter
+from benchmarks.corpus import CORPUS_DIR, ensure_corpus
+from benchmarks.fixtures import load_etf_rows, load_keyword_list
+
+ROWS = [10_000, 100_000]
+KEYWORD_LIST = "keywords_100"
+REPEATS = 3
+SPIKE_SERIES = 10_000
+SPIKE_MONTHS = 24
+ETF_QUERIES = 100
+RANK_CANDIDATES = 2000
+SEED = 0
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True)
+        return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(fn, repeats, memory=True):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    result = {"seconds_min": round(min(times), 4), "seconds_median": round(statistics.median(times), 4),
+              "repeats": repeats}
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            result["peak_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def traffic_cases(rows_list, keywords):
+    for rows in rows_list:
+        path = ensure_corpus(rows, KEYWORD_LIST, SEED)
+        posts = traffic_counter.load_posts_frame(path)
+        params = {"rows": rows, "keywords": len(keywords)}
+        yield "traffic_counter.load_posts_frame", params, lambda: traffic_counter.load_posts_frame(path)
+        yield "traffic_counter.count_traffic", params, lambda: traffic_counter.count_traffic(posts, keywords)
+        yield ("traffic_counter.count_traffic_by_keyword", params,
+               lambda: traffic_counter.count_traffic_by_keyword(posts, keywords))
+
+
+def spike_cases():
+    rng = np.random.default_rng(SEED)
+    rates = rng.gamma(4.0, 1.0, size=(SPIKE_SERIES, SPIKE_MONTHS))
+    params = {"series": SPIKE_SERIES, "months": SPIKE_MONTHS}
+    yield "spike_detector.detect_spikes_batch", params, lambda: spike_detector.detect_spikes_batch(rates)
+    single = rates[:1000]
+    yield ("spike_detector.detect_spike", {"series": len(single), "months": SPIKE_MONTHS},
+           lambda: [spike_detector.detect_spike(list(r), spike_detector.BETA) for r in single])
+
+
+def etf_cases(keywords):
+    etfs = etf_selector.etf_records(load_etf_rows())
+    rng = np.random.default_rng(SEED)
+    queries = [" ".join(keywords[i] for i in rng.choice(len(keywords), 20, replace=False))
+               for _ in range(ETF_QUERIES)]
+    index = etf_selector.ETFIndex.build(etfs)
+    params = {"etfs": len(etfs)}
+    yield "etf_selector.ETFIndex.build", params, lambda: etf_selector.ETFIndex.build(etfs)
+    yield ("etf_selector.ETFIndex.query", dict(params, queries=len(queries)),
+           lambda: [index.query(q) for q in queries])
+    yield ("etf_selector.select_etfs", dict(params, queries=1),
+           lambda: etf_selector.select_etfs(queries[0], etfs))
+
+
+def ranking_cases(keywords):
+    """Embedding ranking from expand_to_keywords; needs the real sentence-transformers model"""
+    try:
+        from algorithm import keyword_expansion
+        from algorithm.embedding_cache import EmbeddingCache
+        model = keyword_expansion.get_model()
+    except Exception as e:
+        yield "keyword_expansion.rank_candidates", {"skipped": f"{type(e).__name__}: {e}"}, None
+        return
+    rng = np.random.default_rng(SEED)
+    pool = list(keywords) + [f"{a} {b}" for a, b in rng.choice(keywords, size=(RANK_CANDIDATES, 2))]
+    candidates = list(dict.fromkeys(pool))[:RANK_CANDIDATES]
+    phrases = list(keywords[:3])
+    params = {"candidates": len(candidates)}
+
+    def cold():
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = EmbeddingCache(model, keyword_expansion.MODEL_NAME, cache_dir=tmp)
+            keyword_expansion.rank_candidates(phrases, candidates, 100, cache)
+
+    warm_dir = tempfile.mkdtemp()
+    warm_cache = EmbeddingCache(model, keyword_expansion.MODEL_NAME, cache_dir=warm_dir)
+    keyword_expansion.rank_candidates(phrases, candidates, 100, warm_cache)
+    yield "keyword_expansion.rank_candidates[cold]", params, cold
+    yield ("keyword_expansion.rank_candidates[warm]", params,
+           lambda: keyword_expansion.rank_candidates(phrases, candidates, 100, warm_cache))
+
+
+def run_suite(rows_list, repeats, memory):
+    keywords = load_keyword_list(KEYWORD_LIST)
+    results = []
+    groups = [traffic_cases(rows_list, keywords), spike_cases(), etf_cases(keywords), ranking_cases(keywords)]
+    for cases in groups:
+        for name, params, fn in cases:
+            if fn is None:
+                entry = {"name": name, "params": params}
+                print(f"{name:<45} skipped ({params['skipped']})")
+            else:
+                entry = {"name": name, "params": params, **measure(fn, repeats, memory)}
+                mem = f"{entry['peak_alloc_mb']:>9.1f}MB" if memory else ""
+                print(f"{name:<45} {json.dumps(params):<32} {entry['seconds_min']:>9.4f}s {mem}")
+            results.append(entry)
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "results": results,
+    }
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    key = lambda r: (r["name"], json.dumps(r["params"], sort_keys=True))
+    before = {key(r): r for r in old["results"] if "seconds_min" in r}
+    print(f"{old['commit']} -> {new['commit']}")
+    for r in new["results"]:
+        prev = before.get(key(r))
+        if prev is None or "seconds_min" not in r:
+            continue
+        ratio = prev["seconds_min"] / r["seconds_min"] if r["seconds_min"] else float("inf")
+        print(f"{r['name']:<45} {json.dumps(r['params']):<32} "
+              f"{prev['seconds_min']:>9.4f}s -> {r['seconds_min']:>9.4f}s  {ratio:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS, help="corpus sizes (10k to 10M)")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--out", help="results file (default tmp/bench/results-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run_suite(args.rows, args.repeats, not args.no_memory)
+    out = args.out or os.path.join(CORPUS_DIR, f"results-{report['commit']}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {out}")
+
+
+if __name__ == "__main__":
+    main()